@@ -0,0 +1,132 @@
+from threading import Condition
+from functools import wraps
+from flask import Response
+import os
+
+from logger import logger
+
+
+# Cada rota pertence a uma classe, com um limite de requisições em execução
+# ao mesmo tempo (0 = sem limite) e uma fila limitada de requisições esperando
+# por uma vaga. Com a fila cheia, ou esgotada a espera, a rota retorna 503 com
+# Retry-After, sem ocupar o worker e o banco. Os limites valem por processo e
+# devem ser menores que as threads de cada worker para que sobrem threads para
+# as outras classes. Variáveis: ADMISSAO_LIMITE_<CLASSE> e ADMISSAO_FILA_<CLASSE>
+LIMITES_PADRAO = {
+    # busca de um item (GET /usuario, GET /livro, GET /livros/busca) e páginas
+    # pequenas das listagens
+    "leitura": (0, 0),
+    # listagens completas, transmitidas ou com páginas grandes (GET /usuarios,
+    # GET /livros, GET /livros/disponibilidade)
+    "listagem": (2, 4),
+    # escrita de um item
+    "escrita": (0, 0),
+    # escritas em lote e remoções de todos os itens
+    "lote": (1, 2),
+}
+
+# segundos que uma requisição espera na fila e valor do Retry-After
+espera_admissao = float(os.environ.get("ADMISSAO_ESPERA", "5"))
+retry_after = os.environ.get("ADMISSAO_RETRY_AFTER", "1")
+# maior limit de uma página de listagem admitida como leitura
+pagina_leitura = int(os.environ.get("ADMISSAO_PAGINA_LEITURA", "100"))
+
+
+class ClasseDeRota:
+    """ Limita as requisições em execução de uma classe de rotas, mantendo
+        uma fila limitada de requisições à espera de uma vaga
+    """
+
+    def __init__(self, nome: str, limite: int, fila: int, espera: float = espera_admissao):
+        self.nome = nome
+        self.limite = limite
+        self.fila = fila
+        self.espera = espera
+        self.condicao = Condition()
+        self.ativas = 0
+        self.esperando = 0
+        self.rejeitadas = 0
+
+    def entra(self) -> bool:
+        """ Ocupa uma vaga, esperando na fila se necessário. Retorna False se
+            a requisição foi rejeitada
+        """
+        with self.condicao:
+            if self.limite <= 0 or self.ativas < self.limite:
+                self.ativas += 1
+                return True
+            if self.esperando >= self.fila:
+                self.rejeitadas += 1
+                return False
+            self.esperando += 1
+            try:
+                admitida = self.condicao.wait_for(lambda: self.ativas < self.limite, self.espera)
+            finally:
+                self.esperando -= 1
+            if not admitida:
+                self.rejeitadas += 1
+                return False
+            self.ativas += 1
+            return True
+
+    def sai(self):
+        """ Libera a vaga ocupada por entra()
+        """
+        with self.condicao:
+            self.ativas -= 1
+            self.condicao.notify()
+
+    def estatisticas(self):
+        with self.condicao:
+            return {"ativas": self.ativas, "esperando": self.esperando, "rejeitadas": self.rejeitadas}
+
+
+classes_de_rota = {
+    nome: ClasseDeRota(nome,
+                       int(os.environ.get("ADMISSAO_LIMITE_%s" % nome.upper(), limite)),
+                       int(os.environ.get("ADMISSAO_FILA_%s" % nome.upper(), fila)))
+    for nome, (limite, fila) in LIMITES_PADRAO.items()
+}
+
+
+def classe_listagem(query, **kwargs) -> str:
+    """ Retorna a classe de uma requisição de listagem: as páginas de até
+        pagina_leitura itens custam o mesmo que a busca de um item e são
+        leituras; as listagens sem limit, transmitidas ou com páginas
+        maiores ocupam as vagas da classe listagem
+    """
+    if getattr(query, "stream", False) or not 0 < (query.limit or 0) <= pagina_leitura:
+        return "listagem"
+    return "leitura"
+
+
+def admissao(nome):
+    """ Aplica o limite da classe de rotas à rota decorada
+
+    nome pode ser uma função que recebe os parâmetros da rota e retorna a
+    classe de cada requisição. Respostas transmitidas aos poucos mantêm a vaga
+    até o fim do envio.
+    """
+
+    def decorador(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            classe = classes_de_rota[nome(**kwargs) if callable(nome) else nome]
+            if not classe.entra():
+                logger.warning("Requisição rejeitada em %s(), limite da classe %s atingido",
+                               func.__name__, classe.nome)
+                return {"mensagem": "Servidor ocupado, tente novamente"}, 503, {"Retry-After": retry_after}
+            liberar = True
+            try:
+                resultado = func(*args, **kwargs)
+                if isinstance(resultado, Response) and resultado.is_streamed:
+                    resultado.call_on_close(classe.sai)
+                    liberar = False
+                return resultado
+            finally:
+                if liberar:
+                    classe.sai()
+
+        return wrapper
+
+    return decorador
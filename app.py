@@ -1,89 +1,229 @@
-from flask_openapi3 import OpenAPI, Info, Tag
-from flask import redirect
+from flask_openapi3 import OpenAPI, APIBlueprint, Info, Tag
+from flask import g, redirect, request, Response, stream_with_context
+from werkzeug.http import quote_etag
 from urllib.parse import unquote
+from functools import partial, wraps
+import zlib
 
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError, OperationalError
 
-from model import Session, Usuario, Livro
+from model import Session, engine, init_db, Usuario, Livro, LivroRemovido, UsuarioRemovido, \
+                  incrementa_versao, versao_tabela
+from model.busca import busca_livros_ids
+from model.alteracoes import filtra_remocoes
+from model import consultas
 from logger import logger
+import logging
+from retry import com_retry, banco_ocupado, repete_se_ocupado
+from escrita import executa_escrita
+from admissao import admissao, classe_listagem
+from cache import cache_usuarios, cache_livros, AUSENTE
+from metrics import instrumenta_app, instrumenta_engine, exporta_metricas
+from serializacao import configura_json
+from compressao import configura_compressao
 from schemas import *
 from flask_cors import CORS
 
 info = Info(title="Minha API", version="1.0.0")
-app = OpenAPI(__name__, info=info)
-CORS(app)
+# as rotas são registradas no blueprint e adicionadas à aplicação pela create_app
+api = APIBlueprint("api", __name__)
 
 # definindo tags
 usuario_tag = Tag(name="Usuário", description="Adição, visualização e remoção de usuários na base")
 livro_tag = Tag(name="Livro", description="Adição, visualização e remoção de livros na base")
+cache_tag = Tag(name="Cache", description="Visualização dos contadores dos caches de consulta")
+metricas_tag = Tag(name="Métricas", description="Métricas de latência e de consultas no formato do Prometheus")
 
 
-@app.post('/usuario', tags=[usuario_tag],
-          responses={"200": UsuarioViewSchema, "409": ErrorSchema, "400": ErrorSchema})
-def add_usuario(form: UsuarioSchema):
-    """Adiciona um novo Usuario à base de dados
+def create_app(config: dict = None):
+    """Cria a aplicação com as rotas da API
 
-    Retorna uma representação dos usuários.
+    Por padrão também cria o banco e aplica as migrações (init_db). Com
+    {"INIT_DB": False} a aplicação é criada sem acessar o banco, por exemplo
+    para gerar a documentação OpenAPI ou quando o init_db já foi executado.
+    """
+    app = OpenAPI(__name__, info=info)
+    app.config.update(config or {})
+    # gera o JSON das respostas com o orjson, se estiver instalado
+    configura_json(app)
+    CORS(app)
+    # mede a latência e as consultas SQL de cada rota, expostas em /metrics
+    instrumenta_app(app)
+    instrumenta_engine(engine)
+    # comprime as respostas com o algoritmo aceito pelo cliente (Accept-Encoding)
+    configura_compressao(app)
+    app.teardown_appcontext(remove_session)
+    app.register_api(api)
+
+    if app.config.get("INIT_DB", True):
+        init_db()
+    return app
+
+
+def remove_session(exception=None):
+    """Fecha a seção do banco usada pela requisição, devolvendo a conexão ao pool"""
+    Session.remove()
+
+
+def transmite_listagem(chave: str, consulta, apresenta, headers: dict = None):
+    """Envia a listagem em JSON aos poucos, lendo os itens do banco em lotes
+
+    O teardown da requisição roda antes do envio começar, então a consulta é
+    executada na seção ativa durante o envio, liberada ao final da resposta.
+    """
+    def gera():
+        itens = Session().execute(consulta.execution_options(yield_per=1000))
+        yield from gera_listagem_json(chave, itens, apresenta)
+
+    return Response(stream_with_context(gera()), mimetype="application/json", headers=headers)
+
+
+def etag_listagem(session, tabela: str):
+    """Retorna o ETag (fraco) da listagem de uma tabela, formado pela versão da
+    tabela e pelos parâmetros da requisição, e se o cliente já possui essa versão
+    """
+    etag = "%s-%d-%08x" % (tabela, versao_tabela(session, tabela), zlib.crc32(request.query_string))
+    return quote_etag(etag, weak=True), request.if_none_match.contains_weak(etag)
+
+
+def condicional(tabela: str):
+    """Responde 304 às listagens que o cliente já possui antes da admissão, sem
+    ocupar uma vaga da classe listagem com uma consulta de uma linha. O ETag fica
+    em g.etag para a rota, ou None nas listagens com since, que mudam com a
+    passagem do tempo sem mudar a versão da tabela e por isso não usam ETag
     """
+    def decorador(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            g.etag = None
+            if getattr(kwargs.get("query"), "since", None) is None:
+                session = Session()
+                etag, nao_modificado = etag_listagem(session, tabela)
+                # encerra a transação de leitura antes de esperar na fila da admissão
+                session.close()
+                if nao_modificado:
+                    return Response(status=304, headers={"ETag": etag})
+                g.etag = etag
+            return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorador
+
+
+def insere_usuario(session, form: UsuarioSchema):
+    """Adiciona o usuário à seção e retorna a sua representação"""
     usuario = Usuario(
         nome=form.nome,
         idade=form.idade)
-    #logger.debug(f"Adicionando o usuário de nome: '{usuario.nome}'")
+    session.add(usuario)
+    session.flush()
+    return apresenta_usuario(usuario)
+
+
+@api.post('/usuario', tags=[usuario_tag],
+          responses={"200": UsuarioViewSchema, "409": ErrorSchema, "400": ErrorSchema, "503": ErrorSchema})
+@admissao("escrita")
+@com_retry
+def add_usuario(form: UsuarioSchema):
+    """Adiciona um novo Usuario à base de dados
+
+    Retorna uma representação dos usuários.
+    """
+    #logger.debug("Adicionando o usuário de nome: '%s'", form.nome)
     try:
-        # criando conexão com a base
-        session = Session()
-        # adicionando usuário
-        session.add(usuario)
-        # efetivando o comando de adição de novo item na tabela
-        session.commit()        
-        #logger.debug(f"Adicionado usuário de nome: '{usuario.nome}'")
-        return apresenta_usuario(usuario), 200
+        # adicionando usuário e efetivando o comando de adição de novo item na
+        # tabela, junto com outras requisições se a escrita em grupo estiver ativa
+        resultado = executa_escrita("usuario", insere_usuario, form)
+        cache_usuarios.invalida(form.nome)
+        #logger.debug("Adicionado usuário de nome: '%s'", form.nome)
+        return resultado, 200
 
     except IntegrityError as e:
         # como a duplicidade do nome é a provável razão do IntegrityError
         error_msg = "Usuario de mesmo nome já salvo na base :/"
-        logger.warning(f"Erro ao adicionar usuário '{usuario.nome}', {error_msg}")
+        logger.warning("Erro ao adicionar usuário '%s', %s", form.nome, error_msg)
         return {"mensagem": error_msg}, 409
 
     except Exception as e:
+        if banco_ocupado(e): raise
         # caso um erro fora do previsto
         error_msg = "Não foi possível salvar novo item :/"
-        logger.warning(f"Erro ao adicionar usuário '{usuario.nome}', {error_msg}")
+        logger.warning("Erro ao adicionar usuário '%s', %s", form.nome, error_msg)
         return {"mensagem": error_msg}, 400
 
 
-@app.get('/usuarios', tags=[usuario_tag],
-         responses={"200": ListagemUsuariosSchema, "404": ErrorSchema})
-def get_usuarios():
+@api.get('/usuarios', tags=[usuario_tag],
+         responses={"200": ListagemUsuariosSchema, "400": ErrorSchema, "404": ErrorSchema, "503": ErrorSchema})
+@condicional("usuario")
+@admissao(classe_listagem)
+def get_usuarios(query: ListagemBuscaSchema):
     """Faz a busca por todos os Usuarios cadastrados
 
+    Aceita paginação por limit e after_id, stream=true para enviar a listagem
+    completa aos poucos, sem carregá-la toda em memória, e fields para escolher
+    os campos de cada usuário (nome, idade). Com since, retorna apenas os
+    usuários inseridos ou alterados a partir dessa data e os nomes dos removidos,
+    paginados por limit.
+
     Retorna uma representação da listagem de usuários.
     """
-    logger.debug(f"Coletando usuários ")
+    logger.debug("Coletando usuários ")
+    try:
+        campos = valida_listagem(query, CAMPOS_LISTAGEM_USUARIO)
+    except ValueError as e:
+        logger.warning("Erro ao listar usuários, %s", e)
+        return {"mensagem": str(e)}, 400
     # criando conexão com a base
     session = Session()
-    # fazendo a busca
-    usuarios = session.query(Usuario).all()
-
-    if not usuarios:
+    # o ETag calculado por condicional(), exceto nas listagens com since
+    headers = {"ETag": g.etag} if g.etag else {}
+    # fazendo a busca só das colunas pedidas, sem instanciar os usuários
+    consulta = consultas.consulta_listagem(Usuario, consultas.colunas_usuarios(campos),
+                                           query.since, query.after_id, query.limit)
+
+    if query.stream:
+        apresenta = partial(apresenta_usuario_listagem, campos=campos)
+        return transmite_listagem("usuarios", consulta, apresenta, headers)
+
+    usuarios = session.execute(consulta).all()
+    if query.since is not None:
+        # intercala as remoções no mesmo período, na ordem das alterações
+        removidos = session.execute(filtra_remocoes(UsuarioRemovido.nome, query.since, query.after_id,
+                                                    query.limit)).all()
+        usuarios, removidos, pagina = junta_remocoes(usuarios, removidos, query.limit)
+
+    if not usuarios and query.after_id is None and query.since is None:
         # se não há usuarios cadastrados
-        return {"usuários": "Não há usuários cadastrados"}, 200
+        return {"usuários": "Não há usuários cadastrados"}, 200, headers
     else:
-        logger.debug(f"%d usuários encontrados" % len(usuarios))
-        # retorna a representação de usuario
-        print(usuarios)
-        return apresenta_usuarios(usuarios), 200
-
-
-@app.get('/usuario', tags=[usuario_tag],
-         responses={"200": UsuarioViewSchema, "404": ErrorSchema})
+        logger.debug("%d usuários encontrados", len(usuarios))
+        resultado = apresenta_usuarios(usuarios, campos)
+        if query.since is not None:
+            resultado["removidos"] = removidos
+            resultado.update(cursor_alteracoes(pagina, query.since, query.after_id))
+        else:
+            resultado["proximo"] = proximo_cursor(usuarios, query.limit)
+        return resultado, 200, headers
+
+
+@api.get('/usuario', tags=[usuario_tag],
+         responses={"200": UsuarioViewSchema, "404": ErrorSchema, "503": ErrorSchema})
+@admissao("leitura")
 def get_usuario(query: UsuarioBuscaSchema):
     """Faz a busca por um Usuario a partir do nome
 
     Retorna uma representação dos usuários.
     """
     usuario_nome = query.nome
-    logger.debug(f"Coletando dados sobre usuário #{usuario_nome}")
+    logger.debug("Coletando dados sobre usuário #%s", usuario_nome)
+    # usuários buscados recentemente são respondidos pelo cache. A geração é lida
+    # antes da busca para não guardar um resultado invalidado durante ela
+    geracao = cache_usuarios.geracao
+    resultado = cache_usuarios.get(usuario_nome)
+    if resultado is not AUSENTE:
+        return resultado, 200
     # criando conexão com a base
     session = Session()
     # fazendo a busca
@@ -91,42 +231,51 @@ def get_usuario(query: UsuarioBuscaSchema):
     if not usuario:
         # se o usuário não foi encontrado
         error_msg = "Usuário não encontrado na base :/"
-        logger.warning(f"Erro ao buscar usuário '{usuario_nome}', {error_msg}")
+        logger.warning("Erro ao buscar usuário '%s', %s", usuario_nome, error_msg)
         return {"mensagem": error_msg}, 404
     else:
-        logger.debug(f"Usuario encontrado: '{usuario.nome}'")
+        logger.debug("Usuario encontrado: '%s'", usuario.nome)
         # retorna a representação de usuário
-        return apresenta_usuario(usuario), 200
+        resultado = apresenta_usuario(usuario)
+        cache_usuarios.set(usuario_nome, resultado, geracao)
+        return resultado, 200
 
 
-@app.delete('/usuario', tags=[usuario_tag],
-            responses={"200": UsuarioDelSchema, "404": ErrorSchema})
+@api.delete('/usuario', tags=[usuario_tag],
+            responses={"200": UsuarioDelSchema, "404": ErrorSchema, "503": ErrorSchema})
+@admissao("escrita")
+@com_retry
 def del_usuario(query: UsuarioBuscaSchema):
     """Deleta um usuário a partir do nome informado
 
     Retorna uma mensagem de confirmação da remoção.
     """
     usuario_nome = unquote(unquote(query.nome))
-    print(usuario_nome)
-    logger.debug(f"Deletando dados sobre usuário #{usuario_nome}")
+    logger.debug("Deletando dados sobre usuário #%s", usuario_nome)
     # criando conexão com a base
     session = Session()
     # fazendo a remoção
     count = session.query(Usuario).filter(Usuario.nome == usuario_nome).delete()
+    if count: incrementa_versao(session, "usuario", "livro")
     session.commit()
+    cache_usuarios.invalida(usuario_nome)
+    # os livros em cache podem estar emprestados para o usuário removido
+    cache_livros.limpa()
 
     if count:
         # retorna a representação da mensagem de confirmação
-        logger.debug(f"Deletado usuário #{usuario_nome}")
+        logger.debug("Deletado usuário #%s", usuario_nome)
         return {"mensagem": "Usuário removido", "nome": usuario_nome}, 200
     else:
         # se o usuário não foi encontrado
         error_msg = "Usuario não encontrado na base :/"
-        logger.warning(f"Erro ao deletar usuário #'{usuario_nome}', {error_msg}")
+        logger.warning("Erro ao deletar usuário #'%s', %s", usuario_nome, error_msg)
         return {"mensagem": error_msg}, 404
 
-@app.delete('/usuarios', tags=[usuario_tag],
-            responses={"200": UsuariosDelSchema,"400": ErrorSchema, "500": ErrorSchema})
+@api.delete('/usuarios', tags=[usuario_tag],
+            responses={"200": UsuariosDelSchema,"400": ErrorSchema, "500": ErrorSchema, "503": ErrorSchema})
+@admissao("lote")
+@com_retry
 def del_usuarios():
     """Deleta TODOS os usuários da base de dados, use com cuidado !!!"""
     session = Session()
@@ -137,10 +286,14 @@ def del_usuarios():
             logger.warning("Erro ao deletar todos os usuários, a base de usuários já está vazia")
             return {"mensagem": "A base de usuários já está vazia"}, 500
         usuarios.delete()
+        incrementa_versao(session, "usuario", "livro")
         session.commit()
+        cache_usuarios.limpa()
+        cache_livros.limpa()
         logger.debug("Todos os usuários foram deletados")
         return {"message": "Todos os usuários foram deletados com sucesso"}, 200
     except Exception as e:
+        if banco_ocupado(e): raise
         logger.debug("Algo deu errado")
         logger.debug(e)
         return {"mensagem": "Algo deu errado"}, 500
@@ -148,87 +301,243 @@ def del_usuarios():
 
 #-------------------------------------------------------------------------------------------------
 
-@app.post('/livro', tags=[livro_tag],
-          responses={"200": LivroViewSchema, "409": ErrorSchema, "400": ErrorSchema})
-def add_livro(form: LivroSchema):
-    """Adiciona um novo Livro à base de dados
-
-    Retorna uma representação dos livros.
-    """
+def insere_livro(session, form: LivroSchema):
+    """Adiciona o livro à seção e retorna a sua representação"""
     livro = Livro(
         nome=form.nome,
         autor=form.autor,
         editora = form.editora
         )
-    logger.debug(f"Adicionando o livro de nome: '{livro.nome}'")
+    session.add(livro)
+    session.flush()
+    return apresenta_livro(livro)
+
+
+@api.post('/livro', tags=[livro_tag],
+          responses={"200": LivroViewSchema, "409": ErrorSchema, "400": ErrorSchema, "503": ErrorSchema})
+@admissao("escrita")
+@com_retry
+def add_livro(form: LivroSchema):
+    """Adiciona um novo Livro à base de dados
+
+    Retorna uma representação dos livros.
+    """
+    logger.debug("Adicionando o livro de nome: '%s'", form.nome)
     try:
-        # criando conexão com a base
-        session = Session()
-        # adicionando livro
-        session.add(livro)
-        # efetivando o chamando de adição de novo item na tabela
-        session.commit()
-        logger.debug(f"Adicionado o livro de nome: '{livro.nome}'")
-        return apresenta_livro(livro), 200        
+        # adicionando livro e efetivando o chamando de adição de novo item na
+        # tabela, junto com outras requisições se a escrita em grupo estiver ativa
+        resultado = executa_escrita("livro", insere_livro, form)
+        cache_livros.invalida(form.nome)
+        logger.debug("Adicionado o livro de nome: '%s'", form.nome)
+        return resultado, 200
     except Exception as e:
+        if banco_ocupado(e): raise
         # caso um erro fora do previsto
         error_msg = "Não foi possível salvar novo item :/"
-        error_msg = e
-        logger.warning(f"Erro ao adicionar livro '{livro.nome}', {error_msg}")
-        print()
+        logger.warning("Erro ao adicionar livro '%s', %s", form.nome, e)
         return {"mensagem": error_msg}, 400
 
 
-@app.get('/livros', tags=[livro_tag],
-         responses={"200": ListagemLivrosSchema, "404": ErrorSchema})
-def get_livros():
+@api.post('/livros/bulk', tags=[livro_tag],
+          responses={"200": LivroBulkViewSchema, "400": ErrorSchema, "503": ErrorSchema})
+@admissao("lote")
+def add_livros_bulk(query: LivroBulkSchema):
+    """Adiciona livros em lote, lidos do corpo da requisição em NDJSON ou CSV
+
+    Os livros válidos são inseridos em lotes de chunk livros (até 10000), cada
+    lote em uma única transação. Retorna a quantidade inserida e os erros de cada linha inválida.
+    """
+    # limita o tamanho do lote entre 1 e 10000 livros, já que cada lote é
+    # mantido em memória até ser inserido
+    chunk = min(max(query.chunk, 1), 10000)
+    csv_format = request.mimetype == "text/csv"
+    inseridos = 0
+    erros = []
+    lote = []
+    # criando conexão com a base
+    session = Session()
+
+    def insere_lote(lote):
+        # insere o lote com um único executemany e efetiva a transação
+        session.execute(insert(Livro.__table__), lote)
+        incrementa_versao(session, "livro")
+        session.commit()
+        cache_livros.invalida(*{dados["nome"] for dados in lote})
+
+    try:
+        for linha, dados, erro in le_livros_bulk(request.stream, csv_format):
+            if erro:
+                erros.append({"linha": linha, "mensagem": erro})
+                continue
+            lote.append(dados)
+            if len(lote) == chunk:
+                repete_se_ocupado(insere_lote, lote)
+                inseridos += len(lote)
+                lote = []
+        if lote:
+            repete_se_ocupado(insere_lote, lote)
+            inseridos += len(lote)
+    except UnicodeDecodeError:
+        # os lotes anteriores ao erro permanecem inseridos
+        error_msg = "O arquivo deve estar codificado em UTF-8 :/"
+        logger.warning("Erro na importação em lote após %d livros, %s", inseridos, error_msg)
+        return {"mensagem": error_msg}, 400
+    except OperationalError as e:
+        if not banco_ocupado(e): raise
+        error_msg = "Banco de dados ocupado, tente novamente"
+        logger.warning("Erro na importação em lote após %d livros, %s", inseridos, error_msg)
+        return {"mensagem": error_msg}, 503
+
+    logger.debug("Importação em lote: %d livros inseridos, %d erros", inseridos, len(erros))
+    return {"inseridos": inseridos, "erros": erros}, 200
+
+
+@api.get('/livros', tags=[livro_tag],
+         responses={"200": ListagemLivrosSchema, "400": ErrorSchema, "404": ErrorSchema, "503": ErrorSchema})
+@condicional("livro")
+@admissao(classe_listagem)
+def get_livros(query: ListagemBuscaSchema):
     """Faz a busca por todos os Livros cadastrados
 
+    Aceita paginação por limit e after_id, stream=true para enviar a listagem
+    completa aos poucos, sem carregá-la toda em memória, e fields para escolher
+    os campos de cada livro (id, nome, autor, editora, emprestado_para). Com since, retorna apenas os
+    livros inseridos ou alterados a partir dessa data e os ids dos removidos, paginados por limit.
+
     Retorna uma representação da listagem de livros.
     """
-    logger.debug(f"Coletando livros ")
+    logger.debug("Coletando livros ")
+    try:
+        campos = valida_listagem(query, CAMPOS_LISTAGEM_LIVRO)
+    except ValueError as e:
+        logger.warning("Erro ao listar livros, %s", e)
+        return {"mensagem": str(e)}, 400
     # criando conexão com a base
     session = Session()
-    # fazendo a busca
-    livros = session.query(Livro).all()
-
-    if not livros:
+    # o ETag calculado por condicional(), exceto nas listagens com since
+    headers = {"ETag": g.etag} if g.etag else {}
+    # fazendo a busca só das colunas pedidas, sem instanciar os livros, e do
+    # nome do usuário do empréstimo apenas se emprestado_para foi pedido
+    consulta = consultas.consulta_listagem(Livro, consultas.colunas_livros(campos),
+                                           query.since, query.after_id, query.limit)
+
+    if query.stream:
+        apresenta = partial(apresenta_livro_linha, campos=campos)
+        return transmite_listagem("livros", consulta, apresenta, headers)
+
+    livros = session.execute(consulta).all()
+    if query.since is not None:
+        # intercala as remoções no mesmo período, na ordem das alterações
+        removidos = session.execute(filtra_remocoes(LivroRemovido.id, query.since, query.after_id,
+                                                    query.limit)).all()
+        livros, removidos, pagina = junta_remocoes(livros, removidos, query.limit)
+
+    if not livros and query.after_id is None and query.since is None:
         # se não há livros cadastrados
-        return {"livros": "Não há livros cadatrados"}, 200
+        return {"livros": "Não há livros cadatrados"}, 200, headers
     else:
-        logger.debug(f"%d livros encontrados" % len(livros))
+        logger.debug("%d livros encontrados", len(livros))
         # retorna a representação de livro
-        return apresenta_livros(livros), 200
+        resultado = apresenta_livros_linhas(livros, campos)
+        if query.since is not None:
+            resultado["removidos"] = removidos
+            resultado.update(cursor_alteracoes(pagina, query.since, query.after_id))
+        else:
+            resultado["proximo"] = proximo_cursor(livros, query.limit)
+        return resultado, 200, headers
+
+
+@api.get('/livros/disponibilidade', tags=[livro_tag],
+         responses={"200": ListagemDisponibilidadeSchema, "503": ErrorSchema})
+@condicional("livro")
+@admissao(classe_listagem)
+def get_disponibilidade(query: DisponibilidadeBuscaSchema):
+    """Faz a busca pela quantidade total e de cópias disponíveis de cada título
+
+    Os contadores são mantidos pelo banco a cada inserção, remoção, empréstimo
+    e devolução, sem percorrer os livros. Aceita nome para buscar um único
+    título e paginação por limit e after (nome do último título da página).
+
+    Retorna uma representação da disponibilidade dos títulos.
+    """
+    logger.debug("Coletando disponibilidade dos títulos")
+    session = Session()
+    # os contadores mudam junto com a tabela livro, cuja versão forma o ETag
+    consulta = consultas.consulta_disponibilidade(query.nome, query.after, query.limit)
+    titulos = session.scalars(consulta).all()
+    logger.debug("%d títulos encontrados", len(titulos))
+    return apresenta_disponibilidade(titulos, query.limit), 200, {"ETag": g.etag}
 
 
-@app.get('/livro', tags=[livro_tag],
-         responses={"200": LivroViewSchema, "404": ErrorSchema})
+@api.get('/livro', tags=[livro_tag],
+         responses={"200": LivroViewSchema, "404": ErrorSchema, "503": ErrorSchema})
+@admissao("leitura")
 def get_livro(query: LivroBuscaSchema):
     """Faz a busca por livros a partir do nome
 
     Retorna uma representação dos livros.
     """
     livro_nome = query.nome
-    logger.debug(f"Coletando dados sobre livro #{livro_nome}")
+    logger.debug("Coletando dados sobre livro #%s", livro_nome)
+    # livros buscados recentemente são respondidos pelo cache. A geração é lida
+    # antes da busca para não guardar um resultado invalidado durante ela
+    geracao = cache_livros.geracao
+    resultado = cache_livros.get(livro_nome)
+    if resultado is not AUSENTE:
+        return resultado, 200
     # criando conexão com a base
     session = Session()
     # fazendo a busca
     livros = session.query(Livro).filter(Livro.nome == livro_nome).all()
 
     if livros:
-        logger.debug(f"Livros encontrados: '{apresenta_livros(livros)}'")
         # retorna a representação de livro
-        return apresenta_livros(livros), 200
+        resultado = apresenta_livros(livros)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Livros encontrados: '%s'", resultado)
+        cache_livros.set(livro_nome, resultado, geracao)
+        return resultado, 200
     else:
         # se o livro não foi encontrado
         error_msg = "Livro não encontrado na base :/"
-        logger.warning(f"Erro ao buscar livro '{livro_nome}', {error_msg}")
+        logger.warning("Erro ao buscar livro '%s', %s", livro_nome, error_msg)
         return {"mensagem": error_msg}, 404
         
 
 
-@app.delete('/livro', tags=[livro_tag],
-            responses={"200": LivroDelSchema, "404": ErrorSchema})
+@api.get('/livros/busca', tags=[livro_tag],
+         responses={"200": ListagemLivrosSchema, "404": ErrorSchema, "503": ErrorSchema})
+@admissao("leitura")
+def busca_livros(query: LivroBuscaTextoSchema):
+    """Faz a busca textual de livros pelo nome, autor ou editora
+
+    Retorna uma representação dos livros encontrados, do mais relevante para o menos relevante.
+    """
+    logger.debug("Buscando livros por '%s'", query.q)
+    # limita a quantidade de resultados entre 1 e 100
+    limite = min(max(query.limite, 1), 100)
+    # criando conexão com a base
+    session = Session()
+    # fazendo a busca no índice textual e depois carregando os livros encontrados
+    ids = busca_livros_ids(session, query.q, limite)
+    livros = session.query(Livro).filter(Livro.id.in_(ids)).all() if ids else []
+
+    if livros:
+        # mantém a ordem de relevância retornada pelo índice
+        posicao = {livro_id: i for i, livro_id in enumerate(ids)}
+        livros.sort(key=lambda livro: posicao[livro.id])
+        return apresenta_livros(livros), 200
+    else:
+        # se nenhum livro foi encontrado
+        error_msg = "Nenhum livro encontrado para a busca :/"
+        logger.warning("Erro ao buscar livros por '%s', %s", query.q, error_msg)
+        return {"mensagem": error_msg}, 404
+
+
+@api.delete('/livro', tags=[livro_tag],
+            responses={"200": LivroDelSchema, "404": ErrorSchema, "503": ErrorSchema})
+@admissao("escrita")
+@com_retry
 def del_livro(query: LivroBuscaIdSchema):
     """Deleta um livro a partir do id informado
 
@@ -238,23 +547,27 @@ def del_livro(query: LivroBuscaIdSchema):
     # criando conexão com a base
     session = Session()
     livro = session.query(Livro).filter(Livro.id == livro_id)
+    obj_livro = livro.first()
     # fazendo a remoção
 
-    if livro:
+    if obj_livro:
         # retorna a representação da mensagem de confirmação
-        obj_livro = livro.first()
-        logger.debug(f"Deletandoo livro de id#{obj_livro.id}\nnome:{obj_livro.nome}")
+        logger.debug("Deletandoo livro de id#%s\nnome:%s", obj_livro.id, obj_livro.nome)
         livro.delete()
+        incrementa_versao(session, "livro")
         session.commit()
+        cache_livros.invalida(obj_livro.nome)
         return {"mensagem": "Livro removido", "id": obj_livro.id ,"nome": obj_livro.nome}, 200
     else:
         # se o livro não foi encontrado
         error_msg = "Livro não encontrado na base :/"
-        logger.warning(f"Erro ao deletar livro #'{livro.id}\nnome: {livro.nome}', {error_msg}")
+        logger.warning("Erro ao deletar livro #'%s', %s", livro_id, error_msg)
         return {"mensagem": error_msg}, 404
 
-@app.delete('/livros', tags=[livro_tag],
-            responses={"200": LivrosDelSchema,"400": ErrorSchema, "500": ErrorSchema})
+@api.delete('/livros', tags=[livro_tag],
+            responses={"200": LivrosDelSchema,"400": ErrorSchema, "500": ErrorSchema, "503": ErrorSchema})
+@admissao("lote")
+@com_retry
 def del_livros():
     """Deleta TODOS os livros da base de dados, use com cuidado !!!"""
     session = Session()
@@ -265,54 +578,154 @@ def del_livros():
             logger.warning("Erro ao deletar todos os livros, a base de livros já está vazia")
             return {"mensagem": "A base de livros já está vazia"}, 400
         livros.delete()
+        incrementa_versao(session, "livro")
         session.commit()
+        cache_livros.limpa()
         logger.debug("Todos os livros foram deletados")
         return {"message": "Todos os livros foram deletados com sucesso"}, 200
     except Exception as e:
+        if banco_ocupado(e): raise
         logger.debug("Algo deu errado")
         logger.debug(e)
         return {"mensagem": "Algo deu errado"}, 500
 
-@app.put('/livro', tags=[livro_tag],
-            responses={"200": LivroEmprestadoSchema,"404": ErrorSchema, "500": ErrorSchema})
+@api.put('/livro', tags=[livro_tag],
+            responses={"200": LivroEmprestadoSchema,"404": ErrorSchema, "409": ErrorSchema, "500": ErrorSchema, "503": ErrorSchema})
+@admissao("escrita")
+@com_retry
 def empresta_livro(query: LivroEmprestaSchema):
-    """Empresta um livro da biblioteca a um usuário"""
+    """Empresta um livro da biblioteca a um usuário, caso ele não esteja emprestado"""
     try:
         session = Session()
+        #O id do usuário é buscado pelo nome dentro do próprio UPDATE, que só é aplicado se o usuário
+        # existir, o que garante a integridade referencial da FK emprestado_para_id. A condição
+        # emprestado_para_id IS NULL faz com que, entre empréstimos concorrentes do mesmo livro, só um vença
+        livro = session.execute(consultas.empresta_livro(query.livro_id, query.usuario_nome)).first()
+        if livro:
+            incrementa_versao(session, "livro")
+            session.commit()
+            cache_livros.invalida(livro.nome)
+            msg = f"O livro de id: {livro.id}, {livro.nome}, foi emprestado para {query.usuario_nome}"
+            return {"mensagem": msg}, 200
+
+        # nenhuma linha foi alterada, busca o motivo para informar ao usuário
+        session.rollback()
         livro = session.query(Livro).filter(Livro.id == query.livro_id).first()
         if(not livro): return {"mensagem": f"livro de id #{query.livro_id} não encontrado"}, 404
-        
-        #Essa linha acaba por garantir a integridade referencial pois a coluna emprestado_para_id é FK
-        # da PK "id" de "Usuario", e não é possível inserir um id que não tenha sido encontrado na tabela "Usuario"
-        usuario = session.query(Usuario).filter(Usuario.nome == query.usuario_nome).first()
-        if(not usuario): return {"mensagem": f"Usuário de nome {query.usuario_nome} não encontrado"}, 404
-        
-        livro.emprestado_para_id = usuario.id
-        session.add(livro)
-        session.commit()
-        str = f"O livro de id: {livro.id}, {livro.nome}, foi emprestado para {usuario.nome}"
-        return {"mensagem": str}, 200
+        if(not session.scalar(consultas.usuario_por_nome(query.usuario_nome))):
+            return {"mensagem": f"Usuário de nome {query.usuario_nome} não encontrado"}, 404
+        return {"mensagem": f"livro de id #{query.livro_id} já está emprestado"}, 409
     except Exception as e:
-        str = "Erro não identificado: " + e
-        return {"mensagem": str}, 500
-
-@app.put('/livroDevolve', tags=[livro_tag],
-            responses={"200": LivroDevolvidoSchema,"404": ErrorSchema, "500": ErrorSchema})
+        if banco_ocupado(e): raise
+        msg = "Erro não identificado: %s" % e
+        return {"mensagem": msg}, 500
+
+@api.put('/livroDevolve', tags=[livro_tag],
+            responses={"200": LivroDevolvidoSchema,"404": ErrorSchema, "500": ErrorSchema, "503": ErrorSchema})
+@admissao("escrita")
+@com_retry
 def devolve_livro(query: LivroDevolveSchema):
     """Devolve um livro emprestado à biblioteca"""
     try:
         livro_id = query.id
         session = Session()
-        livro = session.query(Livro).filter(Livro.id == livro_id).first()
-        if(not livro): return {"mensagem": f"livro de id #{livro_id} não encontrado"}, 404
-        if(livro.emprestado_para_id == None): return {"mensagem": f"livro de id #{livro_id} não estava emprestado"}, 404
-
-        livro.emprestado_para_id = None
-        session.add(livro)
-        session.commit()
-        str = f"O livro de id: {livro.id}, {livro.nome}, foi devolvido."
-        return {"mensagem": str}, 200
+        # devolve o livro com um único UPDATE condicional: entre devoluções
+        # concorrentes só uma altera a linha, e um novo empréstimo feito depois
+        # dela não é desfeito por uma devolução atrasada
+        livro = session.execute(consultas.devolve_livro(livro_id)).first()
+        if livro:
+            incrementa_versao(session, "livro")
+            session.commit()
+            cache_livros.invalida(livro.nome)
+            str = f"O livro de id: {livro.id}, {livro.nome}, foi devolvido."
+            return {"mensagem": str}, 200
+
+        # nenhuma linha foi alterada, busca o motivo para informar ao usuário
+        session.rollback()
+        if(not session.query(Livro.id).filter(Livro.id == livro_id).first()):
+            return {"mensagem": f"livro de id #{livro_id} não encontrado"}, 404
+        return {"mensagem": f"livro de id #{livro_id} não estava emprestado"}, 404
     except Exception as e:
-        str = "Erro não identificado: " + e
-        return {"mensagem": str}, 500
-    
\ No newline at end of file
+        if banco_ocupado(e): raise
+        msg = "Erro não identificado: %s" % e
+        return {"mensagem": msg}, 500
+
+
+@api.put('/livros/empresta', tags=[livro_tag],
+         responses={"200": LivrosLoteViewSchema, "503": ErrorSchema})
+@admissao("lote")
+@com_retry
+def empresta_livros(body: LivrosEmprestaSchema):
+    """Empresta vários livros de uma vez, em uma única transação
+
+    Retorna o resultado de cada empréstimo, na ordem informada.
+    """
+    emprestimos = body.emprestimos
+    logger.debug("Emprestando %d livros", len(emprestimos))
+    session = Session()
+    # busca todos os livros e usuários envolvidos de uma vez, só as colunas
+    # usadas, sem instanciar os livros
+    livros = {livro.id: livro for livro in session.execute(
+        consultas.livros_do_lote(emprestimo.livro_id for emprestimo in emprestimos))}
+    nomes = {emprestimo.usuario_nome for emprestimo in emprestimos}
+    usuarios = dict(session.execute(select(Usuario.nome, Usuario.id).where(Usuario.nome.in_(nomes))).all())
+    resultados, aplicar = planeja_emprestimos(emprestimos, livros, usuarios)
+
+    # aplica os empréstimos com um único UPDATE condicional, que não sobrescreve um
+    # livro emprestado por outra requisição depois da leitura acima e retorna os
+    # ids que foram de fato emprestados por esta requisição
+    if aplicar:
+        emprestados = set(session.execute(consultas.empresta_livros(aplicar)).scalars())
+        marca_conflitos(resultados, emprestados, "livro de id #%d já está emprestado")
+
+    incrementa_versao(session, "livro")
+    # efetiva todos os empréstimos de uma vez
+    session.commit()
+    cache_livros.invalida(*{livro.nome for livro in livros.values()})
+    return {"resultados": resultados}, 200
+
+
+@api.put('/livros/devolve', tags=[livro_tag],
+         responses={"200": LivrosLoteViewSchema, "503": ErrorSchema})
+@admissao("lote")
+@com_retry
+def devolve_livros(body: LivrosDevolveSchema):
+    """Devolve vários livros emprestados de uma vez, em uma única transação
+
+    Retorna o resultado de cada devolução, na ordem informada.
+    """
+    logger.debug("Devolvendo %d livros", len(body.ids))
+    session = Session()
+    # busca todos os livros envolvidos de uma vez, só as colunas usadas
+    livros = {livro.id: livro for livro in session.execute(consultas.livros_do_lote(body.ids))}
+    resultados, aplicar = planeja_devolucoes(body.ids, livros)
+
+    # aplica as devoluções com um único UPDATE condicional, que só devolve os livros
+    # ainda emprestados para o usuário lido acima: um livro devolvido e emprestado
+    # novamente por outra requisição depois da leitura não tem o novo empréstimo desfeito
+    if aplicar:
+        devolvidos = set(session.execute(consultas.devolve_livros(aplicar)).scalars())
+        marca_conflitos(resultados, devolvidos, "livro de id #%d foi alterado por outra requisição")
+
+    incrementa_versao(session, "livro")
+    # efetiva todas as devoluções de uma vez
+    session.commit()
+    cache_livros.invalida(*{livro.nome for livro in livros.values()})
+    return {"resultados": resultados}, 200
+
+
+@api.get('/cache', tags=[cache_tag],
+         responses={"200": CacheViewSchema})
+def get_cache():
+    """Retorna os contadores de hits, misses e evictions dos caches de consulta
+    """
+    return {"usuarios": cache_usuarios.estatisticas(), "livros": cache_livros.estatisticas()}, 200
+
+
+@api.get('/metrics', tags=[metricas_tag])
+def get_metrics():
+    """Retorna as métricas de latência por rota, de consultas SQL e dos caches
+    no formato de texto do Prometheus
+    """
+    return Response(exporta_metricas(), mimetype="text/plain; version=0.0.4")
+
@@ -0,0 +1,680 @@
+"""Modo ASGI da API, com FastAPI e sessões assíncronas do SQLAlchemy (aiosqlite)
+
+Serve as mesmas rotas de app.py, com os mesmos parâmetros, respostas e
+schemas, sem ocupar uma thread por requisição enquanto ela espera pelo banco.
+
+Uso:
+    uvicorn asgi:app --port 5000
+"""
+from fastapi import FastAPI, Depends, Form, Query, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse, RedirectResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from werkzeug.http import quote_etag, parse_etags
+from contextlib import asynccontextmanager
+from typing import Annotated
+from urllib.parse import unquote
+from functools import partial, wraps
+import tempfile
+import asyncio
+import logging
+import random
+import time
+import zlib
+
+from sqlalchemy import event, insert, pool, select, delete
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+
+from model import db_url, engine_options, init_db, configura_sqlite, Usuario, Livro, LivroRemovido, \
+                  UsuarioRemovido, incrementa_versao, versao_tabela
+from model.alteracoes import filtra_remocoes
+from model import consultas
+from model.busca import busca_livros_ids
+from logger import logger
+from retry import banco_ocupado, tentativas, espera_inicial, espera_maxima
+from cache import cache_usuarios, cache_livros, AUSENTE
+from metrics import instrumenta_engine, registra_requisicao, exporta_metricas
+from serializacao import serializa, serializa_resposta
+from compressao import disponiveis, tamanho_minimo, niveis
+from schemas import *
+
+
+# engine assíncrona com o mesmo banco, as mesmas opções (DB_POOL_CLASS,
+# DB_CHECK_SAME_THREAD, etc) e os mesmos pragmas da engine de app.py
+opcoes_engine = engine_options()
+if opcoes_engine["poolclass"] is pool.QueuePool:
+    # a engine assíncrona usa a versão do QueuePool adaptada ao asyncio
+    opcoes_engine["poolclass"] = pool.AsyncAdaptedQueuePool
+elif opcoes_engine["poolclass"] is pool.SingletonThreadPool:
+    # o loop roda em uma única thread: uma conexão por thread é uma única conexão
+    opcoes_engine["poolclass"] = pool.StaticPool
+engine_async = create_async_engine(make_url(db_url).set(drivername="sqlite+aiosqlite"), **opcoes_engine)
+event.listen(engine_async.sync_engine, "connect", configura_sqlite)
+# registra as consultas lentas, como em app.py. A contagem de consultas por
+# rota usa o estado da thread da requisição e é feita apenas em app.py
+instrumenta_engine(engine_async.sync_engine)
+
+SessionAsync = async_sessionmaker(engine_async, expire_on_commit=False)
+
+
+class RespostaJSON(JSONResponse):
+    """ Resposta JSON gerada como as respostas do Flask em app.py
+    """
+
+    def render(self, content) -> bytes:
+        return serializa_resposta(content)
+
+
+@asynccontextmanager
+async def ciclo_de_vida(app: FastAPI):
+    # cria o banco e aplica as migrações, como a create_app
+    init_db()
+    yield
+    await engine_async.dispose()
+
+
+class MedeLatencia:
+    """ Middleware ASGI que registra a latência de cada rota nas métricas de
+        /metrics, até o fim do envio da resposta
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        inicio = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            # o roteamento guarda a rota encontrada no scope
+            rota = scope.get("route")
+            registra_requisicao(scope["method"], getattr(rota, "path", "<sem rota>"),
+                                time.perf_counter() - inicio)
+
+
+app = FastAPI(title="Minha API", version="1.0.0", lifespan=ciclo_de_vida,
+              default_response_class=RespostaJSON)
+if "gzip" in disponiveis():
+    # no modo ASGI apenas gzip é negociado, pelo middleware do Starlette
+    app.add_middleware(GZipMiddleware, minimum_size=tamanho_minimo, compresslevel=niveis["gzip"])
+app.add_middleware(MedeLatencia)
+
+# definindo tags
+usuario_tag = "Usuário"
+livro_tag = "Livro"
+cache_tag = "Cache"
+metricas_tag = "Métricas"
+
+
+async def sessao():
+    """Seção do banco usada pela requisição, fechada ao final dela"""
+    async with SessionAsync() as session:
+        yield session
+
+
+Sessao = Annotated[AsyncSession, Depends(sessao)]
+
+
+def resposta(conteudo, status: int = 200, headers: dict = None):
+    return RespostaJSON(conteudo, status_code=status, headers=headers)
+
+
+def documenta(respostas: dict):
+    """Monta o parâmetro responses das rotas a partir dos schemas de cada status"""
+    return {int(status): {"model": schema} for status, schema in respostas.items()}
+
+
+async def repete_se_ocupado(session: AsyncSession, func, /, *args, **kwargs):
+    """ Executa await func(*args, **kwargs), repetindo a execução quando o banco
+        está ocupado, como o repete_se_ocupado de retry.py, esperando sem
+        bloquear o loop. Esgotadas as tentativas, levanta a última exceção.
+    """
+    for tentativa in range(1, tentativas + 1):
+        try:
+            return await func(*args, **kwargs)
+        except OperationalError as e:
+            if not banco_ocupado(e) or tentativa == tentativas:
+                raise
+            # descarta a transação que falhou antes de repetir a operação
+            await session.rollback()
+            logger.warning("Banco ocupado em %s(), tentativa %d de %d",
+                           func.__name__, tentativa, tentativas)
+            espera = min(espera_maxima, espera_inicial * 2 ** (tentativa - 1))
+            await asyncio.sleep(espera * random.uniform(0.5, 1))
+
+
+def com_retry(func):
+    """ Reexecuta uma rota de escrita quando o banco está ocupado por outra
+        escrita, usando repete_se_ocupado.
+
+    Esgotadas as tentativas, retorna 503 para que o cliente tente mais tarde.
+    """
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        session = kwargs["session"]
+        try:
+            return await repete_se_ocupado(session, func, *args, **kwargs)
+        except OperationalError as e:
+            if not banco_ocupado(e):
+                raise
+            await session.rollback()
+            logger.warning("Banco ocupado em %s(), tentativas esgotadas", func.__name__)
+            return resposta({"mensagem": "Banco de dados ocupado, tente novamente"}, 503)
+
+    return wrapper
+
+
+async def etag_listagem(request: Request, session: AsyncSession, tabela: str):
+    """Retorna o ETag (fraco) da listagem de uma tabela, calculado como em
+    app.py, e se o cliente já possui essa versão
+    """
+    versao = await session.run_sync(versao_tabela, tabela)
+    etag = "%s-%d-%08x" % (tabela, versao, zlib.crc32(request.url.query.encode()))
+    nao_modificado = parse_etags(request.headers.get("if-none-match")).contains_weak(etag)
+    return quote_etag(etag, weak=True), nao_modificado
+
+
+def transmite_listagem(chave: str, consulta, apresenta, headers: dict = None):
+    """Envia a listagem em JSON aos poucos, lendo os itens do banco em lotes,
+    em uma seção aberta durante o envio
+    """
+    async def gera():
+        yield '{"%s": [' % chave
+        separador = ""
+        async with SessionAsync() as session:
+            async for item in await session.stream(consulta.execution_options(yield_per=1000)):
+                yield separador + serializa(apresenta(item))
+                separador = ", "
+        yield "]}"
+
+    return StreamingResponse(gera(), media_type="application/json", headers=headers)
+
+
+@app.get("/", include_in_schema=False)
+async def home():
+    """Redireciona para a documentação da API"""
+    return RedirectResponse("/docs")
+
+
+@app.post('/usuario', tags=[usuario_tag],
+          responses=documenta({"200": UsuarioViewSchema, "409": ErrorSchema, "400": ErrorSchema,
+                               "503": ErrorSchema}))
+@com_retry
+async def add_usuario(form: Annotated[UsuarioSchema, Form()], session: Sessao):
+    """Adiciona um novo Usuario à base de dados
+
+    Retorna uma representação dos usuários.
+    """
+    try:
+        usuario = Usuario(nome=form.nome, idade=form.idade)
+        session.add(usuario)
+        await session.flush()
+        await session.run_sync(incrementa_versao, "usuario")
+        await session.commit()
+        cache_usuarios.invalida(form.nome)
+        return resposta(apresenta_usuario(usuario))
+
+    except IntegrityError:
+        # como a duplicidade do nome é a provável razão do IntegrityError
+        error_msg = "Usuario de mesmo nome já salvo na base :/"
+        logger.warning("Erro ao adicionar usuário '%s', %s", form.nome, error_msg)
+        return resposta({"mensagem": error_msg}, 409)
+
+    except Exception as e:
+        if banco_ocupado(e): raise
+        # caso um erro fora do previsto
+        error_msg = "Não foi possível salvar novo item :/"
+        logger.warning("Erro ao adicionar usuário '%s', %s", form.nome, error_msg)
+        return resposta({"mensagem": error_msg}, 400)
+
+
+async def lista(request: Request, session: AsyncSession, query: ListagemBuscaSchema,
+                modelo, removido, chave: str, campos: tuple, colunas: list, apresenta, vazia: dict):
+    """Listagem de usuários ou de livros, com os parâmetros de ListagemBuscaSchema
+
+    removido é a coluna que identifica os itens removidos (ver filtra_remocoes).
+    """
+    headers = {}
+    # as listagens com since mudam com a passagem do tempo e não usam ETag
+    if query.since is None:
+        etag, nao_modificado = await etag_listagem(request, session, modelo.__tablename__)
+        if nao_modificado:
+            return Response(status_code=304, headers={"ETag": etag})
+        headers["ETag"] = etag
+
+    # a mesma consulta da listagem de app.py
+    consulta = consultas.consulta_listagem(modelo, colunas, query.since, query.after_id, query.limit)
+
+    if query.stream:
+        return transmite_listagem(chave, consulta, partial(apresenta, campos=campos), headers)
+
+    itens = (await session.execute(consulta)).all()
+    if query.since is not None:
+        removidos = (await session.execute(filtra_remocoes(removido, query.since, query.after_id,
+                                                           query.limit))).all()
+        itens, removidos, pagina = junta_remocoes(itens, removidos, query.limit)
+    if not itens and query.after_id is None and query.since is None:
+        return resposta(vazia, 200, headers)
+    resultado = {chave: [apresenta(item, campos) for item in itens]}
+    if query.since is not None:
+        resultado["removidos"] = removidos
+        resultado.update(cursor_alteracoes(pagina, query.since, query.after_id))
+    else:
+        resultado["proximo"] = proximo_cursor(itens, query.limit)
+    return resposta(resultado, 200, headers)
+
+
+@app.get('/usuarios', tags=[usuario_tag],
+         responses=documenta({"200": ListagemUsuariosSchema, "400": ErrorSchema, "404": ErrorSchema}))
+async def get_usuarios(request: Request, query: Annotated[ListagemBuscaSchema, Query()], session: Sessao):
+    """Faz a busca por todos os Usuarios cadastrados
+
+    Aceita os mesmos parâmetros da listagem de app.py: limit, after_id,
+    stream, fields e since.
+    """
+    try:
+        campos = valida_listagem(query, CAMPOS_LISTAGEM_USUARIO)
+    except ValueError as e:
+        logger.warning("Erro ao listar usuários, %s", e)
+        return resposta({"mensagem": str(e)}, 400)
+    colunas = consultas.colunas_usuarios(campos)
+    return await lista(request, session, query, Usuario, UsuarioRemovido.nome, "usuarios", campos, colunas,
+                       apresenta_usuario_listagem, {"usuários": "Não há usuários cadastrados"})
+
+
+@app.get('/usuario', tags=[usuario_tag],
+         responses=documenta({"200": UsuarioViewSchema, "404": ErrorSchema}))
+async def get_usuario(query: Annotated[UsuarioBuscaSchema, Query()], session: Sessao):
+    """Faz a busca por um Usuario a partir do nome
+
+    Retorna uma representação dos usuários.
+    """
+    usuario_nome = query.nome
+    # usuários buscados recentemente são respondidos pelo cache; a geração é lida
+    # antes da busca, como em app.py
+    geracao = cache_usuarios.geracao
+    resultado = cache_usuarios.get(usuario_nome)
+    if resultado is not AUSENTE:
+        return resposta(resultado)
+    usuario = await session.scalar(select(Usuario).where(Usuario.nome == usuario_nome).limit(1))
+    if not usuario:
+        error_msg = "Usuário não encontrado na base :/"
+        logger.warning("Erro ao buscar usuário '%s', %s", usuario_nome, error_msg)
+        return resposta({"mensagem": error_msg}, 404)
+    resultado = apresenta_usuario(usuario)
+    cache_usuarios.set(usuario_nome, resultado, geracao)
+    return resposta(resultado)
+
+
+@app.delete('/usuario', tags=[usuario_tag],
+            responses=documenta({"200": UsuarioDelSchema, "404": ErrorSchema, "503": ErrorSchema}))
+@com_retry
+async def del_usuario(query: Annotated[UsuarioBuscaSchema, Query()], session: Sessao):
+    """Deleta um usuário a partir do nome informado
+
+    Retorna uma mensagem de confirmação da remoção.
+    """
+    usuario_nome = unquote(unquote(query.nome))
+    resultado = await session.execute(delete(Usuario).where(Usuario.nome == usuario_nome))
+    if resultado.rowcount: await session.run_sync(incrementa_versao, "usuario", "livro")
+    await session.commit()
+    cache_usuarios.invalida(usuario_nome)
+    # os livros em cache podem estar emprestados para o usuário removido
+    cache_livros.limpa()
+
+    if resultado.rowcount:
+        return resposta({"mensagem": "Usuário removido", "nome": usuario_nome})
+    error_msg = "Usuario não encontrado na base :/"
+    logger.warning("Erro ao deletar usuário #'%s', %s", usuario_nome, error_msg)
+    return resposta({"mensagem": error_msg}, 404)
+
+
+@app.delete('/usuarios', tags=[usuario_tag],
+            responses=documenta({"200": UsuariosDelSchema, "400": ErrorSchema, "500": ErrorSchema,
+                                 "503": ErrorSchema}))
+@com_retry
+async def del_usuarios(session: Sessao):
+    """Deleta TODOS os usuários da base de dados, use com cuidado !!!"""
+    try:
+        if not await session.scalar(select(Usuario.id).limit(1)):
+            logger.warning("Erro ao deletar todos os usuários, a base de usuários já está vazia")
+            return resposta({"mensagem": "A base de usuários já está vazia"}, 500)
+        await session.execute(delete(Usuario))
+        await session.run_sync(incrementa_versao, "usuario", "livro")
+        await session.commit()
+        cache_usuarios.limpa()
+        cache_livros.limpa()
+        return resposta({"message": "Todos os usuários foram deletados com sucesso"})
+    except Exception as e:
+        if banco_ocupado(e): raise
+        logger.debug(e)
+        return resposta({"mensagem": "Algo deu errado"}, 500)
+
+
+#-------------------------------------------------------------------------------------------------
+
+@app.post('/livro', tags=[livro_tag],
+          responses=documenta({"200": LivroViewSchema, "409": ErrorSchema, "400": ErrorSchema,
+                               "503": ErrorSchema}))
+@com_retry
+async def add_livro(form: Annotated[LivroSchema, Form()], session: Sessao):
+    """Adiciona um novo Livro à base de dados
+
+    Retorna uma representação dos livros.
+    """
+    try:
+        livro = Livro(nome=form.nome, autor=form.autor, editora=form.editora)
+        session.add(livro)
+        await session.flush()
+        await session.run_sync(incrementa_versao, "livro")
+        await session.commit()
+        cache_livros.invalida(form.nome)
+        # um livro novo não está emprestado (apresenta_livro carregaria o
+        # relacionamento emprestado_para, o que não é feito na seção assíncrona)
+        return resposta({"id": livro.id, "nome": livro.nome, "autor": livro.autor,
+                         "editora": livro.editora, "emprestado_para": None})
+    except Exception as e:
+        if banco_ocupado(e): raise
+        error_msg = "Não foi possível salvar novo item :/"
+        logger.warning("Erro ao adicionar livro '%s', %s", form.nome, e)
+        return resposta({"mensagem": error_msg}, 400)
+
+
+@app.post('/livros/bulk', tags=[livro_tag],
+          responses=documenta({"200": LivroBulkViewSchema, "400": ErrorSchema, "503": ErrorSchema}))
+async def add_livros_bulk(request: Request, query: Annotated[LivroBulkSchema, Query()], session: Sessao):
+    """Adiciona livros em lote, lidos do corpo da requisição em NDJSON ou CSV
+
+    Aceita os mesmos parâmetros de app.py. O corpo é recebido em um arquivo
+    temporário, mantido em memória apenas enquanto for pequeno, e lido uma
+    linha por vez.
+    """
+    # limita o tamanho do lote entre 1 e 10000 livros, como em app.py
+    chunk = min(max(query.chunk, 1), 10000)
+    csv_format = request.headers.get("content-type", "").split(";")[0].strip() == "text/csv"
+    inseridos = 0
+    erros = []
+    lote = []
+
+    async def insere_lote(lote):
+        # insere o lote com um único executemany e efetiva a transação
+        await session.execute(insert(Livro.__table__), lote)
+        await session.run_sync(incrementa_versao, "livro")
+        await session.commit()
+        cache_livros.invalida(*{dados["nome"] for dados in lote})
+
+    with tempfile.SpooledTemporaryFile(max_size=1024 * 1024) as corpo:
+        async for pedaco in request.stream():
+            corpo.write(pedaco)
+        corpo.seek(0)
+        try:
+            for linha, dados, erro in le_livros_bulk(corpo, csv_format):
+                if erro:
+                    erros.append({"linha": linha, "mensagem": erro})
+                    continue
+                lote.append(dados)
+                if len(lote) == chunk:
+                    # cada lote é repetido isoladamente, já que os anteriores foram efetivados
+                    await repete_se_ocupado(session, insere_lote, lote)
+                    inseridos += len(lote)
+                    lote = []
+            if lote:
+                await repete_se_ocupado(session, insere_lote, lote)
+                inseridos += len(lote)
+        except UnicodeDecodeError:
+            # os lotes anteriores ao erro permanecem inseridos
+            error_msg = "O arquivo deve estar codificado em UTF-8 :/"
+            logger.warning("Erro na importação em lote após %d livros, %s", inseridos, error_msg)
+            return resposta({"mensagem": error_msg}, 400)
+        except OperationalError as e:
+            if not banco_ocupado(e): raise
+            error_msg = "Banco de dados ocupado, tente novamente"
+            logger.warning("Erro na importação em lote após %d livros, %s", inseridos, error_msg)
+            return resposta({"mensagem": error_msg}, 503)
+
+    return resposta({"inseridos": inseridos, "erros": erros})
+
+
+@app.get('/livros', tags=[livro_tag],
+         responses=documenta({"200": ListagemLivrosSchema, "400": ErrorSchema, "404": ErrorSchema}))
+async def get_livros(request: Request, query: Annotated[ListagemBuscaSchema, Query()], session: Sessao):
+    """Faz a busca por todos os Livros cadastrados
+
+    Aceita os mesmos parâmetros da listagem de app.py: limit, after_id,
+    stream, fields e since.
+    """
+    try:
+        campos = valida_listagem(query, CAMPOS_LISTAGEM_LIVRO)
+    except ValueError as e:
+        logger.warning("Erro ao listar livros, %s", e)
+        return resposta({"mensagem": str(e)}, 400)
+    colunas = consultas.colunas_livros(campos)
+    return await lista(request, session, query, Livro, LivroRemovido.id, "livros", campos, colunas,
+                       apresenta_livro_linha, {"livros": "Não há livros cadatrados"})
+
+
+@app.get('/livros/disponibilidade', tags=[livro_tag],
+         responses=documenta({"200": ListagemDisponibilidadeSchema}))
+async def get_disponibilidade(request: Request, query: Annotated[DisponibilidadeBuscaSchema, Query()],
+                              session: Sessao):
+    """Faz a busca pela quantidade total e de cópias disponíveis de cada título
+
+    Aceita os mesmos parâmetros da rota de app.py: nome, limit e after.
+    """
+    etag, nao_modificado = await etag_listagem(request, session, "livro")
+    if nao_modificado:
+        return Response(status_code=304, headers={"ETag": etag})
+    consulta = consultas.consulta_disponibilidade(query.nome, query.after, query.limit)
+    titulos = (await session.scalars(consulta)).all()
+    return resposta(apresenta_disponibilidade(titulos, query.limit), headers={"ETag": etag})
+
+@app.get('/livro', tags=[livro_tag],
+         responses=documenta({"200": LivroViewSchema, "404": ErrorSchema}))
+async def get_livro(query: Annotated[LivroBuscaSchema, Query()], session: Sessao):
+    """Faz a busca por livros a partir do nome
+
+    Retorna uma representação dos livros.
+    """
+    livro_nome = query.nome
+    # livros buscados recentemente são respondidos pelo cache; a geração é lida
+    # antes da busca, como em app.py
+    geracao = cache_livros.geracao
+    resultado = cache_livros.get(livro_nome)
+    if resultado is not AUSENTE:
+        return resposta(resultado)
+    livros = (await session.scalars(select(Livro).where(Livro.nome == livro_nome))).all()
+    if not livros:
+        error_msg = "Livro não encontrado na base :/"
+        logger.warning("Erro ao buscar livro '%s', %s", livro_nome, error_msg)
+        return resposta({"mensagem": error_msg}, 404)
+    resultado = apresenta_livros(livros)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Livros encontrados: '%s'", resultado)
+    cache_livros.set(livro_nome, resultado, geracao)
+    return resposta(resultado)
+
+
+@app.get('/livros/busca', tags=[livro_tag],
+         responses=documenta({"200": ListagemLivrosSchema, "404": ErrorSchema}))
+async def busca_livros(query: Annotated[LivroBuscaTextoSchema, Query()], session: Sessao):
+    """Faz a busca textual de livros pelo nome, autor ou editora
+
+    Retorna uma representação dos livros encontrados, do mais relevante para o menos relevante.
+    """
+    # limita a quantidade de resultados entre 1 e 100
+    limite = min(max(query.limite, 1), 100)
+    ids = await session.run_sync(busca_livros_ids, query.q, limite)
+    livros = (await session.scalars(select(Livro).where(Livro.id.in_(ids)))).all() if ids else []
+    if not livros:
+        error_msg = "Nenhum livro encontrado para a busca :/"
+        logger.warning("Erro ao buscar livros por '%s', %s", query.q, error_msg)
+        return resposta({"mensagem": error_msg}, 404)
+    # mantém a ordem de relevância retornada pelo índice
+    posicao = {livro_id: i for i, livro_id in enumerate(ids)}
+    return resposta(apresenta_livros(sorted(livros, key=lambda livro: posicao[livro.id])))
+
+
+@app.delete('/livro', tags=[livro_tag],
+            responses=documenta({"200": LivroDelSchema, "404": ErrorSchema, "503": ErrorSchema}))
+@com_retry
+async def del_livro(query: Annotated[LivroBuscaIdSchema, Query()], session: Sessao):
+    """Deleta um livro a partir do id informado
+
+    Retorna uma mensagem de confirmação da remoção.
+    """
+    livro = (await session.execute(
+        delete(Livro).where(Livro.id == query.id).returning(Livro.id, Livro.nome))).first()
+    if not livro:
+        error_msg = "Livro não encontrado na base :/"
+        logger.warning("Erro ao deletar livro #'%s', %s", query.id, error_msg)
+        return resposta({"mensagem": error_msg}, 404)
+    await session.run_sync(incrementa_versao, "livro")
+    await session.commit()
+    cache_livros.invalida(livro.nome)
+    return resposta({"mensagem": "Livro removido", "id": livro.id, "nome": livro.nome})
+
+
+@app.delete('/livros', tags=[livro_tag],
+            responses=documenta({"200": LivrosDelSchema, "400": ErrorSchema, "500": ErrorSchema,
+                                 "503": ErrorSchema}))
+@com_retry
+async def del_livros(session: Sessao):
+    """Deleta TODOS os livros da base de dados, use com cuidado !!!"""
+    try:
+        if not await session.scalar(select(Livro.id).limit(1)):
+            logger.warning("Erro ao deletar todos os livros, a base de livros já está vazia")
+            return resposta({"mensagem": "A base de livros já está vazia"}, 400)
+        await session.execute(delete(Livro))
+        await session.run_sync(incrementa_versao, "livro")
+        await session.commit()
+        cache_livros.limpa()
+        return resposta({"message": "Todos os livros foram deletados com sucesso"})
+    except Exception as e:
+        if banco_ocupado(e): raise
+        logger.debug(e)
+        return resposta({"mensagem": "Algo deu errado"}, 500)
+
+
+@app.put('/livro', tags=[livro_tag],
+         responses=documenta({"200": LivroEmprestadoSchema, "404": ErrorSchema, "409": ErrorSchema,
+                               "500": ErrorSchema, "503": ErrorSchema}))
+@com_retry
+async def empresta_livro(query: Annotated[LivroEmprestaSchema, Query()], session: Sessao):
+    """Empresta um livro da biblioteca a um usuário, caso ele não esteja emprestado"""
+    try:
+        # mesmo UPDATE condicional de app.py: só um entre empréstimos concorrentes vence
+        livro = (await session.execute(consultas.empresta_livro(query.livro_id, query.usuario_nome))).first()
+        if livro:
+            await session.run_sync(incrementa_versao, "livro")
+            await session.commit()
+            cache_livros.invalida(livro.nome)
+            msg = f"O livro de id: {livro.id}, {livro.nome}, foi emprestado para {query.usuario_nome}"
+            return resposta({"mensagem": msg})
+
+        # nenhuma linha foi alterada, busca o motivo para informar ao usuário
+        await session.rollback()
+        if not await session.get(Livro, query.livro_id):
+            return resposta({"mensagem": f"livro de id #{query.livro_id} não encontrado"}, 404)
+        if not await session.scalar(consultas.usuario_por_nome(query.usuario_nome)):
+            return resposta({"mensagem": f"Usuário de nome {query.usuario_nome} não encontrado"}, 404)
+        return resposta({"mensagem": f"livro de id #{query.livro_id} já está emprestado"}, 409)
+    except Exception as e:
+        if banco_ocupado(e): raise
+        return resposta({"mensagem": "Erro não identificado: %s" % e}, 500)
+
+
+@app.put('/livroDevolve', tags=[livro_tag],
+         responses=documenta({"200": LivroDevolvidoSchema, "404": ErrorSchema, "500": ErrorSchema,
+                               "503": ErrorSchema}))
+@com_retry
+async def devolve_livro(query: Annotated[LivroDevolveSchema, Query()], session: Sessao):
+    """Devolve um livro emprestado à biblioteca"""
+    try:
+        livro_id = query.id
+        # mesmo UPDATE condicional de app.py: só uma entre devoluções concorrentes vence
+        livro = (await session.execute(consultas.devolve_livro(livro_id))).first()
+        if livro:
+            await session.run_sync(incrementa_versao, "livro")
+            await session.commit()
+            cache_livros.invalida(livro.nome)
+            return resposta({"mensagem": f"O livro de id: {livro.id}, {livro.nome}, foi devolvido."})
+
+        # nenhuma linha foi alterada, busca o motivo para informar ao usuário
+        await session.rollback()
+        if not await session.get(Livro, livro_id):
+            return resposta({"mensagem": f"livro de id #{livro_id} não encontrado"}, 404)
+        return resposta({"mensagem": f"livro de id #{livro_id} não estava emprestado"}, 404)
+    except Exception as e:
+        if banco_ocupado(e): raise
+        return resposta({"mensagem": "Erro não identificado: %s" % e}, 500)
+
+
+@app.put('/livros/empresta', tags=[livro_tag],
+         responses=documenta({"200": LivrosLoteViewSchema, "503": ErrorSchema}))
+@com_retry
+async def empresta_livros(body: LivrosEmprestaSchema, session: Sessao):
+    """Empresta vários livros de uma vez, em uma única transação
+
+    Retorna o resultado de cada empréstimo, na ordem informada.
+    """
+    emprestimos = body.emprestimos
+    # busca todos os livros e usuários envolvidos de uma vez
+    livros = {livro.id: livro for livro in await session.execute(
+        consultas.livros_do_lote(emprestimo.livro_id for emprestimo in emprestimos))}
+    nomes = {emprestimo.usuario_nome for emprestimo in emprestimos}
+    usuarios = dict((await session.execute(
+        select(Usuario.nome, Usuario.id).where(Usuario.nome.in_(nomes)))).all())
+    resultados, aplicar = planeja_emprestimos(emprestimos, livros, usuarios)
+
+    # mesmo UPDATE condicional de app.py, que não sobrescreve um livro emprestado
+    # por outra requisição depois da leitura acima
+    if aplicar:
+        emprestados = set((await session.execute(consultas.empresta_livros(aplicar))).scalars())
+        marca_conflitos(resultados, emprestados, "livro de id #%d já está emprestado")
+
+    await session.run_sync(incrementa_versao, "livro")
+    await session.commit()
+    cache_livros.invalida(*{livro.nome for livro in livros.values()})
+    return resposta({"resultados": resultados})
+
+
+@app.put('/livros/devolve', tags=[livro_tag],
+         responses=documenta({"200": LivrosLoteViewSchema, "503": ErrorSchema}))
+@com_retry
+async def devolve_livros(body: LivrosDevolveSchema, session: Sessao):
+    """Devolve vários livros emprestados de uma vez, em uma única transação
+
+    Retorna o resultado de cada devolução, na ordem informada.
+    """
+    livros = {livro.id: livro for livro in await session.execute(consultas.livros_do_lote(body.ids))}
+    resultados, aplicar = planeja_devolucoes(body.ids, livros)
+
+    # mesmo UPDATE condicional de app.py: só devolve os livros ainda emprestados
+    # para o usuário lido acima
+    if aplicar:
+        devolvidos = set((await session.execute(consultas.devolve_livros(aplicar))).scalars())
+        marca_conflitos(resultados, devolvidos, "livro de id #%d foi alterado por outra requisição")
+
+    await session.run_sync(incrementa_versao, "livro")
+    await session.commit()
+    cache_livros.invalida(*{livro.nome for livro in livros.values()})
+    return resposta({"resultados": resultados})
+
+
+@app.get('/cache', tags=[cache_tag],
+         responses=documenta({"200": CacheViewSchema}))
+async def get_cache():
+    """Retorna os contadores de hits, misses e evictions dos caches de consulta
+    """
+    return resposta({"usuarios": cache_usuarios.estatisticas(), "livros": cache_livros.estatisticas()})
+
+
+@app.get('/metrics', tags=[metricas_tag])
+async def get_metrics():
+    """Retorna as métricas de latência por rota, dos caches, da admissão e da
+    escrita em grupo no formato de texto do Prometheus
+    """
+    return Response(exporta_metricas(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,2 @@
+# Benchmarks da API. Cada módulo é executado com python -m benchmarks.<modulo>
+# e usa um banco próprio (DB_URL), sem alterar o banco em database/.
@@ -0,0 +1,239 @@
+"""Reproduz uma mistura de requisições contra a API e mede as latências
+
+Por padrão popula um banco temporário e usa o cliente de teste do Flask;
+com --url as requisições são enviadas a um servidor já em execução e com
+--servidor o próprio driver inicia o servidor (gunicorn com app.py ou uvicorn
+com asgi.py) sobre o banco populado, para comparar os dois modos.
+
+Uso:
+    python -m benchmarks.driver --livros 100000 --threads 4 --duracao 30 --saida resultado.json
+    python -m benchmarks.driver --url http://localhost:5000 --sem-seed --mix mix.jsonl
+    python -m benchmarks.driver --servidor asgi --threads 32 --duracao 30 --saida asgi.json
+"""
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from threading import Thread, Lock
+from urllib.parse import urlsplit
+import http.client
+import subprocess
+import argparse
+import tempfile
+import random
+import json
+import time
+import os
+
+from benchmarks import report, seed
+
+
+# Mistura padrão de requisições. Cada linha de um arquivo --mix (JSONL) segue o
+# mesmo formato: method, path, peso e, opcionalmente, json (corpo) e nome. O
+# path e o corpo aceitam {livro_id}, {usuario} e {titulo}, sorteados entre os
+# valores criados pelo seeder.
+MIX_PADRAO = [
+    {"method": "GET", "path": "/livro?nome={titulo}", "peso": 30},
+    {"method": "GET", "path": "/usuario?nome={usuario}", "peso": 20},
+    {"method": "GET", "path": "/livros/busca?q={titulo}", "peso": 10},
+    {"method": "GET", "path": "/livros?limit=100", "peso": 10, "nome": "GET /livros (página)"},
+    {"method": "GET", "path": "/usuarios?limit=100", "peso": 5, "nome": "GET /usuarios (página)"},
+    {"method": "PUT", "path": "/livro?livro_id={livro_id}&usuario_nome={usuario}", "peso": 10},
+    {"method": "PUT", "path": "/livroDevolve?id={livro_id}", "peso": 10},
+    {"method": "POST", "path": "/livro", "peso": 5,
+     "form": {"nome": "{titulo}", "autor": "Autor", "editora": "Editora"}},
+]
+
+
+def carrega_mix(caminho: str):
+    with open(caminho, encoding="utf-8") as arquivo:
+        return [json.loads(linha) for linha in arquivo if linha.strip()]
+
+
+def nome_endpoint(item: dict):
+    return item.get("nome") or "%s %s" % (item["method"], item["path"].split("?")[0])
+
+
+def preenche(valor, valores: dict):
+    """ Substitui os marcadores do path ou do corpo pelos valores sorteados
+    """
+    if isinstance(valor, str):
+        return valor.format(**valores)
+    if isinstance(valor, dict):
+        return {chave: preenche(v, valores) for chave, v in valor.items()}
+    if isinstance(valor, list):
+        return [preenche(v, valores) for v in valor]
+    return valor
+
+
+class AlvoCliente:
+    """ Envia as requisições pelo cliente de teste do Flask, no mesmo processo
+    """
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def requisita(self, method: str, path: str, corpo: dict = None, form: dict = None):
+        response = self.client.open(path, method=method, json=corpo, data=form)
+        # consome e fecha respostas transmitidas aos poucos
+        response.get_data()
+        response.close()
+        return response.status_code
+
+
+class AlvoHttp:
+    """ Envia as requisições a um servidor HTTP, mantendo a conexão aberta
+    """
+
+    def __init__(self, url: str):
+        partes = urlsplit(url)
+        self.host, self.port = partes.hostname, partes.port or 80
+        self.conexao = None
+
+    def requisita(self, method: str, path: str, corpo: dict = None, form: dict = None):
+        from urllib.parse import quote, urlencode
+        headers = {}
+        body = None
+        if corpo is not None:
+            body, headers["Content-Type"] = json.dumps(corpo), "application/json"
+        elif form is not None:
+            body, headers["Content-Type"] = urlencode(form), "application/x-www-form-urlencoded"
+        for tentativa in range(2):
+            try:
+                if self.conexao is None:
+                    self.conexao = http.client.HTTPConnection(self.host, self.port, timeout=60)
+                self.conexao.request(method, quote(path, safe="/?&=%"), body=body, headers=headers)
+                response = self.conexao.getresponse()
+                response.read()
+                return response.status
+            except (http.client.HTTPException, OSError):
+                # reconecta se o servidor fechou a conexão
+                self.conexao = None
+                if tentativa:
+                    return 599
+
+
+# comandos que iniciam o servidor de cada modo, escutando em {porta}
+SERVIDORES = {
+    "flask": ["gunicorn", "-c", "gunicorn.conf.py", "--bind", "127.0.0.1:{porta}",
+              "--workers", "{workers}", "--threads", "{threads}", "app:create_app()"],
+    "asgi": ["uvicorn", "asgi:app", "--port", "{porta}", "--workers", "{workers}",
+             "--no-access-log", "--log-level", "warning"],
+}
+
+
+@contextmanager
+def servidor(modo: str, porta: int, workers: int, threads: int):
+    """ Inicia o servidor do modo escolhido, espera ele responder e o encerra
+        ao final do bloco
+    """
+    comando = [parte.format(porta=porta, workers=workers, threads=threads) for parte in SERVIDORES[modo]]
+    processo = subprocess.Popen(comando, stdout=subprocess.DEVNULL)
+    try:
+        alvo = AlvoHttp("http://127.0.0.1:%d" % porta)
+        for tentativa in range(100):
+            if processo.poll() is not None:
+                raise RuntimeError("o servidor %s encerrou ao iniciar" % modo)
+            if alvo.requisita("GET", "/usuarios?limit=1") != 599:
+                break
+            time.sleep(0.2)
+        yield "http://127.0.0.1:%d" % porta
+    finally:
+        processo.terminate()
+        processo.wait()
+
+
+def executa(alvo_factory, mix: list, limites: dict, threads: int, duracao: float, requisicoes: int, semente: int = 0):
+    """ Executa a mistura de requisições em `threads` threads por `duracao`
+        segundos ou até completar `requisicoes` requisições
+    """
+    amostras = defaultdict(list)
+    lock = Lock()
+    restantes = [requisicoes or float("inf")]
+    fim = time.perf_counter() + duracao if duracao else float("inf")
+    pesos = [item.get("peso", 1) for item in mix]
+
+    def trabalha(numero: int):
+        aleatorio = random.Random(semente + numero)
+        alvo = alvo_factory()
+        locais = defaultdict(list)
+        while time.perf_counter() < fim:
+            with lock:
+                if restantes[0] <= 0:
+                    break
+                restantes[0] -= 1
+            item = aleatorio.choices(mix, pesos)[0]
+            valores = {
+                "livro_id": aleatorio.randint(1, max(limites["livros"], 1)),
+                "usuario": seed.nome_usuario(aleatorio.randrange(max(limites["usuarios"], 1))),
+                "titulo": seed.titulo(aleatorio.randrange(max(limites["titulos"], 1))),
+            }
+            inicio = time.perf_counter()
+            status = alvo.requisita(item["method"], preenche(item["path"], valores),
+                                    preenche(item.get("json"), valores), preenche(item.get("form"), valores))
+            locais[nome_endpoint(item)].append((time.perf_counter() - inicio, status))
+        with lock:
+            for endpoint, medidas in locais.items():
+                amostras[endpoint].extend(medidas)
+
+    inicio = time.perf_counter()
+    workers = [Thread(target=trabalha, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return amostras, time.perf_counter() - inicio
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="servidor alvo; sem ele é usado o cliente de teste do Flask")
+    parser.add_argument("--servidor", choices=sorted(SERVIDORES),
+                        help="inicia o servidor do modo escolhido e envia as requisições a ele")
+    parser.add_argument("--porta", type=int, default=5050, help="porta do servidor iniciado por --servidor")
+    parser.add_argument("--workers", type=int, default=1, help="processos do servidor iniciado por --servidor")
+    parser.add_argument("--mix", help="arquivo JSONL com a mistura de requisições")
+    parser.add_argument("--usuarios", type=int, default=1000)
+    parser.add_argument("--livros", type=int, default=10000)
+    parser.add_argument("--emprestados", type=float, default=0.3)
+    parser.add_argument("--sem-seed", action="store_true", help="não popula o banco antes de executar")
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--duracao", type=float, default=10.0, help="segundos de execução")
+    parser.add_argument("--requisicoes", type=int, default=0, help="encerra após N requisições")
+    parser.add_argument("--saida", help="salva o relatório em JSON neste arquivo")
+    args = parser.parse_args()
+
+    mix = carrega_mix(args.mix) if args.mix else MIX_PADRAO
+    if not args.url:
+        # banco temporário, para não alterar o banco em database/
+        os.environ.setdefault("DB_URL", "sqlite:///%s/benchmark.sqlite3" % tempfile.mkdtemp())
+
+    limites = {"usuarios": args.usuarios, "livros": args.livros, "titulos": max(args.livros // 3, 1)}
+    if not args.sem_seed:
+        from model import engine
+        limites = seed.popula(engine, args.usuarios, args.livros, args.emprestados)
+
+    if args.servidor:
+        contexto = servidor(args.servidor, args.porta, args.workers, args.threads)
+        alvo = "%s em %s workers" % (args.servidor, args.workers)
+    else:
+        contexto = nullcontext(args.url)
+        alvo = args.url or "flask test client"
+
+    with contexto as url:
+        if url:
+            alvo_factory = lambda: AlvoHttp(url)
+        else:
+            from app import create_app
+            app = create_app()
+            alvo_factory = lambda: AlvoCliente(app)
+        amostras, duracao = executa(alvo_factory, mix, limites, args.threads, args.duracao, args.requisicoes)
+
+    relatorio = report.resume(amostras, duracao, {
+        "alvo": alvo, "threads": args.threads, "limites": limites,
+        "mix": args.mix or "padrão"})
+    report.imprime(relatorio)
+    if args.saida:
+        report.salva(relatorio, args.saida)
+
+
+if __name__ == "__main__":
+    main()
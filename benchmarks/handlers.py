@@ -0,0 +1,53 @@
+"""Mede o custo por requisição das rotas de leitura, com o nível DEBUG desligado
+
+Uso:
+    python -m benchmarks.handlers [--livros 2000] [--repeticoes 200]
+"""
+import argparse
+import tempfile
+import time
+import os
+
+from benchmarks import seed
+
+
+# rotas medidas, chamadas pelo cliente de teste do Flask
+ROTAS = [
+    "/livros",
+    "/livro?nome=Titulo 7",
+    "/usuarios",
+    "/usuario?nome=Usuario 7",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--livros", type=int, default=2000)
+    parser.add_argument("--repeticoes", type=int, default=200)
+    args = parser.parse_args()
+
+    # banco temporário e cache desligado, para medir o trabalho real das rotas
+    os.environ.setdefault("DB_URL", "sqlite:///%s/benchmark.sqlite3" % tempfile.mkdtemp())
+    os.environ["CACHE_TAMANHO"] = "0"
+    from app import create_app
+    from model import engine
+    from logger import logger
+    import logging
+
+    logging.getLogger().setLevel(logging.INFO)
+    app = create_app()
+    seed.popula(engine, max(args.livros // 10, 1), args.livros, emprestados=0.5)
+    client = app.test_client()
+
+    print("DEBUG habilitado: %s" % logger.isEnabledFor(logging.DEBUG))
+    for rota in ROTAS:
+        client.get(rota)
+        inicio = time.perf_counter()
+        for _ in range(args.repeticoes):
+            client.get(rota)
+        duracao = (time.perf_counter() - inicio) / args.repeticoes
+        print("%-30s %10.1f us/req" % (rota, duracao * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Resume as latências coletadas pelo driver e compara resultados salvos
+
+Uso:
+    python -m benchmarks.report resultado_a.json resultado_b.json
+"""
+from datetime import datetime
+import argparse
+import subprocess
+import json
+import math
+
+
+def percentil(valores: list, p: float):
+    """ Percentil p (0-100) pelo método nearest-rank; valores deve estar ordenado
+    """
+    if not valores:
+        return 0.0
+    return valores[max(math.ceil(p / 100 * len(valores)) - 1, 0)]
+
+
+def commit_atual():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def resume(amostras: dict, duracao: float, config: dict = None):
+    """ Monta o relatório a partir das amostras {endpoint: [(latência, status), ...]}
+        coletadas em `duracao` segundos
+    """
+    endpoints = {}
+    for endpoint, medidas in sorted(amostras.items()):
+        latencias = sorted(latencia for latencia, status in medidas)
+        erros = sum(1 for latencia, status in medidas if status >= 500)
+        endpoints[endpoint] = {
+            "requisicoes": len(medidas),
+            "erros": erros,
+            "throughput": len(medidas) / duracao if duracao else 0.0,
+            "p50_ms": percentil(latencias, 50) * 1000,
+            "p95_ms": percentil(latencias, 95) * 1000,
+            "p99_ms": percentil(latencias, 99) * 1000,
+            "max_ms": latencias[-1] * 1000 if latencias else 0.0,
+        }
+    total = sum(len(medidas) for medidas in amostras.values())
+    return {
+        "commit": commit_atual(),
+        "data": datetime.now().isoformat(timespec="seconds"),
+        "config": config or {},
+        "duracao_s": duracao,
+        "requisicoes": total,
+        "throughput": total / duracao if duracao else 0.0,
+        "endpoints": endpoints,
+    }
+
+
+def imprime(relatorio: dict):
+    print("commit %s, %d requisições em %.1fs (%.1f req/s)" % (
+        relatorio["commit"], relatorio["requisicoes"], relatorio["duracao_s"], relatorio["throughput"]))
+    print("%-40s %8s %8s %10s %10s %10s %8s" % ("endpoint", "req", "req/s", "p50 ms", "p95 ms", "p99 ms", "erros"))
+    for endpoint, r in relatorio["endpoints"].items():
+        print("%-40s %8d %8.1f %10.2f %10.2f %10.2f %8d" % (
+            endpoint, r["requisicoes"], r["throughput"], r["p50_ms"], r["p95_ms"], r["p99_ms"], r["erros"]))
+
+
+def salva(relatorio: dict, caminho: str):
+    with open(caminho, "w", encoding="utf-8") as arquivo:
+        json.dump(relatorio, arquivo, indent=2, ensure_ascii=False)
+
+
+def compara(base: dict, novo: dict):
+    """ Imprime a variação de throughput e p99 de cada endpoint entre dois relatórios
+    """
+    print("%s -> %s" % (base["commit"], novo["commit"]))
+    print("%-40s %12s %12s %12s %12s" % ("endpoint", "req/s", "variação", "p99 ms", "variação"))
+    for endpoint, r in novo["endpoints"].items():
+        antes = base["endpoints"].get(endpoint)
+        if not antes:
+            print("%-40s %12.1f %12s %12.2f %12s" % (endpoint, r["throughput"], "-", r["p99_ms"], "-"))
+            continue
+        print("%-40s %12.1f %+11.1f%% %12.2f %+11.1f%%" % (
+            endpoint, r["throughput"], variacao(antes["throughput"], r["throughput"]),
+            r["p99_ms"], variacao(antes["p99_ms"], r["p99_ms"])))
+
+
+def variacao(antes: float, depois: float):
+    return (depois - antes) / antes * 100 if antes else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("base")
+    parser.add_argument("novo")
+    args = parser.parse_args()
+    with open(args.base, encoding="utf-8") as base, open(args.novo, encoding="utf-8") as novo:
+        compara(json.load(base), json.load(novo))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Popula as tabelas usuario e livro com dados sintéticos
+
+Uso:
+    DB_URL=sqlite:///benchmark.sqlite3 python -m benchmarks.seed --usuarios 10000 --livros 1000000
+"""
+from datetime import datetime
+import argparse
+import random
+import time
+
+
+# volume de linhas inseridas por executemany
+LOTE = 20000
+
+
+def nome_usuario(i: int):
+    return "Usuario %d" % i
+
+
+def titulo(i: int):
+    return "Titulo %d" % i
+
+
+def gera_livros(livros: int, usuarios_ids: list, emprestados: float, copias: int, aleatorio: random.Random):
+    """ Gera os livros em ordem, com em média `copias` cópias de cada título e
+        uma fração `emprestados` deles emprestada a usuários aleatórios
+    """
+    titulos = max(livros // copias, 1)
+    agora = datetime.now()
+    for i in range(livros):
+        t = aleatorio.randrange(titulos)
+        yield {
+            "nome": titulo(t),
+            "autor": "Autor %d" % (t % 5000),
+            "editora": "Editora %d" % (t % 200),
+            "emprestado_para_id": aleatorio.choice(usuarios_ids) if usuarios_ids and aleatorio.random() < emprestados else None,
+            "data_insercao": agora,
+        }
+
+
+def insere_em_lotes(conn, tabela, linhas):
+    """ Insere as linhas em lotes de LOTE, sem manter todas em memória
+    """
+    lote = []
+    for linha in linhas:
+        lote.append(linha)
+        if len(lote) == LOTE:
+            conn.execute(tabela.insert(), lote)
+            lote = []
+    if lote:
+        conn.execute(tabela.insert(), lote)
+
+
+def popula(engine, usuarios: int, livros: int, emprestados: float = 0.3, copias: int = 3, semente: int = 42):
+    """ Insere `usuarios` usuários e `livros` livros, dos quais a fração
+        `emprestados` fica emprestada. Retorna os limites usados pelo driver
+        para montar as requisições.
+    """
+    from model import Usuario, Livro, VersaoTabela, init_db
+
+    init_db()
+    aleatorio = random.Random(semente)
+    with engine.begin() as conn:
+        inicio = conn.execute(Usuario.__table__.select().with_only_columns(Usuario.id).order_by(Usuario.id.desc()).limit(1)).scalar() or 0
+        insere_em_lotes(conn, Usuario.__table__, (
+            {"nome": nome_usuario(i), "idade": 18 + i % 60, "data_insercao": datetime.now()}
+            for i in range(inicio, inicio + usuarios)))
+        usuarios_ids = [row[0] for row in conn.execute(Usuario.__table__.select().with_only_columns(Usuario.id))]
+        insere_em_lotes(conn, Livro.__table__, gera_livros(livros, usuarios_ids, emprestados, copias, aleatorio))
+        conn.execute(VersaoTabela.__table__.update().values(versao=VersaoTabela.versao + 1))
+        max_livro = conn.execute(Livro.__table__.select().with_only_columns(Livro.id).order_by(Livro.id.desc()).limit(1)).scalar() or 0
+
+    return {
+        "usuarios": len(usuarios_ids),
+        "livros": max_livro,
+        "titulos": max(livros // copias, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--usuarios", type=int, default=1000)
+    parser.add_argument("--livros", type=int, default=10000)
+    parser.add_argument("--emprestados", type=float, default=0.3, help="fração dos livros emprestada")
+    parser.add_argument("--copias", type=int, default=3, help="cópias, em média, de cada título")
+    parser.add_argument("--semente", type=int, default=42)
+    args = parser.parse_args()
+
+    from model import engine
+    inicio = time.perf_counter()
+    limites = popula(engine, args.usuarios, args.livros, args.emprestados, args.copias, args.semente)
+    print("Base populada em %.1fs: %s" % (time.perf_counter() - inicio, limites))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+from collections import OrderedDict
+from threading import Lock
+import time
+import os
+
+
+# quantidade máxima de itens em cada cache (0 desabilita o cache) e tempo,
+# em segundos, que um item permanece válido. O cache é do processo: com vários
+# workers, a invalidação só alcança o worker que fez a escrita, e o TTL limita
+# por quanto tempo os demais podem responder com um dado antigo
+tamanho_padrao = int(os.environ.get("CACHE_TAMANHO", "1024"))
+ttl_padrao = float(os.environ.get("CACHE_TTL", "30"))
+
+# indica que a chave não está no cache, já que None pode ser um valor válido
+AUSENTE = object()
+
+
+class CacheLRU:
+    """ Cache em memória com descarte do item menos usado recentemente (LRU)
+        e expiração dos itens após ttl segundos
+
+    A geração do cache muda a cada invalidação. Quem busca no banco um valor
+    para guardar no cache deve ler a geração antes da consulta e informá-la ao
+    set: se uma escrita invalidou o cache nesse intervalo, o valor lido pode
+    estar desatualizado e não é guardado.
+    """
+
+    def __init__(self, nome: str, tamanho: int = tamanho_padrao, ttl: float = ttl_padrao):
+        self.nome = nome
+        self.tamanho = tamanho
+        self.ttl = ttl
+        self.itens = OrderedDict()
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.geracao = 0
+
+    def get(self, chave):
+        """ Retorna o valor guardado para a chave, ou AUSENTE
+        """
+        with self.lock:
+            item = self.itens.get(chave)
+            if item is None or item[0] < time.monotonic():
+                if item is not None:
+                    # expirado
+                    del self.itens[chave]
+                self.misses += 1
+                return AUSENTE
+            self.itens.move_to_end(chave)
+            self.hits += 1
+            return item[1]
+
+    def set(self, chave, valor, geracao: int = None):
+        """ Guarda o valor para a chave, descartando o item menos usado se o
+            cache estiver cheio. Com geracao, o valor só é guardado se o cache
+            não foi invalidado desde que a geração foi lida
+        """
+        if self.tamanho <= 0:
+            return
+        with self.lock:
+            if geracao is not None and geracao != self.geracao:
+                return
+            self.itens[chave] = (time.monotonic() + self.ttl, valor)
+            self.itens.move_to_end(chave)
+            while len(self.itens) > self.tamanho:
+                self.itens.popitem(last=False)
+                self.evictions += 1
+
+    def invalida(self, *chaves):
+        """ Remove as chaves informadas do cache
+        """
+        with self.lock:
+            self.geracao += 1
+            for chave in chaves:
+                self.itens.pop(chave, None)
+
+    def limpa(self):
+        """ Remove todos os itens do cache
+        """
+        with self.lock:
+            self.geracao += 1
+            self.itens.clear()
+
+    def estatisticas(self):
+        """ Retorna os contadores do cache
+        """
+        with self.lock:
+            return {
+                "itens": len(self.itens),
+                "tamanho": self.tamanho,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+# usuário por nome, na representação de apresenta_usuario
+cache_usuarios = CacheLRU("usuarios")
+# livros por nome, na representação de apresenta_livros
+cache_livros = CacheLRU("livros")
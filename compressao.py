@@ -0,0 +1,114 @@
+from flask import Flask, request, Response
+import zlib
+import os
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# algoritmos aceitos, em ordem de preferência do servidor quando o cliente
+# aceita mais de um com a mesma prioridade. zstd e br só são usados se as
+# bibliotecas zstandard e brotli estiverem instaladas. Vazio desliga a compressão
+algoritmos = [nome.strip() for nome in os.environ.get("COMPRESSAO_ALGORITMOS", "zstd,br,gzip").split(",")
+              if nome.strip()]
+# respostas menores que esse tamanho, em bytes, são enviadas sem compressão.
+# As transmitidas aos poucos são sempre comprimidas, já que o tamanho não é conhecido
+tamanho_minimo = int(os.environ.get("COMPRESSAO_MINIMO", "1024"))
+# nível de compressão de cada algoritmo
+niveis = {
+    "gzip": int(os.environ.get("COMPRESSAO_NIVEL_GZIP", "6")),
+    "zstd": int(os.environ.get("COMPRESSAO_NIVEL_ZSTD", "3")),
+    "br": int(os.environ.get("COMPRESSAO_NIVEL_BR", "4")),
+}
+
+# tipos de conteúdo comprimidos
+MIMETYPES = ("application/json", "text/plain", "text/csv", "text/html")
+
+
+class CompressorBrotli:
+    """ Adapta o compressor do brotli à interface compress/flush do zlib
+    """
+
+    def __init__(self, nivel: int):
+        self.compressor = brotli.Compressor(quality=nivel)
+
+    def compress(self, dados: bytes) -> bytes:
+        return self.compressor.process(dados)
+
+    def flush(self) -> bytes:
+        return self.compressor.finish()
+
+
+def cria_compressor(algoritmo: str):
+    """ Retorna um compressor incremental, com os métodos compress e flush
+    """
+    if algoritmo == "zstd":
+        return zstandard.ZstdCompressor(level=niveis["zstd"]).compressobj()
+    if algoritmo == "br":
+        return CompressorBrotli(niveis["br"])
+    # wbits 31: formato gzip (cabeçalho e checksum) em vez de zlib
+    return zlib.compressobj(niveis["gzip"], zlib.DEFLATED, 31)
+
+
+def disponiveis():
+    """ Retorna os algoritmos configurados cujas bibliotecas estão instaladas
+    """
+    instalados = {"gzip": True, "zstd": zstandard is not None, "br": brotli is not None}
+    return [nome for nome in algoritmos if instalados.get(nome)]
+
+
+def comprime_stream(pedacos, compressor):
+    """ Comprime os pedaços da resposta conforme são gerados, sem reunir o
+        corpo inteiro em memória
+    """
+    try:
+        for pedaco in pedacos:
+            if isinstance(pedaco, str):
+                pedaco = pedaco.encode()
+            dados = compressor.compress(pedaco)
+            if dados:
+                yield dados
+        yield compressor.flush()
+    finally:
+        # repassa o fechamento da resposta ao gerador original
+        if hasattr(pedacos, "close"):
+            pedacos.close()
+
+
+def comprime_resposta(response: Response):
+    """ Comprime a resposta com o algoritmo negociado pelo Accept-Encoding
+    """
+    if response.status_code != 200 or response.direct_passthrough \
+            or "Content-Encoding" in response.headers or response.mimetype not in MIMETYPES:
+        return response
+    # o conteúdo da resposta depende do Accept-Encoding da requisição
+    response.vary.add("Accept-Encoding")
+    algoritmo = request.accept_encodings.best_match(disponiveis())
+    if not algoritmo:
+        return response
+
+    if response.is_streamed:
+        response.response = comprime_stream(response.response, cria_compressor(algoritmo))
+        response.headers.pop("Content-Length", None)
+    else:
+        dados = response.get_data()
+        if len(dados) < tamanho_minimo:
+            return response
+        compressor = cria_compressor(algoritmo)
+        response.set_data(compressor.compress(dados) + compressor.flush())
+    response.headers["Content-Encoding"] = algoritmo
+    return response
+
+
+def configura_compressao(app: Flask):
+    """ Registra a compressão das respostas da aplicação
+    """
+    if disponiveis():
+        app.after_request(comprime_resposta)
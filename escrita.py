@@ -0,0 +1,140 @@
+from concurrent.futures import Future
+from threading import Lock, Thread
+import queue
+import time
+import os
+
+from model import Session, incrementa_versao
+from retry import banco_ocupado
+from logger import logger
+
+
+# com GROUP_COMMIT=1, as inserções de requisições concorrentes são efetivadas
+# juntas por uma thread de escrita, em uma única transação (um único fsync).
+# A thread espera até GROUP_COMMIT_JANELA_MS milissegundos por mais escritas
+# depois da primeira, até o limite de GROUP_COMMIT_TAMANHO escritas
+grupo_ativo = os.environ.get("GROUP_COMMIT", "0") == "1"
+tamanho_grupo = int(os.environ.get("GROUP_COMMIT_TAMANHO", "64"))
+janela_grupo = float(os.environ.get("GROUP_COMMIT_JANELA_MS", "2")) / 1000
+
+
+class EscritorEmGrupo:
+    """ Thread que efetiva as escritas enviadas por várias requisições em uma
+        transação compartilhada. Cada escrita roda em um savepoint, de forma
+        que o erro de uma (ex: IntegrityError) não desfaz as demais e é
+        levantado apenas para a requisição que a enviou
+    """
+
+    def __init__(self, tamanho: int = tamanho_grupo, janela: float = janela_grupo):
+        self.tamanho = tamanho
+        self.janela = janela
+        self.fila = queue.Queue()
+        self.thread = None
+        self.lock = Lock()
+        self.grupos = 0
+        self.escritas = 0
+
+    def executa(self, tabela: str, operacao, *args):
+        """ Envia operacao(session, *args) para a thread de escrita e espera a
+            efetivação do grupo. Retorna o resultado da operação ou levanta a
+            exceção causada por ela
+        """
+        futuro = Future()
+        self.inicia()
+        self.fila.put((tabela, operacao, args, futuro))
+        return futuro.result()
+
+    def inicia(self):
+        """ Inicia a thread de escrita, se ainda não estiver em execução
+        """
+        with self.lock:
+            if self.thread is None:
+                self.thread = Thread(target=self.processa, name="escritor-em-grupo", daemon=True)
+                self.thread.start()
+
+    def reinicia(self):
+        """ Descarta a thread e a fila herdadas em um processo filho, já que as
+            threads não sobrevivem ao fork. A thread é iniciada na próxima escrita
+        """
+        self.lock = Lock()
+        self.fila = queue.Queue()
+        self.thread = None
+
+    def processa(self):
+        fila = self.fila
+        while True:
+            pedidos = [fila.get()]
+            prazo = time.monotonic() + self.janela
+            while len(pedidos) < self.tamanho:
+                try:
+                    pedidos.append(fila.get(timeout=max(prazo - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+            self.efetiva(pedidos)
+
+    def efetiva(self, pedidos: list):
+        """ Executa as escritas do grupo em uma transação e entrega a cada
+            requisição o seu resultado, depois da efetivação
+        """
+        session = Session()
+        resultados = []
+        try:
+            # a primeira escrita abre a transação, dentro da qual são criados
+            # os savepoints (o sqlite3 só inicia a transação em um INSERT,
+            # UPDATE ou DELETE)
+            incrementa_versao(session, *{tabela for tabela, operacao, args, futuro in pedidos})
+            for tabela, operacao, args, futuro in pedidos:
+                try:
+                    with session.begin_nested():
+                        resultados.append((futuro, operacao(session, *args), None))
+                except Exception as e:
+                    if banco_ocupado(e): raise
+                    resultados.append((futuro, None, e))
+            session.commit()
+        except Exception as e:
+            # o grupo inteiro falhou, por exemplo com o banco ocupado: cada
+            # requisição recebe a exceção e pode repetir a sua escrita
+            logger.warning("Erro ao efetivar grupo de %d escritas, %s", len(pedidos), e)
+            for tabela, operacao, args, futuro in pedidos:
+                futuro.set_exception(e)
+            return
+        finally:
+            Session.remove()
+
+        self.grupos += 1
+        self.escritas += len(pedidos)
+        for futuro, resultado, erro in resultados:
+            if erro is None:
+                futuro.set_result(resultado)
+            else:
+                futuro.set_exception(erro)
+
+
+escritor = EscritorEmGrupo() if grupo_ativo else None
+if escritor:
+    os.register_at_fork(after_in_child=escritor.reinicia)
+
+
+def executa_escrita(tabela: str, operacao, *args):
+    """ Executa operacao(session, *args), incrementa a versão da tabela e
+        efetiva a transação, retornando o resultado da operação
+
+    Com GROUP_COMMIT=1 a escrita é efetivada pela thread de escrita, junto
+    com as escritas de outras requisições.
+    """
+    if escritor:
+        return escritor.executa(tabela, operacao, *args)
+    session = Session()
+    resultado = operacao(session, *args)
+    incrementa_versao(session, tabela)
+    session.commit()
+    return resultado
+
+
+def estatisticas_escrita():
+    """ Retorna quantos grupos e quantas escritas foram efetivados pela thread
+        de escrita
+    """
+    if not escritor:
+        return {"grupos": 0, "escritas": 0}
+    return {"grupos": escritor.grupos, "escritas": escritor.escritas}
@@ -0,0 +1,19 @@
+# Configuração do gunicorn:
+#   gunicorn -c gunicorn.conf.py "app:create_app()"
+#
+# Com preload_app, a aplicação é criada (e o init_db executado) uma única vez
+# no master, antes dos workers serem criados por fork.
+import os
+
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.environ.get("GUNICORN_WORKERS", "4"))
+threads = int(os.environ.get("GUNICORN_THREADS", "4"))
+preload_app = True
+
+
+def post_fork(server, worker):
+    # descarta as conexões herdadas do master sem fechá-las, já que elas
+    # continuam pertencendo a ele
+    from model import engine
+    engine.dispose(close=False)
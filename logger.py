@@ -1,14 +1,27 @@
 from logging.config import dictConfig
+from logging.handlers import QueueHandler, QueueListener
 import logging
+import atexit
+import queue
 import os
 
 
-log_path = "log/"
+# diretório dos arquivos de log, alterado por LOG_PATH (ex: nos testes)
+log_path = os.environ.get("LOG_PATH", "log/")
 # Verifica se o diretorio para armexanar os logs não existe
 if not os.path.exists(log_path):
    # então cria o diretorio
    os.makedirs(log_path)
 
+# tamanho, em bytes, a partir do qual os arquivos de log são rotacionados e
+# quantos arquivos antigos são mantidos
+log_max_bytes = int(os.environ.get("LOG_MAX_BYTES", 10 * 1024 * 1024))
+log_backup_count = int(os.environ.get("LOG_BACKUP_COUNT", "10"))
+# com LOG_ASYNC=1 os registros são escritos por uma thread separada, fora do
+# caminho das requisições, através de uma fila de até LOG_QUEUE_SIZE registros
+log_async = os.environ.get("LOG_ASYNC", "0") == "1"
+log_queue_size = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+
 
 dictConfig({
     "version": 1,
@@ -40,17 +53,17 @@ dictConfig({
         "error_file": {
             "class": "logging.handlers.RotatingFileHandler",
             "formatter": "detailed",
-            "filename": "log/gunicorn.error.log",
-            "maxBytes": 10000,
-            "backupCount": 10,
+            "filename": os.path.join(log_path, "gunicorn.error.log"),
+            "maxBytes": log_max_bytes,
+            "backupCount": log_backup_count,
             "delay": "True",
         },
         "detailed_file": {
             "class": "logging.handlers.RotatingFileHandler",
             "formatter": "detailed",
-            "filename": "log/gunicorn.detailed.log",
-            "maxBytes": 10000,
-            "backupCount": 10,
+            "filename": os.path.join(log_path, "gunicorn.detailed.log"),
+            "maxBytes": log_max_bytes,
+            "backupCount": log_backup_count,
             "delay": "True",
         }
     },
@@ -68,4 +81,67 @@ dictConfig({
 })
 
 
+
+class QueueHandlerLimitado(QueueHandler):
+    """ Envia os registros para uma fila limitada, descartando (e contando) os
+        registros que chegam com a fila cheia em vez de bloquear a requisição
+    """
+
+    def __init__(self, fila: queue.Queue):
+        super().__init__(fila)
+        self.descartados = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.descartados += 1
+
+
+# pares (handler da fila, listener) dos loggers configurados acima
+filas_de_log = []
+
+
+def ativa_log_assincrono():
+    """ Substitui os handlers dos loggers configurados por uma fila, esvaziada
+        por uma thread (QueueListener) que escreve nos handlers originais
+    """
+    for nome in ("", "gunicorn.error"):
+        log = logging.getLogger(nome)
+        handler = QueueHandlerLimitado(queue.Queue(log_queue_size))
+        listener = QueueListener(handler.queue, *log.handlers, respect_handler_level=True)
+        log.handlers = [handler]
+        listener.start()
+        filas_de_log.append((handler, listener))
+
+
+def reinicia_log_assincrono():
+    """ Recria as filas e as threads de escrita em um processo filho, já que
+        as threads não sobrevivem ao fork (ex: workers do gunicorn com preload)
+    """
+    for handler, listener in filas_de_log:
+        handler.queue = listener.queue = queue.Queue(log_queue_size)
+        listener._thread = None
+        listener.start()
+
+
+def para_log_assincrono():
+    """ Escreve os registros que ainda estão nas filas e para as threads
+    """
+    for handler, listener in filas_de_log:
+        listener.stop()
+
+
+def logs_descartados():
+    """ Retorna quantos registros foram descartados por estarem as filas cheias
+    """
+    return sum(handler.descartados for handler, listener in filas_de_log)
+
+
+if log_async:
+    ativa_log_assincrono()
+    os.register_at_fork(after_in_child=reinicia_log_assincrono)
+    atexit.register(para_log_assincrono)
+
+
 logger = logging.getLogger(__name__)
@@ -0,0 +1,219 @@
+from flask import Flask, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from collections import defaultdict
+from threading import Lock, local
+import bisect
+import time
+import os
+
+from cache import cache_usuarios, cache_livros
+from logger import logger, logs_descartados
+from escrita import estatisticas_escrita
+from admissao import classes_de_rota
+
+
+# limites (em segundos) dos buckets do histograma de latência das rotas
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# consultas que demoram ao menos SLOW_QUERY_MS milissegundos são registradas no
+# log com o seu plano de execução (EXPLAIN QUERY PLAN); um valor negativo desliga
+limite_consulta_lenta = float(os.environ.get("SLOW_QUERY_MS", "200")) / 1000
+
+# As métricas são do processo: com vários workers, cada um expõe as suas em
+# /metrics e a soma deve ser feita por quem as coleta
+lock = Lock()
+# (método, rota) -> contagem por bucket (o último é o +Inf), soma e total
+latencias = defaultdict(lambda: {"buckets": [0] * (len(BUCKETS) + 1), "soma": 0.0, "total": 0})
+# (método, rota) -> consultas SQL e tempo gasto no banco
+consultas = defaultdict(lambda: {"total": 0, "segundos": 0.0})
+
+# estado da requisição sendo tratada pela thread corrente
+requisicao = local()
+
+
+def rota_atual():
+    """ Retorna o padrão da rota da requisição corrente (ex: /livro), ou o
+        caminho quando nenhuma rota corresponde à requisição
+    """
+    return request.url_rule.rule if request.url_rule else "<sem rota>"
+
+
+def registra_requisicao(metodo: str, rota: str, duracao: float, total_consultas: int = 0, tempo_db: float = 0.0):
+    """ Soma a latência e as consultas de uma requisição às métricas da rota
+    """
+    chave = (metodo, rota)
+    with lock:
+        latencia = latencias[chave]
+        latencia["buckets"][bisect.bisect_left(BUCKETS, duracao)] += 1
+        latencia["soma"] += duracao
+        latencia["total"] += 1
+        consultas[chave]["total"] += total_consultas
+        consultas[chave]["segundos"] += tempo_db
+
+
+def inicia_requisicao():
+    """ Zera os contadores da requisição que está começando
+    """
+    requisicao.inicio = time.perf_counter()
+    requisicao.consultas = 0
+    requisicao.tempo_db = 0.0
+
+
+def finaliza_requisicao(response):
+    """ Registra a latência e as consultas da requisição e informa a
+        quantidade de consultas no header X-Query-Count
+    """
+    inicio = getattr(requisicao, "inicio", None)
+    if inicio is None:
+        return response
+    registra_requisicao(request.method, rota_atual(), time.perf_counter() - inicio,
+                        requisicao.consultas, requisicao.tempo_db)
+    response.headers["X-Query-Count"] = str(requisicao.consultas)
+    response.headers["X-DB-Time"] = "%.6f" % requisicao.tempo_db
+    requisicao.inicio = None
+    return response
+
+
+def antes_da_consulta(conn, cursor, statement, parameters, context, executemany):
+    # guardado no contexto da execução, descartado junto com ele mesmo quando a
+    # consulta falha e o after_cursor_execute não é chamado
+    context._inicio_consulta = time.perf_counter()
+
+
+def contabiliza_consulta(context):
+    """ Soma a consulta e a sua duração aos contadores da requisição corrente
+        e retorna a duração
+    """
+    duracao = time.perf_counter() - context._inicio_consulta
+    if getattr(requisicao, "inicio", None) is not None:
+        requisicao.consultas += 1
+        requisicao.tempo_db += duracao
+    return duracao
+
+
+def depois_da_consulta(conn, cursor, statement, parameters, context, executemany):
+    duracao = contabiliza_consulta(context)
+    if 0 <= limite_consulta_lenta <= duracao:
+        registra_consulta_lenta(conn, statement, parameters, executemany, duracao)
+
+
+def erro_na_consulta(exception_context):
+    """ Contabiliza as consultas que falharam (ex: IntegrityError), para as
+        quais o after_cursor_execute não é chamado
+    """
+    context = exception_context.execution_context
+    if context is not None and hasattr(context, "_inicio_consulta"):
+        contabiliza_consulta(context)
+
+
+def plano_de_execucao(conn, statement, parameters):
+    """ Retorna o plano de execução da consulta, obtido direto na conexão do
+        sqlite3 para não passar pelos eventos da engine
+    """
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        cursor.execute("EXPLAIN QUERY PLAN " + statement, parameters)
+        return " / ".join(linha[-1] for linha in cursor.fetchall())
+    except Exception as e:
+        return "indisponível (%s)" % e
+    finally:
+        cursor.close()
+
+
+def registra_consulta_lenta(conn, statement, parameters, executemany, duracao):
+    """ Registra no log a consulta lenta, os parâmetros, a duração, a rota que
+        a executou e o seu plano de execução
+    """
+    rota = "%s %s" % (request.method, rota_atual()) if has_request_context() else "<fora de requisição>"
+    if executemany or not statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE", "INSERT", "WITH")):
+        # um executemany possui vários conjuntos de parâmetros e um mesmo plano
+        plano = "não gerado"
+        parameters = "%d conjuntos de parâmetros" % len(parameters) if executemany else parameters
+    else:
+        plano = plano_de_execucao(conn, statement, parameters)
+    logger.warning("Consulta lenta (%.1f ms) em %s: %s | parâmetros: %s | plano: %s",
+                   duracao * 1000, rota, " ".join(statement.split()), parameters, plano)
+
+
+def instrumenta_app(app: Flask):
+    """ Registra a medição de latência em todas as rotas da aplicação
+    """
+    app.before_request(inicia_requisicao)
+    app.after_request(finaliza_requisicao)
+
+
+def instrumenta_engine(engine: Engine):
+    """ Registra a contagem e a medição de tempo das consultas da engine
+    """
+    if event.contains(engine, "before_cursor_execute", antes_da_consulta):
+        # a engine já foi instrumentada por outra aplicação do processo
+        return
+    event.listen(engine, "before_cursor_execute", antes_da_consulta)
+    event.listen(engine, "after_cursor_execute", depois_da_consulta)
+    event.listen(engine, "handle_error", erro_na_consulta)
+
+
+def formata_labels(**labels):
+    return "{%s}" % ",".join('%s="%s"' % (nome, str(valor).replace('"', '\\"'))
+                             for nome, valor in labels.items())
+
+
+def exporta_metricas():
+    """ Retorna as métricas no formato de texto do Prometheus
+    """
+    linhas = [
+        "# HELP http_request_duration_seconds Latência das requisições por rota.",
+        "# TYPE http_request_duration_seconds histogram",
+    ]
+    with lock:
+        for (metodo, rota), latencia in sorted(latencias.items()):
+            acumulado = 0
+            for limite, quantidade in zip(BUCKETS + ("+Inf",), latencia["buckets"]):
+                acumulado += quantidade
+                linhas.append("http_request_duration_seconds_bucket%s %d" % (
+                    formata_labels(method=metodo, route=rota, le=limite), acumulado))
+            labels = formata_labels(method=metodo, route=rota)
+            linhas.append("http_request_duration_seconds_sum%s %.6f" % (labels, latencia["soma"]))
+            linhas.append("http_request_duration_seconds_count%s %d" % (labels, latencia["total"]))
+
+        linhas.append("# HELP db_queries_total Consultas SQL executadas por rota.")
+        linhas.append("# TYPE db_queries_total counter")
+        for (metodo, rota), valores in sorted(consultas.items()):
+            linhas.append("db_queries_total%s %d" % (formata_labels(method=metodo, route=rota), valores["total"]))
+        linhas.append("# HELP db_query_duration_seconds_total Tempo gasto no banco por rota.")
+        linhas.append("# TYPE db_query_duration_seconds_total counter")
+        for (metodo, rota), valores in sorted(consultas.items()):
+            linhas.append("db_query_duration_seconds_total%s %.6f" % (
+                formata_labels(method=metodo, route=rota), valores["segundos"]))
+
+    for nome, tipo, campo in (("cache_hits_total", "counter", "hits"),
+                              ("cache_misses_total", "counter", "misses"),
+                              ("cache_evictions_total", "counter", "evictions"),
+                              ("cache_items", "gauge", "itens")):
+        linhas.append("# TYPE %s %s" % (nome, tipo))
+        for cache in (cache_usuarios, cache_livros):
+            linhas.append("%s%s %d" % (nome, formata_labels(cache=cache.nome), cache.estatisticas()[campo]))
+
+    admissao = {nome: classe.estatisticas() for nome, classe in sorted(classes_de_rota.items())}
+    for nome, tipo, campo, descricao in (
+            ("admission_rejected_total", "counter", "rejeitadas", "Requisições rejeitadas com 503 pelo limite da classe de rotas."),
+            ("admission_queue_depth", "gauge", "esperando", "Requisições esperando por uma vaga na classe de rotas."),
+            ("admission_in_flight", "gauge", "ativas", "Requisições em execução na classe de rotas.")):
+        linhas.append("# HELP %s %s" % (nome, descricao))
+        linhas.append("# TYPE %s %s" % (nome, tipo))
+        for classe, valores in admissao.items():
+            linhas.append("%s%s %d" % (nome, formata_labels(route_class=classe), valores[campo]))
+
+    escrita = estatisticas_escrita()
+    linhas.append("# HELP db_group_commits_total Transações efetivadas pela escrita em grupo.")
+    linhas.append("# TYPE db_group_commits_total counter")
+    linhas.append("db_group_commits_total %d" % escrita["grupos"])
+    linhas.append("# HELP db_group_commit_writes_total Escritas enviadas à escrita em grupo.")
+    linhas.append("# TYPE db_group_commit_writes_total counter")
+    linhas.append("db_group_commit_writes_total %d" % escrita["escritas"])
+
+    linhas.append("# HELP log_records_dropped_total Registros de log descartados com a fila cheia.")
+    linhas.append("# TYPE log_records_dropped_total counter")
+    linhas.append("log_records_dropped_total %d" % logs_descartados())
+    return "\n".join(linhas) + "\n"
@@ -1,31 +1,117 @@
 from sqlalchemy_utils import database_exists, create_database
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy import create_engine, event, pool
 import os
 
 # importando os elementos definidos no modelo
 from model.base import Base
 from model.usuario import Usuario
 from model.livro import Livro
+from model.disponibilidade import LivroDisponibilidade
+from model.removido import LivroRemovido, UsuarioRemovido
+from model.versao import VersaoTabela, incrementa_versao, versao_tabela
+from model.migracoes import aplica_migracoes
 
 db_path = "database/"
-# Verifica se o diretorio não existe
-if not os.path.exists(db_path):
-   # então cria o diretorio
-   os.makedirs(db_path)
 
 # url de acesso ao banco (essa é uma url de acesso ao sqlite local)
-db_url = 'sqlite:///%s/db.sqlite3' % db_path
+db_url = os.environ.get("DB_URL", 'sqlite:///%s/db.sqlite3' % db_path)
+
+# classes de pool de conexões que podem ser escolhidas pela variável DB_POOL_CLASS
+POOL_CLASSES = {
+    "queue": pool.QueuePool,
+    "null": pool.NullPool,
+    "static": pool.StaticPool,
+    "singleton": pool.SingletonThreadPool,
+}
+
+
+def engine_options():
+    """ Monta os parâmetros da engine a partir das variáveis de ambiente
+
+    DB_POOL_CLASS: queue, null, static ou singleton (padrão: queue)
+    DB_POOL_SIZE / DB_MAX_OVERFLOW: tamanho do pool (apenas para queue)
+    DB_CHECK_SAME_THREAD: 1 para manter a checagem de thread do sqlite3
+    DB_BUSY_TIMEOUT: segundos que uma conexão espera por um lock do sqlite
+    """
+    pool_class = POOL_CLASSES[os.environ.get("DB_POOL_CLASS", "queue").lower()]
+    options = {
+        "poolclass": pool_class,
+        "connect_args": {
+            # a sessão é usada por uma única thread por vez, mas o pool pode
+            # entregar a conexão a threads diferentes ao longo do tempo
+            "check_same_thread": os.environ.get("DB_CHECK_SAME_THREAD", "0") == "1",
+            "timeout": float(os.environ.get("DB_BUSY_TIMEOUT", "5")),
+        },
+    }
+    if pool_class is pool.QueuePool:
+        options["pool_size"] = int(os.environ.get("DB_POOL_SIZE", "5"))
+        options["max_overflow"] = int(os.environ.get("DB_MAX_OVERFLOW", "10"))
+    return options
+
 
 # cria a engine de conexão com o banco
-engine = create_engine(db_url, echo=False)
+engine = create_engine(db_url, echo=False, **engine_options())
+
+
+# modo de armazenamento do sqlite: "default" mantém o journal padrão (rollback),
+# "wal" habilita o write-ahead log, que permite leituras concorrentes com uma
+# escrita e reduz os fsyncs por commit
+storage_mode = os.environ.get("DB_STORAGE_MODE", "default").lower()
+
+
+@event.listens_for(engine, "connect")
+def configura_sqlite(dbapi_connection, connection_record):
+    """ Aplica os pragmas do modo de armazenamento a cada nova conexão
+
+    DB_MMAP_SIZE: bytes do arquivo mapeados em memória (padrão: 256MB)
+    DB_CACHE_SIZE: tamanho do cache de páginas, negativo em KiB (padrão: 64MB)
+    """
+    if storage_mode != "wal":
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA mmap_size=%d" % int(os.environ.get("DB_MMAP_SIZE", 256 * 1024 * 1024)))
+    cursor.execute("PRAGMA cache_size=%d" % int(os.environ.get("DB_CACHE_SIZE", -64000)))
+    cursor.close()
+
+
+# Instancia um criador de seção com o banco. A seção é única por thread
+# (e portanto por requisição) e deve ser liberada com Session.remove() ao
+# final de cada requisição
+Session = scoped_session(sessionmaker(bind=engine))
+
+# indica se init_db já foi executado neste processo
+banco_iniciado = False
+
+
+def init_db():
+    """ Cria o banco e as tabelas, caso não existam, e aplica as migrações.
+
+    Deve ser executado uma única vez, antes de atender requisições: pela
+    create_app ou, com o gunicorn em modo preload, pelo master antes de criar
+    os workers. Importar o model não acessa o banco.
+    """
+    global banco_iniciado
+    if banco_iniciado:
+        return
+
+    # Verifica se o diretorio não existe
+    if not os.path.exists(db_path):
+       # então cria o diretorio
+       os.makedirs(db_path)
+
+    # cria o banco se ele não existir 
+    if not database_exists(engine.url):
+        create_database(engine.url) 
 
-# Instancia um criador de seção com o banco
-Session = sessionmaker(bind=engine)
+    # cria as tabelas do banco, caso não existam
+    Base.metadata.create_all(engine)
 
-# cria o banco se ele não existir 
-if not database_exists(engine.url):
-    create_database(engine.url) 
+    # atualiza bancos já existentes, que o create_all não altera
+    aplica_migracoes(engine)
 
-# cria as tabelas do banco, caso não existam
-Base.metadata.create_all(engine)
+    # fecha as conexões abertas aqui, que não podem ser herdadas pelos workers
+    engine.dispose()
+    banco_iniciado = True
@@ -0,0 +1,40 @@
+from sqlalchemy import and_, or_, select
+from sqlalchemy.orm import Query
+from datetime import datetime, timedelta
+from typing import Optional
+import os
+
+
+# segundos que uma alteração espera antes de aparecer nas listagens com since.
+# A data de atualização é gerada antes da escrita obter o lock do banco, então
+# uma escrita que esperou pelo lock pode ser efetivada com uma data anterior à
+# de outra já efetivada. O atraso deve cobrir essa espera (DB_BUSY_TIMEOUT)
+atraso = float(os.environ.get("SINCE_ATRASO", os.environ.get("DB_BUSY_TIMEOUT", "5")))
+
+
+def filtra_alteracoes(consulta: Query, modelo, desde: datetime, after_id: Optional[int] = None):
+    """ Restringe a consulta às linhas alteradas a partir de desde, ordenadas
+        pela data de atualização e pelo id. Com after_id, as linhas alteradas
+        exatamente em desde são retornadas apenas se o id for maior que after_id
+    """
+    if desde.tzinfo is not None:
+        # as datas são gravadas no horário local, sem fuso
+        desde = desde.astimezone().replace(tzinfo=None)
+    coluna = modelo.data_atualizacao
+    if after_id is None:
+        consulta = consulta.filter(coluna >= desde)
+    else:
+        consulta = consulta.filter(or_(coluna > desde, and_(coluna == desde, modelo.id > after_id)))
+    limite = datetime.now() - timedelta(seconds=atraso)
+    return consulta.filter(coluna <= limite).order_by(coluna, modelo.id)
+
+
+def filtra_remocoes(chave, desde: datetime, after_id: Optional[int] = None, limit: Optional[int] = None):
+    """ Retorna a consulta às remoções registradas a partir de desde, na mesma
+        ordem e com o mesmo cursor de filtra_alteracoes. chave é a coluna de
+        LivroRemovido ou UsuarioRemovido que identifica o item nas listagens
+    """
+    removido = chave.class_
+    consulta = select(chave.label("chave"), removido.id, removido.data_atualizacao)
+    consulta = filtra_alteracoes(consulta, removido, desde, after_id)
+    return consulta.limit(limit) if limit else consulta
@@ -0,0 +1,36 @@
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from typing import List
+import re
+
+
+# pesos do bm25 para as colunas nome, autor e editora de livro_fts:
+# um termo encontrado no título vale mais que no autor, que vale mais que na editora
+PESOS_BM25 = (10.0, 5.0, 1.0)
+
+
+def consulta_fts(texto: str):
+    """ Converte o texto digitado pelo usuário em uma consulta FTS5 em que
+        todos os termos devem aparecer, cada um casando também como prefixo.
+
+    Retorna None se o texto não possuir nenhum termo pesquisável.
+    """
+    termos = re.findall(r"\w+", texto)
+    if not termos:
+        return None
+    # as aspas impedem que os termos sejam interpretados como operadores do FTS5
+    return " ".join('"%s"*' % termo for termo in termos)
+
+
+def busca_livros_ids(session: Session, texto: str, limite: int) -> List[int]:
+    """ Retorna os ids dos livros que casam com o texto, do mais relevante
+        para o menos relevante
+    """
+    consulta = consulta_fts(texto)
+    if not consulta:
+        return []
+    resultado = session.execute(
+        text("SELECT rowid FROM livro_fts WHERE livro_fts MATCH :consulta "
+             "ORDER BY bm25(livro_fts, %s, %s, %s) LIMIT :limite" % PESOS_BM25),
+        {"consulta": consulta, "limite": limite})
+    return [row[0] for row in resultado]
@@ -0,0 +1,139 @@
+from sqlalchemy import case, select, update
+from sqlalchemy.sql import Select, Update
+from datetime import datetime
+from typing import Iterable, Optional
+
+from model.livro import Livro
+from model.usuario import Usuario
+from model.disponibilidade import LivroDisponibilidade
+from model.alteracoes import filtra_alteracoes
+
+
+# Consultas montadas da mesma forma por app.py e asgi.py, que diferem apenas
+# na execução (seção síncrona ou assíncrona)
+
+
+def colunas_usuarios(campos: tuple) -> list:
+    """ Retorna as colunas dos campos pedidos na listagem de usuários
+    """
+    return [getattr(Usuario, campo) for campo in campos]
+
+
+def colunas_livros(campos: tuple) -> list:
+    """ Retorna as colunas dos campos pedidos na listagem de livros, sem
+        instanciar os livros. O nome do usuário do empréstimo vem de uma
+        subconsulta pela chave primária, buscada apenas se emprestado_para foi pedido
+    """
+    colunas = [getattr(Livro, campo) for campo in campos if campo not in ("id", "emprestado_para")]
+    if "emprestado_para" in campos:
+        colunas.append(select(Usuario.nome).where(Usuario.id == Livro.emprestado_para_id)
+                       .scalar_subquery().label("emprestado_para"))
+    return colunas
+
+
+def consulta_listagem(modelo, colunas: list, since: Optional[datetime] = None,
+                      after_id: Optional[int] = None, limit: Optional[int] = None) -> Select:
+    """ Retorna a consulta de uma página da listagem de usuários ou de livros:
+        ordenada pelo id e paginada por after_id ou, com since, apenas as
+        linhas alteradas a partir dessa data, ordenadas pela data de alteração
+    """
+    consulta = select(modelo.id, *colunas)
+    if since is not None:
+        consulta = filtra_alteracoes(consulta.add_columns(modelo.data_atualizacao),
+                                     modelo, since, after_id)
+    else:
+        consulta = consulta.order_by(modelo.id)
+        if after_id is not None:
+            consulta = consulta.where(modelo.id > after_id)
+    if limit:
+        consulta = consulta.limit(limit)
+    return consulta
+
+
+def consulta_disponibilidade(nome: Optional[str] = None, after: Optional[str] = None,
+                             limit: Optional[int] = None) -> Select:
+    """ Retorna a consulta de uma página da disponibilidade dos títulos,
+        ordenada e paginada pelo nome
+    """
+    consulta = select(LivroDisponibilidade).order_by(LivroDisponibilidade.nome)
+    if nome is not None:
+        consulta = consulta.where(LivroDisponibilidade.nome == nome)
+    if after is not None:
+        consulta = consulta.where(LivroDisponibilidade.nome > after)
+    if limit:
+        consulta = consulta.limit(limit)
+    return consulta
+
+
+def usuario_por_nome(nome: str) -> Select:
+    """ Retorna a consulta ao id do usuário de nome informado
+    """
+    return select(Usuario.id).where(Usuario.nome == nome)
+
+
+def empresta_livro(livro_id: int, usuario_nome: str) -> Update:
+    """ Retorna o UPDATE condicional que empresta o livro ao usuário apenas se
+        o livro não estiver emprestado e o usuário existir: entre empréstimos
+        concorrentes só um altera a linha. Retorna o id e o nome do livro emprestado
+    """
+    usuario = usuario_por_nome(usuario_nome)
+    return (
+        update(Livro)
+        .where(Livro.id == livro_id, Livro.emprestado_para_id.is_(None), usuario.exists())
+        .values(emprestado_para_id=usuario.scalar_subquery())
+        .returning(Livro.id, Livro.nome)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def devolve_livro(livro_id: int) -> Update:
+    """ Retorna o UPDATE condicional que devolve o livro apenas se ele estiver
+        emprestado: entre devoluções concorrentes só uma altera a linha, e um
+        novo empréstimo feito depois dela não é desfeito por uma devolução
+        atrasada. Retorna o id e o nome do livro devolvido
+    """
+    return (
+        update(Livro)
+        .where(Livro.id == livro_id, Livro.emprestado_para_id.is_not(None))
+        .values(emprestado_para_id=None)
+        .returning(Livro.id, Livro.nome)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def livros_do_lote(ids: Iterable[int]) -> Select:
+    """ Retorna a consulta às colunas usadas pelas operações em lote, sem
+        instanciar os livros
+    """
+    return select(Livro.id, Livro.nome, Livro.emprestado_para_id).where(Livro.id.in_(set(ids)))
+
+
+def empresta_livros(aplicar: dict) -> Update:
+    """ Retorna o UPDATE condicional que empresta cada livro de aplicar (id do
+        livro -> id do usuário) que ainda não estiver emprestado, sem
+        sobrescrever um empréstimo feito por outra requisição depois da
+        leitura do lote. Retorna os ids emprestados
+    """
+    return (
+        update(Livro)
+        .where(Livro.id.in_(aplicar), Livro.emprestado_para_id.is_(None))
+        .values(emprestado_para_id=case(aplicar, value=Livro.id))
+        .returning(Livro.id)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def devolve_livros(aplicar: dict) -> Update:
+    """ Retorna o UPDATE condicional que devolve cada livro de aplicar (id do
+        livro -> id do usuário lido no lote) ainda emprestado para esse
+        usuário: um livro devolvido e emprestado novamente por outra
+        requisição depois da leitura não tem o novo empréstimo desfeito.
+        Retorna os ids devolvidos
+    """
+    return (
+        update(Livro)
+        .where(Livro.id.in_(aplicar), Livro.emprestado_para_id == case(aplicar, value=Livro.id))
+        .values(emprestado_para_id=None)
+        .returning(Livro.id)
+        .execution_options(synchronize_session=False)
+    )
@@ -0,0 +1,15 @@
+from sqlalchemy import Column, String, Integer
+
+from model.base import Base
+
+
+class LivroDisponibilidade(Base):
+    """ Quantidade total e de cópias disponíveis (não emprestadas) de cada
+        título. Mantida pelos triggers da tabela livro (ver migracoes.py), na
+        mesma transação de cada inserção, remoção, empréstimo e devolução.
+    """
+    __tablename__ = 'livro_disponibilidade'
+
+    nome = Column(String(140), primary_key=True)
+    total = Column(Integer, nullable=False, default=0)
+    disponiveis = Column(Integer, nullable=False, default=0)
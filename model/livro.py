@@ -1,4 +1,5 @@
 from sqlalchemy import Column, String, Integer, DateTime, ForeignKey
+from sqlalchemy.orm import relationship
 from datetime import datetime
 from typing import Union
 
@@ -11,12 +12,18 @@ class Livro(Base):
     id = Column(Integer, primary_key=True)
     
     # nome não será unique para permitir múltiplas cópias do mesmo livro
-    nome = Column(String(140))
-    autor = Column(String(140))
+    nome = Column(String(140), index=True)
+    autor = Column(String(140), index=True)
     editora = Column(String(140))
-    emprestado_para_id = Column(ForeignKey("usuario.id"))
-
-    data_insercao = Column(DateTime, default=datetime.now())
+    emprestado_para_id = Column(ForeignKey("usuario.id"), index=True)
+    # carregado via JOIN na mesma consulta do livro, evitando uma consulta
+    # extra por livro emprestado ao montar as listagens
+    emprestado_para = relationship("Usuario", lazy="joined")
+
+    # datetime.now é chamada a cada inserção e atualização da linha
+    data_insercao = Column(DateTime, default=datetime.now)
+    # usada pelas listagens com since para retornar apenas os livros alterados
+    data_atualizacao = Column(DateTime, default=datetime.now, onupdate=datetime.now, index=True)
 
     def __init__(self, nome:str, autor:str, editora:str, emprestado_para_id: int = None,
                  data_insercao:Union[DateTime, None] = None):
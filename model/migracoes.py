@@ -0,0 +1,199 @@
+from sqlalchemy.engine import Connection, Engine
+
+
+# As migrações são aplicadas em ordem, uma única vez por banco. A versão do
+# banco (PRAGMA user_version) é o número de migrações já aplicadas a ele.
+# Como um banco novo já é criado pelo create_all com o esquema atual, cada
+# migração deve ser idempotente (IF NOT EXISTS, checagem de colunas, etc).
+
+# data atual gravada pelas triggers no mesmo formato usado pelo SQLAlchemy nas
+# colunas DateTime (microssegundos), para que as comparações do since funcionem
+AGORA = "strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime') || '000'"
+
+
+def _indices_livro(conn: Connection):
+    """ Cria os índices usados nas buscas por nome, autor e empréstimo
+    """
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_livro_nome ON livro (nome)")
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_livro_autor ON livro (autor)")
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_livro_emprestado_para_id "
+                         "ON livro (emprestado_para_id)")
+
+
+def _busca_textual_livro(conn: Connection):
+    """ Cria o índice FTS5 sobre nome, autor e editora dos livros, mantido em
+        sincronia com a tabela livro através de triggers
+    """
+    conn.exec_driver_sql("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS livro_fts USING fts5(
+            nome, autor, editora,
+            content='livro', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3'
+        )""")
+    conn.exec_driver_sql("""
+        CREATE TRIGGER IF NOT EXISTS livro_fts_insert AFTER INSERT ON livro BEGIN
+            INSERT INTO livro_fts (rowid, nome, autor, editora)
+            VALUES (new.id, new.nome, new.autor, new.editora);
+        END""")
+    conn.exec_driver_sql("""
+        CREATE TRIGGER IF NOT EXISTS livro_fts_delete AFTER DELETE ON livro BEGIN
+            INSERT INTO livro_fts (livro_fts, rowid, nome, autor, editora)
+            VALUES ('delete', old.id, old.nome, old.autor, old.editora);
+        END""")
+    conn.exec_driver_sql("""
+        CREATE TRIGGER IF NOT EXISTS livro_fts_update AFTER UPDATE OF nome, autor, editora ON livro BEGIN
+            INSERT INTO livro_fts (livro_fts, rowid, nome, autor, editora)
+            VALUES ('delete', old.id, old.nome, old.autor, old.editora);
+            INSERT INTO livro_fts (rowid, nome, autor, editora)
+            VALUES (new.id, new.nome, new.autor, new.editora);
+        END""")
+    # indexa os livros que já estavam na base
+    conn.exec_driver_sql("INSERT INTO livro_fts (livro_fts) VALUES ('rebuild')")
+
+
+def _versao_tabelas(conn: Connection):
+    """ Cria a tabela com a versão de cada tabela, usada nos ETags das listagens
+    """
+    conn.exec_driver_sql("""
+        CREATE TABLE IF NOT EXISTS versao_tabela (
+            tabela VARCHAR(40) NOT NULL PRIMARY KEY,
+            versao INTEGER NOT NULL
+        )""")
+    conn.exec_driver_sql("INSERT OR IGNORE INTO versao_tabela (tabela, versao) "
+                         "VALUES ('usuario', 0), ('livro', 0)")
+
+
+def _data_atualizacao(conn: Connection):
+    """ Adiciona a data de atualização aos livros e usuários, preenchida nas
+        linhas existentes com a data de inserção, e o índice usado pelo since
+    """
+    for tabela in ("livro", "usuario"):
+        colunas = [coluna[1] for coluna in conn.exec_driver_sql("PRAGMA table_info(%s)" % tabela)]
+        if "data_atualizacao" not in colunas:
+            conn.exec_driver_sql("ALTER TABLE %s ADD COLUMN data_atualizacao DATETIME" % tabela)
+        conn.exec_driver_sql("UPDATE %s SET data_atualizacao = COALESCE(data_insercao, "
+                             "strftime('%%Y-%%m-%%d %%H:%%M:%%f', 'now', 'localtime')) "
+                             "WHERE data_atualizacao IS NULL" % tabela)
+        conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_%s_data_atualizacao "
+                             "ON %s (data_atualizacao)" % (tabela, tabela))
+
+
+def _disponibilidade_livro(conn: Connection):
+    """ Cria a tabela com o total e as cópias disponíveis de cada título,
+        mantida em sincronia com a tabela livro através de triggers
+    """
+    conn.exec_driver_sql("""
+        CREATE TABLE IF NOT EXISTS livro_disponibilidade (
+            nome VARCHAR(140) NOT NULL PRIMARY KEY,
+            total INTEGER NOT NULL,
+            disponiveis INTEGER NOT NULL
+        )""")
+    conn.exec_driver_sql("""
+        CREATE TRIGGER IF NOT EXISTS livro_disponibilidade_insert AFTER INSERT ON livro
+        WHEN new.nome IS NOT NULL BEGIN
+            INSERT INTO livro_disponibilidade (nome, total, disponiveis)
+            VALUES (new.nome, 1, new.emprestado_para_id IS NULL)
+            ON CONFLICT (nome) DO UPDATE SET total = total + 1,
+                                             disponiveis = disponiveis + excluded.disponiveis;
+        END""")
+    conn.exec_driver_sql("""
+        CREATE TRIGGER IF NOT EXISTS livro_disponibilidade_delete AFTER DELETE ON livro
+        WHEN old.nome IS NOT NULL BEGIN
+            UPDATE livro_disponibilidade
+            SET total = total - 1, disponiveis = disponiveis - (old.emprestado_para_id IS NULL)
+            WHERE nome = old.nome;
+            DELETE FROM livro_disponibilidade WHERE nome = old.nome AND total <= 0;
+        END""")
+    # o nome e o empréstimo podem mudar na mesma atualização: a cópia sai do
+    # título antigo e entra no novo, com a sua nova disponibilidade
+    conn.exec_driver_sql("""
+        CREATE TRIGGER IF NOT EXISTS livro_disponibilidade_update AFTER UPDATE OF nome, emprestado_para_id ON livro
+        WHEN old.nome IS NOT new.nome OR (old.emprestado_para_id IS NULL) != (new.emprestado_para_id IS NULL) BEGIN
+            UPDATE livro_disponibilidade
+            SET total = total - 1, disponiveis = disponiveis - (old.emprestado_para_id IS NULL)
+            WHERE nome = old.nome;
+            INSERT INTO livro_disponibilidade (nome, total, disponiveis)
+            SELECT new.nome, 1, new.emprestado_para_id IS NULL WHERE new.nome IS NOT NULL
+            ON CONFLICT (nome) DO UPDATE SET total = total + 1,
+                                             disponiveis = disponiveis + excluded.disponiveis;
+            DELETE FROM livro_disponibilidade WHERE nome = old.nome AND total <= 0;
+        END""")
+    # calcula a disponibilidade dos livros que já estavam na base
+    conn.exec_driver_sql("DELETE FROM livro_disponibilidade")
+    conn.exec_driver_sql("""
+        INSERT INTO livro_disponibilidade (nome, total, disponiveis)
+        SELECT nome, count(*), sum(emprestado_para_id IS NULL)
+        FROM livro WHERE nome IS NOT NULL GROUP BY nome""")
+
+
+def _remocoes(conn: Connection):
+    """ Cria as tabelas com as remoções de livros e de usuários, preenchidas
+        por triggers, para que as listagens com since informem as remoções
+    """
+    conn.exec_driver_sql("""
+        CREATE TABLE IF NOT EXISTS livro_removido (
+            id INTEGER NOT NULL PRIMARY KEY,
+            data_atualizacao DATETIME NOT NULL
+        )""")
+    conn.exec_driver_sql("""
+        CREATE TABLE IF NOT EXISTS usuario_removido (
+            id INTEGER NOT NULL PRIMARY KEY,
+            nome VARCHAR(140),
+            data_atualizacao DATETIME NOT NULL
+        )""")
+    for tabela in ("livro", "usuario"):
+        conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_%s_removido_data_atualizacao "
+                             "ON %s_removido (data_atualizacao)" % (tabela, tabela))
+    conn.exec_driver_sql("""
+        CREATE TRIGGER IF NOT EXISTS livro_removido_delete AFTER DELETE ON livro BEGIN
+            INSERT OR REPLACE INTO livro_removido (id, data_atualizacao) VALUES (old.id, %s);
+        END""" % AGORA)
+    conn.exec_driver_sql("""
+        CREATE TRIGGER IF NOT EXISTS usuario_removido_delete AFTER DELETE ON usuario BEGIN
+            INSERT OR REPLACE INTO usuario_removido (id, nome, data_atualizacao)
+            VALUES (old.id, old.nome, %s);
+        END""" % AGORA)
+    # o sqlite pode reutilizar o id de uma linha removida, e um novo usuário
+    # pode ter o nome de um removido: a nova linha aparece no since como
+    # inserida e a antiga deixa de constar como removida
+    conn.exec_driver_sql("""
+        CREATE TRIGGER IF NOT EXISTS livro_removido_insert AFTER INSERT ON livro BEGIN
+            DELETE FROM livro_removido WHERE id = new.id;
+        END""")
+    conn.exec_driver_sql("""
+        CREATE TRIGGER IF NOT EXISTS usuario_removido_insert AFTER INSERT ON usuario BEGIN
+            DELETE FROM usuario_removido WHERE id = new.id OR nome = new.nome;
+        END""")
+
+
+def _remocao_usuario_livros(conn: Connection):
+    """ Atualiza a data de atualização dos livros emprestados a um usuário
+        removido, cujo emprestado_para deixa de ser exibido nas listagens,
+        para que eles apareçam como alterados nas listagens com since
+    """
+    conn.exec_driver_sql("""
+        CREATE TRIGGER IF NOT EXISTS usuario_removido_livros AFTER DELETE ON usuario BEGIN
+            UPDATE livro SET data_atualizacao = %s WHERE emprestado_para_id = old.id;
+        END""" % AGORA)
+
+
+MIGRACOES = [
+    _indices_livro,
+    _busca_textual_livro,
+    _versao_tabelas,
+    _data_atualizacao,
+    _disponibilidade_livro,
+    _remocoes,
+    _remocao_usuario_livros,
+]
+
+
+def aplica_migracoes(engine: Engine):
+    """ Aplica ao banco as migrações que ainda não foram aplicadas
+    """
+    with engine.begin() as conn:
+        versao = conn.exec_driver_sql("PRAGMA user_version").scalar()
+        for numero, migracao in enumerate(MIGRACOES[versao:], start=versao + 1):
+            migracao(conn)
+            conn.exec_driver_sql("PRAGMA user_version = %d" % numero)
@@ -0,0 +1,26 @@
+from sqlalchemy import Column, String, Integer, DateTime
+
+from model.base import Base
+
+
+# Registros das remoções de livros e usuários, preenchidos pelos triggers das
+# tabelas livro e usuario (ver migracoes.py) e retornados nas listagens com
+# since. A coluna data_atualizacao guarda a data da remoção, com o mesmo nome
+# da coluna das tabelas de origem para que o mesmo filtro (filtra_alteracoes)
+# seja usado nas duas
+
+
+class LivroRemovido(Base):
+    __tablename__ = 'livro_removido'
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    data_atualizacao = Column(DateTime, nullable=False, index=True)
+
+
+class UsuarioRemovido(Base):
+    __tablename__ = 'usuario_removido'
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    # os usuários são identificados pelo nome nas listagens
+    nome = Column(String(140))
+    data_atualizacao = Column(DateTime, nullable=False, index=True)
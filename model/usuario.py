@@ -11,7 +11,10 @@ class Usuario(Base):
     id = Column(Integer, primary_key=True)
     nome = Column(String(140), unique=True)
     idade = Column(Integer)
-    data_insercao = Column(DateTime, default=datetime.now())
+    # datetime.now é chamada a cada inserção e atualização da linha
+    data_insercao = Column(DateTime, default=datetime.now)
+    # usada pelas listagens com since para retornar apenas os usuários alterados
+    data_atualizacao = Column(DateTime, default=datetime.now, onupdate=datetime.now, index=True)
 
     def __init__(self, nome:str, idade:int,
                  data_insercao:Union[DateTime, None] = None):
@@ -0,0 +1,31 @@
+from sqlalchemy import Column, String, Integer, update
+from sqlalchemy.orm import Session
+
+from model.base import Base
+
+
+class VersaoTabela(Base):
+    """ Versão de cada tabela, incrementada a cada escrita nela. Fica no
+        banco para ser a mesma em todos os workers e para ser incrementada na
+        mesma transação da escrita.
+    """
+    __tablename__ = 'versao_tabela'
+
+    tabela = Column(String(40), primary_key=True)
+    versao = Column(Integer, nullable=False, default=0)
+
+
+def incrementa_versao(session: Session, *tabelas: str):
+    """ Incrementa a versão das tabelas na transação corrente da seção
+    """
+    session.execute(
+        update(VersaoTabela)
+        .where(VersaoTabela.tabela.in_(tabelas))
+        .values(versao=VersaoTabela.versao + 1)
+        .execution_options(synchronize_session=False))
+
+
+def versao_tabela(session: Session, tabela: str) -> int:
+    """ Retorna a versão atual da tabela
+    """
+    return session.query(VersaoTabela.versao).filter(VersaoTabela.tabela == tabela).scalar() or 0
@@ -0,0 +1,63 @@
+from sqlalchemy.exc import OperationalError
+from functools import wraps
+import random
+import time
+import os
+
+from model import Session
+from logger import logger
+
+
+# número de tentativas e espera inicial (em segundos) entre elas
+tentativas = int(os.environ.get("DB_RETRY_ATTEMPTS", "5"))
+espera_inicial = float(os.environ.get("DB_RETRY_BACKOFF", "0.05"))
+espera_maxima = float(os.environ.get("DB_RETRY_BACKOFF_MAX", "1"))
+
+
+def banco_ocupado(e: Exception):
+    """ Indica se a exceção foi causada por um lock de outra escrita no sqlite
+    """
+    if not isinstance(e, OperationalError):
+        return False
+    msg = str(e.orig).lower()
+    return "database is locked" in msg or "database is busy" in msg
+
+
+def repete_se_ocupado(func, *args, **kwargs):
+    """ Executa func, repetindo a execução quando o banco está ocupado por
+        outra escrita e esperando um tempo crescente (com jitter) entre as
+        tentativas. Esgotadas as tentativas, levanta a última exceção.
+    """
+    for tentativa in range(1, tentativas + 1):
+        try:
+            return func(*args, **kwargs)
+        except OperationalError as e:
+            if not banco_ocupado(e) or tentativa == tentativas:
+                raise
+            # descarta a transação que falhou antes de repetir a operação
+            Session.rollback()
+            logger.warning("Banco ocupado em %s(), tentativa %d de %d",
+                           func.__name__, tentativa, tentativas)
+            espera = min(espera_maxima, espera_inicial * 2 ** (tentativa - 1))
+            time.sleep(espera * random.uniform(0.5, 1))
+
+
+def com_retry(func):
+    """ Reexecuta uma rota de escrita quando o banco está ocupado por outra
+        escrita, usando repete_se_ocupado.
+
+    Esgotadas as tentativas, retorna 503 para que o cliente tente mais tarde.
+    As rotas devem deixar passar as exceções em que banco_ocupado(e) é True.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return repete_se_ocupado(func, *args, **kwargs)
+        except OperationalError as e:
+            if not banco_ocupado(e):
+                raise
+            Session.rollback()
+            logger.warning("Banco ocupado em %s(), tentativas esgotadas", func.__name__)
+            return {"mensagem": "Banco de dados ocupado, tente novamente"}, 503
+
+    return wrapper
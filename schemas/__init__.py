@@ -1,9 +1,17 @@
 from schemas.usuario import UsuarioSchema, UsuarioBuscaSchema, UsuarioViewSchema, \
                             ListagemUsuariosSchema, UsuarioDelSchema,UsuariosDelSchema, \
-                            apresenta_usuario, apresenta_usuarios
-from schemas.livro import LivroSchema, LivroBuscaSchema, LivroBuscaIdSchema, LivroViewSchema, \
+                            apresenta_usuario, apresenta_usuarios, apresenta_usuario_listagem, \
+                            CAMPOS_LISTAGEM_USUARIO
+from schemas.livro import LivroSchema, LivroBuscaSchema, LivroBuscaIdSchema, LivroBuscaTextoSchema, LivroViewSchema, \
                             ListagemLivrosSchema, LivroDelSchema,LivrosDelSchema, LivroEmprestaSchema,\
                             LivroEmprestadoSchema,LivroDevolvidoSchema,LivroDevolveSchema, apresenta_livro,\
-                            apresenta_livros
+                            apresenta_livros, apresenta_livro_linha, apresenta_livros_linhas, CAMPOS_LISTAGEM_LIVRO, LivroBulkSchema, LivroBulkViewSchema, le_livros_bulk,\
+                            LivrosEmprestaSchema, LivrosDevolveSchema, LivrosLoteViewSchema, \
+                            planeja_emprestimos, planeja_devolucoes, marca_conflitos
 from schemas.livro import LivroSchema
+from schemas.listagem import ListagemBuscaSchema, campos_listagem, valida_listagem, proximo_cursor, cursor_alteracoes, junta_remocoes, \
+                             gera_listagem_json
+from schemas.disponibilidade import DisponibilidadeBuscaSchema, DisponibilidadeSchema, ListagemDisponibilidadeSchema, \
+                            apresenta_disponibilidade
+from schemas.cache import CacheViewSchema
 from schemas.error import ErrorSchema
@@ -0,0 +1,18 @@
+from pydantic import BaseModel
+
+
+class CacheEstatisticasSchema(BaseModel):
+    """ Define como os contadores de um cache serão retornados
+    """
+    itens: int = 0
+    tamanho: int = 1024
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+
+class CacheViewSchema(BaseModel):
+    """ Define como os contadores dos caches de consulta serão retornados
+    """
+    usuarios: CacheEstatisticasSchema
+    livros: CacheEstatisticasSchema
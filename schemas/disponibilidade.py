@@ -0,0 +1,42 @@
+from pydantic import BaseModel, Field
+from typing import Optional, List
+
+from schemas.listagem import LIMITE_PAGINA
+
+
+class DisponibilidadeBuscaSchema(BaseModel):
+    """ Define os parâmetros da listagem de disponibilidade por título. Com
+        nome, retorna apenas esse título. A paginação é feita pelo nome
+        (keyset): after é o nome do último título da página anterior,
+        retornado no campo "proximo" da resposta.
+    """
+    nome: Optional[str] = None
+    limit: Optional[int] = Field(None, ge=1, le=LIMITE_PAGINA)
+    after: Optional[str] = None
+
+
+class DisponibilidadeSchema(BaseModel):
+    """ Define como a disponibilidade de um título será retornada
+    """
+    nome: str = "Banquete"
+    total: int = 3
+    disponiveis: int = 2
+
+
+class ListagemDisponibilidadeSchema(BaseModel):
+    """ Define como a listagem de disponibilidade por título será retornada
+    """
+    titulos: List[DisponibilidadeSchema]
+    proximo: Optional[str] = None
+
+
+def apresenta_disponibilidade(titulos: list, limit: Optional[int]):
+    """ Retorna a representação da disponibilidade dos títulos seguindo o
+        schema definido em ListagemDisponibilidadeSchema
+    """
+    proximo = titulos[-1].nome if limit and len(titulos) == limit else None
+    return {
+        "titulos": [{"nome": titulo.nome, "total": titulo.total, "disponiveis": titulo.disponiveis}
+                    for titulo in titulos],
+        "proximo": proximo,
+    }
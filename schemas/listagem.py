@@ -0,0 +1,96 @@
+from pydantic import BaseModel, Field
+from typing import Optional, Callable, Iterable
+from datetime import datetime
+import heapq
+from serializacao import serializa
+
+
+# maior página de uma listagem; as listagens completas são feitas sem limit
+LIMITE_PAGINA = 10000
+
+
+class ListagemBuscaSchema(BaseModel):
+    """ Define os parâmetros de paginação das listagens. A paginação é feita
+        pelo id (keyset): after_id é o id do último item da página anterior,
+        retornado no campo "proximo" da resposta. Em fields podem ser
+        informados, separados por vírgula, os únicos campos de cada item.
+
+        Com since, apenas os itens inseridos ou alterados a partir dessa data
+        são retornados, ordenados pela data de alteração, e os itens removidos
+        a partir dela (ids dos livros e nomes dos usuários) no campo "removidos". A próxima busca deve
+        usar since e after_id com os valores dos campos "desde" e "proximo"
+        da resposta. limit deve estar entre 1 e LIMITE_PAGINA.
+    """
+    limit: Optional[int] = Field(None, ge=1, le=LIMITE_PAGINA)
+    after_id: Optional[int] = None
+    stream: bool = False
+    fields: Optional[str] = None
+    since: Optional[datetime] = None
+
+
+def campos_listagem(fields: Optional[str], disponiveis: tuple):
+    """ Retorna os campos pedidos em fields, separados por vírgula, na ordem
+        de disponiveis, ou todos eles se fields não foi informado
+    """
+    if fields is None:
+        return disponiveis
+    pedidos = {campo.strip() for campo in fields.split(",") if campo.strip()}
+    invalidos = pedidos.difference(disponiveis)
+    if invalidos or not pedidos:
+        raise ValueError("Campos inválidos em fields: '%s'. Use: %s"
+                         % (fields, ", ".join(disponiveis)))
+    return tuple(campo for campo in disponiveis if campo in pedidos)
+
+
+def valida_listagem(query: ListagemBuscaSchema, disponiveis: tuple):
+    """ Retorna os campos pedidos na listagem, levantando ValueError se fields
+        possuir campos inválidos ou se since for usado com stream
+    """
+    campos = campos_listagem(query.fields, disponiveis)
+    if query.since is not None and query.stream:
+        raise ValueError("since não pode ser usado com stream")
+    return campos
+
+
+def proximo_cursor(itens: list, limit: Optional[int]):
+    """ Retorna o after_id da próxima página, ou None se esta for a última
+    """
+    if limit and len(itens) == limit:
+        return itens[-1].id
+    return None
+
+
+def junta_remocoes(itens: list, removidos: list, limit: Optional[int]):
+    """ Intercala as linhas alteradas e as removidas, ambas ordenadas pela data
+        de atualização e pelo id, e mantém as primeiras limit. Retorna as
+        linhas alteradas, as chaves dos itens removidos (ver filtra_remocoes)
+        e a página inteira, usada no cursor
+    """
+    pagina = list(heapq.merge(((linha, False) for linha in itens), ((linha, True) for linha in removidos),
+                              key=lambda item: (item[0].data_atualizacao, item[0].id)))
+    if limit:
+        pagina = pagina[:limit]
+    alteradas = [linha for linha, removida in pagina if not removida]
+    chaves = [linha.chave for linha, removida in pagina if removida]
+    return alteradas, chaves, [linha for linha, removida in pagina]
+
+
+def cursor_alteracoes(itens: list, since: datetime, after_id: Optional[int]):
+    """ Retorna os campos "desde" e "proximo" para continuar uma listagem com
+        since a partir do último item, ou o mesmo cursor se não houve alterações
+    """
+    if itens:
+        since, after_id = itens[-1].data_atualizacao, itens[-1].id
+    return {"desde": since.isoformat(), "proximo": after_id}
+
+
+def gera_listagem_json(chave: str, itens: Iterable, apresenta: Callable):
+    """ Gera a listagem {chave: [...]} em pedaços de JSON, um item por vez,
+        para que a resposta seja enviada sem manter todos os itens em memória
+    """
+    yield '{"%s": [' % chave
+    separador = ""
+    for item in itens:
+        yield separador + serializa(apresenta(item))
+        separador = ", "
+    yield "]}"
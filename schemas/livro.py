@@ -1,8 +1,9 @@
-from pydantic import BaseModel
-from typing import Optional, List
+from pydantic import BaseModel, ValidationError
+from typing import Optional, List, IO
 from model.livro import Livro
-from model.usuario import Usuario
-from model import Session
+import json
+import csv
+import io
 
 
 class LivroSchema(BaseModel):
@@ -20,6 +21,14 @@ class LivroBuscaSchema(BaseModel):
     """
     nome: str = "Teste"
 
+class LivroBuscaTextoSchema(BaseModel):
+    """ Define como deve ser a estrutura que representa a busca textual. Que
+        será feita sobre o nome, o autor e a editora do livro, casando também
+        prefixos das palavras informadas.
+    """
+    q: str = "senhor anéis"
+    limite: int = 20
+
 class LivroBuscaIdSchema(BaseModel):
     """ Define como deve ser a estrutura que representa a busca. Que será
         feita apenas com base no id do livro.
@@ -31,6 +40,9 @@ class ListagemLivrosSchema(BaseModel):
     """ Define como uma listagem de livros será retornada.
     """
     livros:List[LivroSchema]
+    proximo: Optional[int] = None
+    desde: Optional[str] = None
+    removidos: Optional[List[int]] = None
 
 class LivroViewSchema(BaseModel):
     """ Define como um livro será retornado
@@ -69,14 +81,145 @@ class LivroDevolveSchema(BaseModel):
     """Define a estrutura para devolver um livro"""
     id: int = 1
 
-def emprestado_usuario_id_para_nome(usuario_id: int):    
-    """ Converte o id associado a um usuário para o nome dele
+class LivrosEmprestaSchema(BaseModel):
+    """Define a estrutura para emprestar vários livros de uma vez"""
+    emprestimos: List[LivroEmprestaSchema]
+
+class LivrosDevolveSchema(BaseModel):
+    """Define a estrutura para devolver vários livros de uma vez"""
+    ids: List[int] = [1]
+
+class LivroLoteResultadoSchema(BaseModel):
+    """Define como o resultado de cada livro de uma operação em lote será retornado"""
+    livro_id: int = 1
+    status: int = 200
+    mensagem: str
+
+class LivrosLoteViewSchema(BaseModel):
+    """Define como o resultado de uma operação em lote será retornado, na
+       mesma ordem dos livros informados"""
+    resultados: List[LivroLoteResultadoSchema]
+
+class LivroBulkSchema(BaseModel):
+    """ Define os parâmetros da importação em lote de livros. O corpo da
+        requisição é lido em NDJSON (um livro por linha) ou, se o Content-Type
+        for text/csv, em CSV com cabeçalho nome,autor,editora. Os livros são
+        inseridos em lotes de chunk livros, entre 1 e 10000.
+    """
+    chunk: int = 1000
+
+class LivroBulkErroSchema(BaseModel):
+    """ Define como o erro de uma linha da importação em lote será retornado
+    """
+    linha: int = 1
+    mensagem: str
+
+class LivroBulkViewSchema(BaseModel):
+    """ Define como o resultado de uma importação em lote será retornado
+    """
+    inseridos: int = 0
+    erros: List[LivroBulkErroSchema]
+
+
+def planeja_emprestimos(emprestimos: List[LivroEmprestaSchema], livros: dict, usuarios: dict):
+    """ Decide o resultado de cada empréstimo do lote a partir dos livros (id ->
+        linha com id, nome e emprestado_para_id) e dos usuários (nome -> id) lidos.
+
+    Retorna os resultados, na ordem informada, e os empréstimos a aplicar (id do
+    livro -> id do usuário). A repetição de um livro no lote resulta em 409.
+    """
+    resultados = []
+    aplicar = {}
+    for emprestimo in emprestimos:
+        livro = livros.get(emprestimo.livro_id)
+        usuario_id = usuarios.get(emprestimo.usuario_nome)
+        if not livro:
+            status, msg = 404, f"livro de id #{emprestimo.livro_id} não encontrado"
+        elif not usuario_id:
+            status, msg = 404, f"Usuário de nome {emprestimo.usuario_nome} não encontrado"
+        elif livro.emprestado_para_id is not None or livro.id in aplicar:
+            status, msg = 409, f"livro de id #{livro.id} já está emprestado"
+        else:
+            aplicar[livro.id] = usuario_id
+            status, msg = 200, f"O livro de id: {livro.id}, {livro.nome}, foi emprestado para {emprestimo.usuario_nome}"
+        resultados.append({"livro_id": emprestimo.livro_id, "status": status, "mensagem": msg})
+    return resultados, aplicar
+
+
+def planeja_devolucoes(ids: List[int], livros: dict):
+    """ Decide o resultado de cada devolução do lote a partir dos livros (id ->
+        linha com id, nome e emprestado_para_id) lidos.
+
+    Retorna os resultados, na ordem informada, e as devoluções a aplicar (id do
+    livro -> id do usuário com quem ele estava emprestado na leitura). A
+    repetição de um livro no lote resulta em 404.
+    """
+    resultados = []
+    aplicar = {}
+    for livro_id in ids:
+        livro = livros.get(livro_id)
+        if not livro:
+            status, msg = 404, f"livro de id #{livro_id} não encontrado"
+        elif livro.emprestado_para_id is None or livro.id in aplicar:
+            status, msg = 404, f"livro de id #{livro_id} não estava emprestado"
+        else:
+            aplicar[livro.id] = livro.emprestado_para_id
+            status, msg = 200, f"O livro de id: {livro.id}, {livro.nome}, foi devolvido."
+        resultados.append({"livro_id": livro_id, "status": status, "mensagem": msg})
+    return resultados, aplicar
+
+
+def marca_conflitos(resultados: list, efetivados: set, mensagem: str):
+    """ Muda para 409 os resultados aceitos na leitura cujos livros não foram
+        alterados pelo UPDATE condicional, por terem sido alterados
+        concorrentemente por outra requisição. mensagem recebe o id do livro
+    """
+    for resultado in resultados:
+        if resultado["status"] == 200 and resultado["livro_id"] not in efetivados:
+            resultado["status"] = 409
+            resultado["mensagem"] = mensagem % resultado["livro_id"]
+
+
+# campos obrigatórios em cada linha da importação em lote, já que LivroSchema
+# possui valores de exemplo que seriam usados no lugar dos campos ausentes
+CAMPOS_LIVRO = ("nome", "autor", "editora")
+
+
+def le_livros_bulk(stream: IO[bytes], csv_format: bool = False):
+    """ Lê os livros de uma importação em lote, uma linha por vez, sem carregar
+        todo o corpo da requisição em memória.
+
+    Gera tuplas (linha, dados, erro), em que dados segue LivroSchema quando a
+    linha é válida e erro descreve o problema quando não é.
     """
-    session = Session()
-    emprestado_nome = None
-    # Se o livro está emprestado para alguém, busca o nome relacionado a esse ID
-    if usuario_id : emprestado_nome = session.query(Usuario).filter(Usuario.id == usuario_id).first().nome
-    return emprestado_nome
+    texto = io.TextIOWrapper(stream, encoding="utf-8", newline="")
+    if csv_format:
+        # no CSV a linha 1 é o cabeçalho
+        linhas = enumerate(csv.DictReader(texto), start=2)
+    else:
+        linhas = ((numero, linha) for numero, linha in enumerate(texto, start=1) if linha.strip())
+
+    for numero, linha in linhas:
+        try:
+            dados = linha if csv_format else json.loads(linha)
+            if not isinstance(dados, dict):
+                raise ValueError("a linha deve ser um objeto JSON")
+            ausentes = [campo for campo in CAMPOS_LIVRO if dados.get(campo) in (None, "")]
+            if ausentes:
+                raise ValueError("campos ausentes: %s" % ", ".join(ausentes))
+            livro = LivroSchema(**{campo: dados[campo] for campo in CAMPOS_LIVRO})
+            yield numero, dict(livro), None
+        except (ValueError, ValidationError) as e:
+            yield numero, None, str(e)
+
+
+def emprestado_para_nome(livro: Livro):
+    """ Retorna o nome do usuário para quem o livro está emprestado, já
+        carregado junto com o livro através do relacionamento emprestado_para
+    """
+    # Se o livro está emprestado para alguém, usa o usuário carregado no JOIN
+    if livro.emprestado_para: return livro.emprestado_para.nome
+    return None
 
 def apresenta_livro(livro: Livro):
     """ Retorna uma representação do livro seguindo o schema definido em
@@ -87,9 +230,26 @@ def apresenta_livro(livro: Livro):
         "nome": livro.nome, 
         "autor": livro.autor,
         "editora": livro.editora,
-        "emprestado_para": emprestado_usuario_id_para_nome(livro.emprestado_para_id)
+        "emprestado_para": emprestado_para_nome(livro)
     }
 
+# campos de cada livro nas listagens, que podem ser escolhidos em fields
+CAMPOS_LISTAGEM_LIVRO = ("id", "nome", "autor", "editora", "emprestado_para")
+
+def apresenta_livro_linha(linha, campos: tuple = CAMPOS_LISTAGEM_LIVRO):
+    """ Retorna a representação de um livro seguindo o schema definido em
+        LivroViewSchema, a partir de uma linha com as colunas do livro e o
+        nome do usuário em emprestado_para, sem instanciar o Livro. Apenas
+        os campos informados são incluídos
+    """
+    return {campo: getattr(linha, campo) for campo in campos}
+
+def apresenta_livros_linhas(linhas: list, campos: tuple = CAMPOS_LISTAGEM_LIVRO):
+    """ Retorna uma representação dos livros seguindo o schema definido em
+        LivroViewSchema, a partir das linhas retornadas pela consulta.
+    """
+    return {"livros": [apresenta_livro_linha(linha, campos) for linha in linhas]}
+
 def apresenta_livros(livros: List[Livro]):
     """ Retorna uma representação dos livros seguindo o schema definido em
         LivroViewSchema.
@@ -101,7 +261,7 @@ def apresenta_livros(livros: List[Livro]):
             "nome": livro.nome,
             "autor": livro.autor,
             "editora": livro.editora,
-            "emprestado_para": emprestado_usuario_id_para_nome(livro.emprestado_para_id)
+            "emprestado_para": emprestado_para_nome(livro)
         })
 
     return {"livros": result}
@@ -22,18 +22,31 @@ class ListagemUsuariosSchema(BaseModel):
     """ Define como uma listagem de usuários será retornada.
     """
     usuarios:List[UsuarioSchema]
+    proximo: Optional[int] = None
+    desde: Optional[str] = None
+    removidos: Optional[List[str]] = None
 
 
-def apresenta_usuarios(usuarios: List[Usuario]):
+# campos de cada usuário nas listagens, que podem ser escolhidos em fields
+CAMPOS_LISTAGEM_USUARIO = ("nome", "idade")
+
+
+def apresenta_usuario_listagem(usuario: Usuario, campos: tuple = CAMPOS_LISTAGEM_USUARIO):
+    """ Retorna a representação de um usuário dentro da listagem, seguindo o
+        schema definido em UsuarioSchema. Aceita também as linhas de uma
+        consulta pelas colunas da listagem. Apenas os campos informados são
+        incluídos
+    """
+    return {campo: getattr(usuario, campo) for campo in campos}
+
+
+def apresenta_usuarios(usuarios: List[Usuario], campos: tuple = CAMPOS_LISTAGEM_USUARIO):
     """ Retorna uma representação dos usuários seguindo o schema definido em
         UsuarioViewSchema.
     """
     result = []
     for usuario in usuarios:
-        result.append({
-            "nome": usuario.nome,
-            "idade": usuario.idade
-        })
+        result.append(apresenta_usuario_listagem(usuario, campos))
 
     return {"usuarios": result}
 
@@ -0,0 +1,63 @@
+from flask.json.provider import DefaultJSONProvider
+import json
+import os
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# biblioteca usada para gerar o JSON das respostas: "orjson" usa o orjson se
+# estiver instalado, "json" usa sempre o json padrão do Python
+backend = os.environ.get("JSON_BACKEND", "orjson")
+usa_orjson = backend == "orjson" and orjson is not None
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """ Gera o JSON das respostas com o orjson, mantendo as chaves ordenadas
+        como no provider padrão do Flask. Objetos que o orjson não serializa
+        são convertidos pelo default do provider padrão
+    """
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return self._bytes(obj).decode()
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self._bytes(obj), mimetype=self.mimetype)
+
+    def _bytes(self, obj):
+        opcoes = orjson.OPT_APPEND_NEWLINE | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            opcoes |= orjson.OPT_SORT_KEYS
+        if self.compact is False or (self.compact is None and self._app.debug):
+            opcoes |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=opcoes)
+
+
+def configura_json(app):
+    """ Usa o orjson para as respostas JSON da aplicação, quando disponível
+    """
+    if usa_orjson:
+        app.json = OrjsonProvider(app)
+
+
+def serializa(obj) -> str:
+    """ Serializa um item das listagens enviadas aos poucos, mantendo a ordem
+        das chaves
+    """
+    if usa_orjson:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj, ensure_ascii=False)
+
+
+def serializa_resposta(obj) -> bytes:
+    """ Serializa uma resposta JSON compacta com as chaves ordenadas, como as
+        respostas do Flask, para as rotas servidas fora dele (asgi.py)
+    """
+    if usa_orjson:
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode()
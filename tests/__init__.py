@@ -0,0 +1,29 @@
+import tempfile
+import os
+
+# Os testes usam um banco temporário, configurado antes de importar o model
+# (a engine é criada na importação). Execute a partir da raiz do repositório:
+#   python -m nose2
+pasta_testes = tempfile.mkdtemp(prefix="biblioteca-testes-")
+os.environ["DB_URL"] = "sqlite:///%s/db.sqlite3" % pasta_testes
+# os logs também ficam na pasta temporária, fora dos arquivos de log/ do repositório
+os.environ["LOG_PATH"] = pasta_testes
+# sem limite de admissão nas rotas em lote, que os testes chamam em paralelo
+os.environ["ADMISSAO_LIMITE_LOTE"] = "0"
+# as alterações aparecem nas listagens com since sem esperar o atraso padrão
+os.environ["SINCE_ATRASO"] = "0"
+
+
+def limpa_banco():
+    """ Remove todos os livros e usuários e esvazia os caches de consulta
+    """
+    from model import Session, Livro, Usuario
+    from cache import cache_usuarios, cache_livros
+
+    session = Session()
+    session.query(Livro).delete()
+    session.query(Usuario).delete()
+    session.commit()
+    Session.remove()
+    cache_usuarios.limpa()
+    cache_livros.limpa()
@@ -0,0 +1,45 @@
+import unittest
+from unittest import mock
+
+from tests import limpa_banco
+from app import create_app
+from admissao import classes_de_rota
+
+
+class TestAdmissaoListagens(unittest.TestCase):
+    """ Com a classe listagem esgotada, só as listagens completas ou transmitidas
+        são rejeitadas; as páginas pequenas e as revalidações por ETag passam
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.client = create_app().test_client()
+
+    def setUp(self):
+        limpa_banco()
+        for i in range(3):
+            resposta = self.client.post("/livro", data={"nome": "Livro %d" % i, "autor": "Autor", "editora": "Editora"})
+            self.assertEqual(resposta.status_code, 200)
+
+    def test_listagem_esgotada(self):
+        etags = {url: self.client.get(url).headers["ETag"]
+                 for url in ("/livros", "/usuarios", "/livros/disponibilidade")}
+        with mock.patch.object(classes_de_rota["listagem"], "entra", return_value=False):
+            for url, etag in etags.items():
+                # listagem completa: ocupa uma vaga da classe listagem e é rejeitada
+                self.assertEqual(self.client.get(url).status_code, 503)
+                self.assertEqual(self.client.get(url + "?limit=1000").status_code, 503)
+                # o cliente já possui a listagem: 304 sem ocupar uma vaga
+                resposta = self.client.get(url, headers={"If-None-Match": etag})
+                self.assertEqual(resposta.status_code, 304)
+                # página pequena: admitida como leitura
+                self.assertEqual(self.client.get(url + "?limit=2").status_code, 200)
+            self.assertEqual(self.client.get("/livros?limit=2&stream=true").status_code, 503)
+            resposta = self.client.get("/livros?limit=2&since=2000-01-01T00:00:00")
+            self.assertEqual(resposta.status_code, 200)
+            # a página intercala os livros alterados e os removidos por limpa_banco()
+            self.assertEqual(len(resposta.json["livros"] + resposta.json["removidos"]), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
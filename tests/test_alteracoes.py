@@ -0,0 +1,95 @@
+import unittest
+from datetime import datetime, timedelta
+
+from tests import limpa_banco
+from app import create_app
+
+
+class TestAlteracoesComRemocoes(unittest.TestCase):
+    """ As listagens com since devem informar as remoções, para que um
+        cliente sincronizado por elas descarte os itens removidos
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.client = create_app().test_client()
+
+    def setUp(self):
+        limpa_banco()
+        self.desde = (datetime.now() - timedelta(seconds=1)).isoformat()
+
+    def sincroniza(self, url: str, chave: str, limit: int):
+        """ Percorre as páginas da listagem com since e retorna os ids
+            alterados e os removidos, na ordem recebida
+        """
+        alterados, removidos = [], []
+        desde, after_id = self.desde, None
+        while True:
+            parametros = {"since": desde, "limit": limit}
+            if after_id is not None:
+                parametros["after_id"] = after_id
+            resposta = self.client.get(url, query_string=parametros)
+            self.assertEqual(resposta.status_code, 200)
+            pagina = resposta.json[chave] + resposta.json["removidos"]
+            if not pagina:
+                return alterados, removidos
+            self.assertLessEqual(len(pagina), limit)
+            # os usuários são identificados pelo nome nas listagens
+            alterados += [item.get("id", item.get("nome")) for item in resposta.json[chave]]
+            removidos += resposta.json["removidos"]
+            desde, after_id = resposta.json["desde"], resposta.json["proximo"]
+
+    def test_livros_removidos(self):
+        ids = [self.client.post("/livro", data={"nome": "Livro %d" % i, "autor": "Autor",
+                                                "editora": "Editora"}).json["id"] for i in range(5)]
+        for livro_id in ids[1:3]:
+            self.assertEqual(self.client.delete("/livro", query_string={"id": livro_id}).status_code, 200)
+
+        for limit in (1, 2, 100):
+            with self.subTest(limit=limit):
+                alterados, removidos = self.sincroniza("/livros", "livros", limit)
+                self.assertEqual(sorted(alterados), [ids[0]] + ids[3:])
+                self.assertEqual(sorted(removidos), ids[1:3])
+
+    def test_usuarios_removidos(self):
+        for nome in ("Ana", "Bia"):
+            self.client.post("/usuario", data={"nome": nome, "idade": 30})
+        self.client.delete("/usuario", query_string={"nome": "Ana"})
+        self.client.delete("/usuario", query_string={"nome": "Bia"})
+        # um novo usuário com o nome de um removido deixa de constar como removido
+        self.client.post("/usuario", data={"nome": "Ana", "idade": 31})
+
+        alterados, removidos = self.sincroniza("/usuarios", "usuarios", 1)
+        self.assertEqual(alterados, ["Ana"])
+        self.assertEqual(removidos, ["Bia"])
+
+    def test_emprestimos_de_usuario_removido(self):
+        ids = [self.client.post("/livro", data={"nome": "Livro %d" % i, "autor": "Autor",
+                                                "editora": "Editora"}).json["id"] for i in range(3)]
+        for livro_id, nome in zip(ids, ("Ana", "Bia")):
+            self.client.post("/usuario", data={"nome": nome, "idade": 30})
+            self.client.put("/livro", query_string={"livro_id": livro_id, "usuario_nome": nome})
+        self.desde = datetime.now().isoformat()
+
+        # os livros emprestados ao usuário removido deixam de exibir emprestado_para
+        self.client.delete("/usuario", query_string={"nome": "Ana"})
+        alterados, removidos = self.sincroniza("/livros", "livros", 1)
+        self.assertEqual(alterados, ids[:1])
+        self.client.delete("/usuarios")
+        alterados, removidos = self.sincroniza("/livros", "livros", 100)
+        self.assertEqual(alterados, ids[:2])
+        resposta = self.client.get("/livros", query_string={"since": self.desde})
+        self.assertEqual([livro["emprestado_para"] for livro in resposta.json["livros"]], [None, None])
+
+    def test_id_reutilizado(self):
+        livro_id = self.client.post("/livro", data={"nome": "Livro", "autor": "Autor", "editora": "Editora"}).json["id"]
+        self.client.delete("/livro", query_string={"id": livro_id})
+        # sem AUTOINCREMENT, o sqlite reutiliza o maior id removido
+        novo_id = self.client.post("/livro", data={"nome": "Outro", "autor": "Autor", "editora": "Editora"}).json["id"]
+        alterados, removidos = self.sincroniza("/livros", "livros", 100)
+        self.assertEqual(alterados, [novo_id])
+        self.assertNotIn(novo_id, removidos)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+import asyncio
+import unittest
+
+from tests import limpa_banco
+from app import create_app
+
+try:
+    import httpx
+    import asgi
+except ImportError:
+    # o cliente de testes do modo ASGI usa o httpx, que é opcional
+    httpx = None
+
+
+# requisições feitas aos dois modos, na ordem, com os casos de erro de cada rota
+PASSOS = [
+    ("POST", "/usuario", {"data": {"nome": "Ana", "idade": 30}}),
+    ("POST", "/usuario", {"data": {"nome": "Ana", "idade": 30}}),
+    ("POST", "/usuario", {"data": {"nome": "Bruno", "idade": 40}}),
+    ("POST", "/livro", {"data": {"nome": "O Senhor dos Anéis", "autor": "Tolkien", "editora": "Allen"}}),
+    ("POST", "/livro", {"data": {"nome": "O Hobbit", "autor": "Tolkien", "editora": "Allen"}}),
+    ("POST", "/livro", {"data": {"nome": "O Hobbit", "autor": "Tolkien", "editora": "Allen"}}),
+    ("PUT", "/livro?livro_id=1&usuario_nome=Ana", {}),
+    ("PUT", "/livro?livro_id=1&usuario_nome=Bruno", {}),
+    ("PUT", "/livro?livro_id=2&usuario_nome=Carla", {}),
+    ("PUT", "/livro?livro_id=99&usuario_nome=Ana", {}),
+    ("PUT", "/livros/empresta", {"json": {"emprestimos": [
+        {"livro_id": 2, "usuario_nome": "Bruno"}, {"livro_id": 2, "usuario_nome": "Ana"},
+        {"livro_id": 1, "usuario_nome": "Bruno"}, {"livro_id": 99, "usuario_nome": "Ana"}]}}),
+    ("GET", "/livros", {}),
+    ("GET", "/livros?limit=2&after_id=1&fields=nome,emprestado_para", {}),
+    ("GET", "/livros?fields=isbn", {}),
+    ("GET", "/livros?stream=true&since=2000-01-01T00:00:00", {}),
+    ("GET", "/livros?stream=true", {}),
+    ("GET", "/usuarios?fields=nome", {}),
+    ("GET", "/usuario?nome=Ana", {}),
+    ("GET", "/livro?nome=O Hobbit", {}),
+    ("GET", "/livros/busca?q=senhor aneis", {}),
+    ("GET", "/livros/disponibilidade", {}),
+    ("PUT", "/livroDevolve?id=1", {}),
+    ("PUT", "/livroDevolve?id=1", {}),
+    ("PUT", "/livroDevolve?id=99", {}),
+    ("PUT", "/livros/devolve", {"json": {"ids": [2, 2, 3, 99]}}),
+    ("DELETE", "/livro?id=3", {}),
+    ("DELETE", "/livro?id=3", {}),
+    ("DELETE", "/usuario?nome=Bruno", {}),
+    ("DELETE", "/usuario?nome=Bruno", {}),
+    ("GET", "/livros/disponibilidade?limit=1", {}),
+    ("DELETE", "/livros", {}),
+    ("DELETE", "/usuarios", {}),
+    ("GET", "/livros", {}),
+]
+
+
+@unittest.skipIf(httpx is None, "httpx não instalado")
+class TestParidadeASGI(unittest.TestCase):
+    """ app.py e asgi.py devem responder da mesma forma às mesmas requisições
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.client = create_app().test_client()
+
+    def setUp(self):
+        limpa_banco()
+
+    def respostas_flask(self):
+        client = self.client
+        respostas = []
+        for metodo, url, parametros in PASSOS:
+            resposta = client.open(url, method=metodo, **parametros)
+            respostas.append((metodo, url, resposta.status_code, resposta.get_json()))
+        return respostas
+
+    def respostas_asgi(self):
+        async def executa():
+            respostas = []
+            async with asgi.app.router.lifespan_context(asgi.app):
+                transporte = httpx.ASGITransport(app=asgi.app)
+                async with httpx.AsyncClient(transport=transporte, base_url="http://asgi") as client:
+                    for metodo, url, parametros in PASSOS:
+                        resposta = await client.request(metodo, url, **parametros)
+                        respostas.append((metodo, url, resposta.status_code, resposta.json()))
+            return respostas
+
+        return asyncio.run(executa())
+
+    def test_mesmas_respostas(self):
+        flask = self.respostas_flask()
+        # os ids reiniciam em 1 com as tabelas vazias
+        limpa_banco()
+        recebidas = self.respostas_asgi()
+        self.assertEqual(len(recebidas), len(flask))
+        for esperada, recebida in zip(flask, recebidas):
+            with self.subTest(requisicao=esperada[:2]):
+                self.assertEqual(recebida, esperada)
+
+
+if __name__ == "__main__":
+    unittest.main()
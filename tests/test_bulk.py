@@ -0,0 +1,100 @@
+import json
+import unittest
+
+from sqlalchemy import event
+
+from tests import limpa_banco
+from app import create_app
+from model import engine
+
+
+class TestImportacaoEmLote(unittest.TestCase):
+    """ A importação em lote deve inserir as linhas válidas, em lotes de chunk
+        livros, e informar o erro de cada linha inválida
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.client = create_app().test_client()
+
+    def setUp(self):
+        limpa_banco()
+
+    def importa(self, corpo: str, content_type: str = "application/x-ndjson", **parametros):
+        resposta = self.client.post("/livros/bulk", query_string=parametros, data=corpo.encode("utf-8"),
+                                    content_type=content_type)
+        return resposta
+
+    def livros(self):
+        return [(livro["nome"], livro["autor"], livro["editora"]) for livro in self.client.get("/livros").json["livros"]]
+
+    def test_ndjson(self):
+        linhas = [
+            json.dumps({"nome": "Dom Casmurro", "autor": "Machado de Assis", "editora": "Garnier"}),
+            "{nome: 'sem aspas'}",
+            json.dumps({"nome": "Iracema", "autor": "José de Alencar"}),
+            "",
+            json.dumps(["Iracema", "José de Alencar", "Garnier"]),
+            json.dumps({"nome": "Dom Casmurro", "autor": "Machado de Assis", "editora": "Garnier"}),
+            json.dumps({"nome": "", "autor": "Autor", "editora": "Editora"}),
+        ]
+        resposta = self.importa("\n".join(linhas) + "\n")
+        self.assertEqual(resposta.status_code, 200)
+        # as linhas repetidas são cópias do mesmo livro
+        self.assertEqual(resposta.json["inseridos"], 2)
+        self.assertEqual([erro["linha"] for erro in resposta.json["erros"]], [2, 3, 5, 7])
+        self.assertIn("editora", resposta.json["erros"][1]["mensagem"])
+        self.assertIn("nome", resposta.json["erros"][3]["mensagem"])
+        self.assertEqual(self.livros(), [("Dom Casmurro", "Machado de Assis", "Garnier")] * 2)
+
+    def test_csv(self):
+        corpo = ("nome,autor,editora\r\n"
+                 "Dom Casmurro,Machado de Assis,Garnier\r\n"
+                 "\"Memórias Póstumas, de Brás Cubas\",Machado de Assis,Garnier\r\n"
+                 "Iracema,José de Alencar\r\n")
+        resposta = self.importa(corpo, "text/csv")
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.json["inseridos"], 2)
+        # a linha 1 é o cabeçalho
+        self.assertEqual([erro["linha"] for erro in resposta.json["erros"]], [4])
+        self.assertEqual(self.livros(), [("Dom Casmurro", "Machado de Assis", "Garnier"),
+                                         ("Memórias Póstumas, de Brás Cubas", "Machado de Assis", "Garnier")])
+
+    def test_lotes(self):
+        linhas = [json.dumps({"nome": "Livro %d" % i, "autor": "Autor", "editora": "Editora"}) for i in range(5)]
+        inserts = []
+
+        def conta(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith("INSERT INTO livro "):
+                inserts.append(len(parameters) if executemany else 1)
+
+        event.listen(engine, "before_cursor_execute", conta)
+        try:
+            resposta = self.importa("\n".join(linhas), chunk=2)
+        finally:
+            event.remove(engine, "before_cursor_execute", conta)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.json, {"inseridos": 5, "erros": []})
+        # dois lotes completos e o restante
+        self.assertEqual(inserts, [2, 2, 1])
+        self.assertEqual([livro[0] for livro in self.livros()], ["Livro %d" % i for i in range(5)])
+
+        # chunk fora do intervalo é limitado a 1
+        resposta = self.importa(linhas[0], chunk=0)
+        self.assertEqual(resposta.json["inseridos"], 1)
+
+    def test_utf8_invalido(self):
+        linha = json.dumps({"nome": "Livro", "autor": "Autor", "editora": "Editora"}).encode("utf-8")
+        # o corpo é decodificado em blocos: o erro fica depois dos primeiros blocos
+        corpo = (linha + b"\n") * 1000 + b'{"nome": "\xff"}\n'
+        resposta = self.client.post("/livros/bulk", query_string={"chunk": 100}, data=corpo,
+                                    content_type="application/x-ndjson")
+        self.assertEqual(resposta.status_code, 400)
+        # os lotes anteriores ao erro permanecem inseridos
+        inseridos = len(self.client.get("/livros").json["livros"])
+        self.assertTrue(0 < inseridos < 1000)
+        self.assertEqual(inseridos % 100, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
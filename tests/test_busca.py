@@ -0,0 +1,83 @@
+import unittest
+
+from sqlalchemy import update
+
+from tests import limpa_banco
+from app import create_app
+from model import Session, Livro
+from model.busca import consulta_fts
+
+
+class TestBuscaTextual(unittest.TestCase):
+    """ A busca textual deve ordenar por relevância, casar prefixos e ignorar
+        acentos, e o índice deve acompanhar as alterações e remoções de livros
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.client = create_app().test_client()
+
+    def setUp(self):
+        limpa_banco()
+
+    def adiciona(self, nome: str, autor: str = "Autor", editora: str = "Editora") -> int:
+        resposta = self.client.post("/livro", data={"nome": nome, "autor": autor, "editora": editora})
+        self.assertEqual(resposta.status_code, 200)
+        return resposta.json["id"]
+
+    def busca(self, q: str):
+        """ Retorna os ids encontrados, na ordem da resposta, ou None se a busca retornou 404
+        """
+        resposta = self.client.get("/livros/busca", query_string={"q": q})
+        if resposta.status_code == 404:
+            return None
+        self.assertEqual(resposta.status_code, 200)
+        return [livro["id"] for livro in resposta.json["livros"]]
+
+    def test_relevancia(self):
+        # o termo na editora, no autor e no título, nessa ordem de inserção
+        na_editora = self.adiciona("Contos", editora="Martins")
+        no_autor = self.adiciona("Poemas", autor="Martins")
+        no_titulo = self.adiciona("Martins")
+        self.assertEqual(self.busca("martins"), [no_titulo, no_autor, na_editora])
+
+    def test_prefixo_e_todos_os_termos(self):
+        senhor = self.adiciona("O Senhor dos Anéis", autor="Tolkien")
+        self.adiciona("O Senhor das Moscas", autor="Golding")
+        self.assertEqual(self.busca("senh ane"), [senhor])
+        self.assertEqual(len(self.busca("sen")), 2)
+        self.assertEqual(self.busca("senhor tolk"), [senhor])
+
+    def test_acentos(self):
+        livro_id = self.adiciona("Memórias Póstumas", autor="Machado de Assis")
+        self.assertEqual(self.busca("memorias postumas"), [livro_id])
+        self.assertEqual(self.busca("MEMÓRIAS"), [livro_id])
+
+    def test_operadores_e_texto_vazio(self):
+        livro_id = self.adiciona("Guerra e Paz")
+        # operadores do FTS5 e aspas são tratados como texto
+        self.assertEqual(consulta_fts('guerra OR "paz'), '"guerra"* "OR"* "paz"*')
+        self.assertIsNone(self.busca("guerra OR"))
+        self.assertEqual(self.busca('"guerra'), [livro_id])
+        self.assertIsNone(consulta_fts("-- ?"))
+        self.assertIsNone(self.busca("-- ?"))
+
+    def test_indice_apos_alteracao_e_remocao(self):
+        livro_id = self.adiciona("Dom Casmurro")
+        outro_id = self.adiciona("Dom Quixote")
+        session = Session()
+        session.execute(update(Livro).where(Livro.id == livro_id).values(nome="Quincas Borba"))
+        session.commit()
+        Session.remove()
+        self.assertIsNone(self.busca("casmurro"))
+        self.assertEqual(self.busca("quincas"), [livro_id])
+        self.assertEqual(self.busca("dom"), [outro_id])
+
+        resposta = self.client.delete("/livro", query_string={"id": outro_id})
+        self.assertEqual(resposta.status_code, 200)
+        self.assertIsNone(self.busca("quixote"))
+        self.assertIsNone(self.busca("dom"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+from unittest import mock
+from threading import Thread
+
+from tests import limpa_banco
+from app import create_app
+from cache import CacheLRU
+from schemas import apresenta_livros
+
+
+class TestGeracaoCache(unittest.TestCase):
+    """ Um resultado lido antes de uma invalidação não deve ser guardado
+    """
+
+    def test_set_ignorado_apos_invalidacao(self):
+        cache = CacheLRU("teste")
+        geracao = cache.geracao
+        cache.invalida("chave")
+        cache.set("chave", "antigo", geracao)
+        self.assertEqual(cache.estatisticas()["itens"], 0)
+        cache.set("chave", "novo", cache.geracao)
+        self.assertEqual(cache.get("chave"), "novo")
+
+    def test_emprestimo_durante_busca(self):
+        app = create_app()
+        client = app.test_client()
+        limpa_banco()
+        client.post("/usuario", data={"nome": "Leitor", "idade": 30})
+        livro_id = client.post("/livro", data={"nome": "Livro", "autor": "Autor", "editora": "Editora"}).json["id"]
+
+        def empresta():
+            resposta = app.test_client().put("/livro", query_string={"livro_id": livro_id, "usuario_nome": "Leitor"})
+            self.assertEqual(resposta.status_code, 200)
+
+        def apresenta_e_empresta(livros):
+            # o empréstimo é efetivado e invalida o cache depois da leitura do
+            # GET /livro e antes dele guardar o resultado
+            thread = Thread(target=empresta)
+            thread.start()
+            thread.join()
+            return apresenta_livros(livros)
+
+        with mock.patch("app.apresenta_livros", apresenta_e_empresta):
+            antes = client.get("/livro", query_string={"nome": "Livro"}).json["livros"][0]
+        self.assertIsNone(antes["emprestado_para"])
+        depois = client.get("/livro", query_string={"nome": "Livro"}).json["livros"][0]
+        self.assertEqual(depois["emprestado_para"], "Leitor")
+
+
+if __name__ == "__main__":
+    unittest.main()
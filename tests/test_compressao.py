@@ -0,0 +1,103 @@
+import gzip
+import json
+import unittest
+
+from tests import limpa_banco
+from app import create_app
+from compressao import zstandard, brotli, tamanho_minimo
+
+
+def descomprime(algoritmo: str, dados: bytes) -> bytes:
+    if algoritmo == "gzip":
+        return gzip.decompress(dados)
+    if algoritmo == "br":
+        return brotli.decompress(dados)
+    # as respostas transmitidas não informam o tamanho no quadro do zstd
+    return zstandard.ZstdDecompressor().decompressobj().decompress(dados)
+
+
+class TestCompressao(unittest.TestCase):
+    """ As respostas devem ser comprimidas com o algoritmo negociado pelo
+        Accept-Encoding, exceto as pequenas, e as transmitidas aos poucos
+        devem ser comprimidas conforme são geradas
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.client = create_app().test_client()
+        limpa_banco()
+        livros = "\n".join(json.dumps({"nome": "Livro %d" % i, "autor": "Autor %d" % i, "editora": "Editora"})
+                           for i in range(50))
+        resposta = cls.client.post("/livros/bulk", data=livros, content_type="application/x-ndjson")
+        assert resposta.json["inseridos"] == 50
+        cls.client.post("/usuario", data={"nome": "Ana", "idade": 30})
+        cls.listagem = cls.client.get("/livros").get_data()
+
+    def get(self, url: str, accept_encoding: str = None, etag: str = None):
+        headers = {"Accept-Encoding": accept_encoding} if accept_encoding else {}
+        if etag:
+            headers["If-None-Match"] = etag
+        resposta = self.client.get(url, headers=headers)
+        # lê o corpo e fecha a resposta, liberando a vaga das listagens transmitidas
+        resposta.get_data()
+        resposta.close()
+        return resposta
+
+    def verifica_comprimida(self, algoritmo: str, url: str = "/livros"):
+        resposta = self.get(url, algoritmo)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.headers["Content-Encoding"], algoritmo)
+        self.assertIn("Accept-Encoding", resposta.headers["Vary"])
+        return json.loads(descomprime(algoritmo, resposta.get_data()))
+
+    def test_gzip(self):
+        self.assertGreater(len(self.listagem), tamanho_minimo)
+        self.assertEqual(self.verifica_comprimida("gzip"), json.loads(self.listagem))
+
+    @unittest.skipIf(brotli is None, "brotli não instalado")
+    def test_brotli(self):
+        self.assertEqual(self.verifica_comprimida("br"), json.loads(self.listagem))
+
+    @unittest.skipIf(zstandard is None, "zstandard não instalado")
+    def test_zstd(self):
+        self.assertEqual(self.verifica_comprimida("zstd"), json.loads(self.listagem))
+
+    def test_negociacao(self):
+        # a maior prioridade do cliente vence a preferência do servidor
+        resposta = self.get("/livros", "zstd;q=0.2, br;q=0.5, gzip")
+        self.assertEqual(resposta.headers["Content-Encoding"], "gzip")
+        # sem Accept-Encoding, ou com algoritmos não suportados, a resposta vai sem compressão
+        for accept_encoding in (None, "identity", "deflate", "gzip;q=0"):
+            with self.subTest(accept_encoding=accept_encoding):
+                resposta = self.get("/livros", accept_encoding)
+                self.assertNotIn("Content-Encoding", resposta.headers)
+                self.assertEqual(resposta.get_data(), self.listagem)
+
+    def test_tamanho_minimo(self):
+        resposta = self.get("/usuarios", "gzip")
+        self.assertLess(len(resposta.get_data()), tamanho_minimo)
+        self.assertNotIn("Content-Encoding", resposta.headers)
+        self.assertIn("Accept-Encoding", resposta.headers["Vary"])
+
+    def test_stream(self):
+        # a listagem transmitida é comprimida mesmo pequena, já que o tamanho não é conhecido
+        for url in ("/livros?stream=true", "/usuarios?stream=true"):
+            with self.subTest(url=url):
+                resposta = self.get(url, "gzip")
+                self.assertNotIn("Content-Length", resposta.headers)
+                esperado = json.loads(self.get(url).get_data())
+                self.assertEqual(self.verifica_comprimida("gzip", url), esperado)
+
+    def test_sem_compressao(self):
+        # respostas de erro e 304 não são comprimidas
+        resposta = self.get("/livro?nome=Inexistente", "gzip")
+        self.assertEqual(resposta.status_code, 404)
+        self.assertNotIn("Content-Encoding", resposta.headers)
+        etag = self.get("/livros", "gzip").headers["ETag"]
+        resposta = self.get("/livros", "gzip", etag)
+        self.assertEqual(resposta.status_code, 304)
+        self.assertNotIn("Content-Encoding", resposta.headers)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from threading import Barrier
+
+from tests import limpa_banco
+from app import create_app
+
+
+THREADS = 8
+RODADAS = 20
+
+
+class TestEmprestimoConcorrente(unittest.TestCase):
+    """ Empréstimos e devoluções concorrentes da mesma cópia, pela rota
+        individual e pela rota em lote, devem resultar em uma única alteração
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = create_app()
+
+    def setUp(self):
+        limpa_banco()
+        client = self.app.test_client()
+        for i in range(THREADS):
+            resposta = client.post("/usuario", data={"nome": "Leitor %d" % i, "idade": 30})
+            self.assertEqual(resposta.status_code, 200)
+
+    def empresta(self, barreira: Barrier, livro_id: int, i: int):
+        """ Empresta o livro para o usuário i, alternando entre PUT /livro e
+            PUT /livros/empresta, e retorna se o empréstimo foi feito
+        """
+        client = self.app.test_client()
+        usuario = "Leitor %d" % i
+        barreira.wait()
+        if i % 2:
+            resposta = client.put("/livro", query_string={"livro_id": livro_id, "usuario_nome": usuario})
+            self.assertIn(resposta.status_code, (200, 409))
+            return resposta.status_code == 200
+        resposta = client.put("/livros/empresta",
+                              json={"emprestimos": [{"livro_id": livro_id, "usuario_nome": usuario}]})
+        self.assertEqual(resposta.status_code, 200)
+        status = resposta.json["resultados"][0]["status"]
+        self.assertIn(status, (200, 409))
+        return status == 200
+
+    def devolve(self, barreira: Barrier, livro_id: int, i: int):
+        """ Devolve o livro, alternando entre PUT /livroDevolve e PUT /livros/devolve,
+            e retorna se a devolução foi feita
+        """
+        client = self.app.test_client()
+        barreira.wait()
+        if i % 2:
+            resposta = client.put("/livroDevolve", query_string={"id": livro_id})
+            self.assertIn(resposta.status_code, (200, 404))
+            return resposta.status_code == 200
+        resposta = client.put("/livros/devolve", json={"ids": [livro_id]})
+        self.assertEqual(resposta.status_code, 200)
+        status = resposta.json["resultados"][0]["status"]
+        self.assertIn(status, (200, 404, 409))
+        return status == 200
+
+    def test_um_emprestimo_por_copia(self):
+        client = self.app.test_client()
+        with ThreadPoolExecutor(THREADS) as executor:
+            for rodada in range(RODADAS):
+                resposta = client.post("/livro", data={"nome": "Livro %d" % rodada, "autor": "Autor",
+                                                       "editora": "Editora"})
+                livro_id = resposta.json["id"]
+                barreira = Barrier(THREADS)
+                emprestados = list(executor.map(lambda i: self.empresta(barreira, livro_id, i), range(THREADS)))
+                with self.subTest(rodada=rodada):
+                    self.assertEqual(emprestados.count(True), 1)
+                    vencedor = "Leitor %d" % emprestados.index(True)
+                    livro = client.get("/livro", query_string={"nome": "Livro %d" % rodada}).json["livros"][0]
+                    self.assertEqual(livro["emprestado_para"], vencedor)
+
+    def test_uma_devolucao_por_copia(self):
+        client = self.app.test_client()
+        with ThreadPoolExecutor(THREADS) as executor:
+            for rodada in range(RODADAS):
+                resposta = client.post("/livro", data={"nome": "Livro %d" % rodada, "autor": "Autor",
+                                                       "editora": "Editora"})
+                livro_id = resposta.json["id"]
+                resposta = client.put("/livro", query_string={"livro_id": livro_id, "usuario_nome": "Leitor 0"})
+                self.assertEqual(resposta.status_code, 200)
+                barreira = Barrier(THREADS)
+                devolvidos = list(executor.map(lambda i: self.devolve(barreira, livro_id, i), range(THREADS)))
+                with self.subTest(rodada=rodada):
+                    self.assertEqual(devolvidos.count(True), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+import json
+import unittest
+
+from sqlalchemy import text, update
+
+from tests import limpa_banco
+from app import create_app
+from model import Session, Livro
+
+
+# contadores recalculados a partir da tabela livro, como na migração
+RECALCULO = text("SELECT nome, count(*), sum(emprestado_para_id IS NULL) FROM livro "
+                 "WHERE nome IS NOT NULL GROUP BY nome ORDER BY nome")
+CONTADORES = text("SELECT nome, total, disponiveis FROM livro_disponibilidade ORDER BY nome")
+
+
+class TestDisponibilidade(unittest.TestCase):
+    """ Os contadores de livro_disponibilidade, mantidos por triggers, devem
+        ser iguais aos recalculados a partir dos livros após cada escrita
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.client = create_app().test_client()
+
+    def setUp(self):
+        limpa_banco()
+        for nome in ("Ana", "Bruno"):
+            self.client.post("/usuario", data={"nome": nome, "idade": 30})
+
+    def adiciona(self, nome: str) -> int:
+        resposta = self.client.post("/livro", data={"nome": nome, "autor": "Autor", "editora": "Editora"})
+        self.assertEqual(resposta.status_code, 200)
+        return resposta.json["id"]
+
+    def atualiza(self, livro_id: int, **valores):
+        """ Altera o livro direto no banco, já que a API não altera o nome
+        """
+        session = Session()
+        session.execute(update(Livro).where(Livro.id == livro_id).values(**valores))
+        session.commit()
+        Session.remove()
+
+    def verifica(self, esperado: dict):
+        """ Compara os contadores com os recalculados, com o esperado (nome ->
+            (total, disponíveis)) e com a listagem de /livros/disponibilidade
+        """
+        session = Session()
+        contadores = [tuple(linha) for linha in session.execute(CONTADORES)]
+        recalculados = [tuple(linha) for linha in session.execute(RECALCULO)]
+        Session.remove()
+        self.assertEqual(contadores, recalculados)
+        self.assertEqual({nome: (total, disponiveis) for nome, total, disponiveis in contadores}, esperado)
+        resposta = self.client.get("/livros/disponibilidade")
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.json["titulos"], [{"nome": nome, "total": total, "disponiveis": disponiveis}
+                                                    for nome, (total, disponiveis) in sorted(esperado.items())])
+
+    def test_escritas(self):
+        a1, a2, b1 = self.adiciona("A"), self.adiciona("A"), self.adiciona("B")
+        self.verifica({"A": (2, 2), "B": (1, 1)})
+
+        self.client.put("/livro", query_string={"livro_id": a1, "usuario_nome": "Ana"})
+        self.verifica({"A": (2, 1), "B": (1, 1)})
+        # um empréstimo que falha não altera os contadores
+        self.client.put("/livro", query_string={"livro_id": a1, "usuario_nome": "Bruno"})
+        self.verifica({"A": (2, 1), "B": (1, 1)})
+
+        resposta = self.client.put("/livros/empresta", json={"emprestimos": [
+            {"livro_id": a2, "usuario_nome": "Bruno"}, {"livro_id": b1, "usuario_nome": "Bruno"},
+            {"livro_id": b1, "usuario_nome": "Ana"}]})
+        self.assertEqual([r["status"] for r in resposta.json["resultados"]], [200, 200, 409])
+        self.verifica({"A": (2, 0), "B": (1, 0)})
+
+        self.client.put("/livroDevolve", query_string={"id": a1})
+        self.verifica({"A": (2, 1), "B": (1, 0)})
+        self.client.put("/livros/devolve", json={"ids": [a2, b1, b1]})
+        self.verifica({"A": (2, 2), "B": (1, 1)})
+
+        livros = "\n".join(json.dumps({"nome": nome, "autor": "Autor", "editora": "Editora"})
+                           for nome in ("B", "C", "C"))
+        resposta = self.client.post("/livros/bulk", data=livros, content_type="application/x-ndjson")
+        self.assertEqual(resposta.json["inseridos"], 3)
+        self.verifica({"A": (2, 2), "B": (2, 2), "C": (2, 2)})
+
+        self.client.delete("/livro", query_string={"id": b1})
+        self.verifica({"A": (2, 2), "B": (1, 1), "C": (2, 2)})
+
+    def test_renomeacao(self):
+        a1, a2 = self.adiciona("A"), self.adiciona("A")
+        self.client.put("/livro", query_string={"livro_id": a1, "usuario_nome": "Ana"})
+        self.verifica({"A": (2, 1)})
+
+        # renomear a cópia emprestada a move, emprestada, para o novo título
+        self.atualiza(a1, nome="B")
+        self.verifica({"A": (1, 1), "B": (1, 0)})
+        # nome e empréstimo na mesma atualização: a cópia sai de B disponível
+        # para A e o título B, sem cópias, é removido
+        self.atualiza(a1, nome="A", emprestado_para_id=None)
+        self.verifica({"A": (2, 2)})
+        self.atualiza(a2, nome="C", emprestado_para_id=1)
+        self.verifica({"A": (1, 1), "C": (1, 0)})
+        # alterações que não mudam o nome nem a disponibilidade
+        self.atualiza(a2, autor="Outro", emprestado_para_id=2)
+        self.verifica({"A": (1, 1), "C": (1, 0)})
+
+        # um livro sem nome não é contado
+        self.atualiza(a2, nome=None)
+        self.verifica({"A": (1, 1)})
+        self.atualiza(a2, nome="A", emprestado_para_id=None)
+        self.verifica({"A": (2, 2)})
+
+    def test_remocao_de_todos(self):
+        for nome in ("A", "A", "B"):
+            self.adiciona(nome)
+        self.assertEqual(self.client.delete("/livros").status_code, 200)
+        self.verifica({})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+import unittest
+from unittest import mock
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Barrier
+
+from sqlalchemy.exc import IntegrityError
+
+from tests import limpa_banco
+from app import create_app, insere_usuario
+from escrita import EscritorEmGrupo
+from model import Session, Usuario
+from schemas import UsuarioSchema
+
+
+USUARIOS = ["Ana", "Ana", "Ana", "Bia", "Bia", "Caio", "Davi", "Davi"]
+
+
+class TestEscritaEmGrupo(unittest.TestCase):
+    """ Com GROUP_COMMIT=1, as escritas concorrentes são efetivadas juntas e
+        o erro de uma escrita desfaz apenas o seu savepoint
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = create_app()
+
+    def setUp(self):
+        limpa_banco()
+        # a janela maior junta as requisições liberadas pela barreira em poucos grupos
+        self.escritor = EscritorEmGrupo(janela=0.05)
+        patcher = mock.patch("escrita.escritor", self.escritor)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_requisicoes_concorrentes(self):
+        barreira = Barrier(len(USUARIOS) * 2)
+
+        def escreve(i: int):
+            client = self.app.test_client()
+            barreira.wait()
+            if i < len(USUARIOS):
+                return client.post("/usuario", data={"nome": USUARIOS[i], "idade": 30})
+            return client.post("/livro", data={"nome": "Livro %d" % i, "autor": "Autor", "editora": "Editora"})
+
+        with ThreadPoolExecutor(len(USUARIOS) * 2) as executor:
+            respostas = list(executor.map(escreve, range(len(USUARIOS) * 2)))
+
+        usuarios, livros = respostas[:len(USUARIOS)], respostas[len(USUARIOS):]
+        # um único usuário de cada nome é inserido, os demais recebem 409
+        self.assertEqual(sorted(r.json["nome"] for r in usuarios if r.status_code == 200), ["Ana", "Bia", "Caio", "Davi"])
+        self.assertEqual([r.status_code for r in usuarios].count(409), 4)
+        self.assertTrue(all(r.status_code == 200 for r in livros))
+        self.assertLess(self.escritor.grupos, len(respostas))
+        self.assertEqual(self.escritor.escritas, len(respostas))
+
+        # todas as escritas confirmadas estão no banco
+        client = self.app.test_client()
+        self.assertEqual(sorted(u["nome"] for u in client.get("/usuarios").json["usuarios"]),
+                         ["Ana", "Bia", "Caio", "Davi"])
+        self.assertEqual(sorted(l["id"] for l in client.get("/livros").json["livros"]),
+                         sorted(r.json["id"] for r in livros))
+
+    def test_savepoint_por_escrita(self):
+        def insere_e_falha(session, form):
+            insere_usuario(session, form)
+            raise ValueError("falha depois da inserção")
+
+        operacoes = [(insere_usuario, "Ana"), (insere_e_falha, "Bia"), (insere_usuario, "Ana"),
+                     (insere_usuario, "Caio")]
+        pedidos = [("usuario", operacao, (UsuarioSchema(nome=nome, idade=30),), Future())
+                   for operacao, nome in operacoes]
+        self.escritor.efetiva(pedidos)
+
+        futuros = [futuro for tabela, operacao, args, futuro in pedidos]
+        self.assertEqual(futuros[0].result()["nome"], "Ana")
+        self.assertIsInstance(futuros[1].exception(), ValueError)
+        self.assertIsInstance(futuros[2].exception(), IntegrityError)
+        self.assertEqual(futuros[3].result()["nome"], "Caio")
+        # só as escritas sem erro foram efetivadas
+        nomes = sorted(nome for nome, in Session().query(Usuario.nome))
+        Session.remove()
+        self.assertEqual(nomes, ["Ana", "Caio"])
+
+    def test_falha_do_grupo(self):
+        # uma falha do grupo que não é de banco ocupado chega a cada requisição como 400
+        with mock.patch("escrita.incrementa_versao", side_effect=RuntimeError("falha no grupo")):
+            resposta = self.app.test_client().post("/livro", data={"nome": "Livro", "autor": "Autor",
+                                                                   "editora": "Editora"})
+        self.assertEqual(resposta.status_code, 400)
+        self.assertEqual(resposta.json, {"mensagem": "Não foi possível salvar novo item :/"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+import unittest
+
+from tests import limpa_banco
+from app import create_app
+
+
+LISTAGENS_LIVRO = ("/livros", "/livros?limit=2", "/livros/disponibilidade")
+LISTAGENS_USUARIO = ("/usuarios",)
+
+
+class TestETagListagens(unittest.TestCase):
+    """ Cada escrita deve mudar o ETag das listagens das tabelas alteradas, e
+        só delas, para que os clientes não recebam 304 com dados antigos
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.client = create_app().test_client()
+
+    def setUp(self):
+        limpa_banco()
+        self.client.post("/usuario", data={"nome": "Ana", "idade": 30})
+        self.client.post("/usuario", data={"nome": "Bruno", "idade": 40})
+        self.ids = [self.client.post("/livro", data={"nome": "Livro %d" % i, "autor": "Autor",
+                                                     "editora": "Editora"}).json["id"] for i in range(3)]
+        self.client.put("/livro", query_string={"livro_id": self.ids[0], "usuario_nome": "Ana"})
+
+    def etags(self):
+        """ Retorna o ETag atual de cada listagem, verificando que ele gera 304
+        """
+        etags = {}
+        for url in LISTAGENS_LIVRO + LISTAGENS_USUARIO:
+            resposta = self.client.get(url)
+            self.assertEqual(resposta.status_code, 200)
+            etags[url] = resposta.headers["ETag"]
+            resposta = self.client.get(url, headers={"If-None-Match": etags[url]})
+            self.assertEqual(resposta.status_code, 304)
+            self.assertEqual(resposta.headers["ETag"], etags[url])
+        return etags
+
+    def verifica(self, escrita, alteradas: tuple, status: int = 200):
+        """ Faz a escrita e verifica que só as listagens alteradas mudaram de ETag
+        """
+        antes = self.etags()
+        resposta = escrita()
+        self.assertEqual(resposta.status_code, status)
+        for url, etag in antes.items():
+            resposta = self.client.get(url, headers={"If-None-Match": etag})
+            with self.subTest(url=url):
+                if url in alteradas:
+                    self.assertEqual(resposta.status_code, 200)
+                    self.assertNotEqual(resposta.headers["ETag"], etag)
+                else:
+                    self.assertEqual(resposta.status_code, 304)
+
+    def test_escritas_de_livro(self):
+        a, b, c = self.ids
+        escritas = {
+            "adiciona": lambda: self.client.post("/livro", data={"nome": "Novo", "autor": "Autor", "editora": "Editora"}),
+            "empresta": lambda: self.client.put("/livro", query_string={"livro_id": b, "usuario_nome": "Bruno"}),
+            "devolve": lambda: self.client.put("/livroDevolve", query_string={"id": b}),
+            "empresta em lote": lambda: self.client.put("/livros/empresta", json={"emprestimos": [
+                {"livro_id": c, "usuario_nome": "Bruno"}]}),
+            "devolve em lote": lambda: self.client.put("/livros/devolve", json={"ids": [c]}),
+            "importa em lote": lambda: self.client.post("/livros/bulk", content_type="application/x-ndjson",
+                                                        data='{"nome": "Lote", "autor": "Autor", "editora": "Editora"}'),
+            "remove": lambda: self.client.delete("/livro", query_string={"id": c}),
+            "remove todos": lambda: self.client.delete("/livros"),
+        }
+        for nome, escrita in escritas.items():
+            with self.subTest(escrita=nome):
+                self.verifica(escrita, LISTAGENS_LIVRO)
+
+    def test_escritas_de_usuario(self):
+        self.verifica(lambda: self.client.post("/usuario", data={"nome": "Carla", "idade": 20}),
+                      LISTAGENS_USUARIO)
+        # remover um usuário altera o emprestado_para dos livros emprestados a ele
+        self.verifica(lambda: self.client.delete("/usuario", query_string={"nome": "Ana"}),
+                      LISTAGENS_USUARIO + LISTAGENS_LIVRO)
+        self.verifica(lambda: self.client.delete("/usuarios"), LISTAGENS_USUARIO + LISTAGENS_LIVRO)
+
+    def test_escritas_sem_alteracao(self):
+        # escritas que falham ou não alteram nenhuma linha mantêm os ETags
+        self.verifica(lambda: self.client.post("/usuario", data={"nome": "Ana", "idade": 30}), (), 409)
+        self.verifica(lambda: self.client.delete("/usuario", query_string={"nome": "Ninguém"}), (), 404)
+        self.verifica(lambda: self.client.put("/livroDevolve", query_string={"id": self.ids[1]}), (), 404)
+        self.verifica(lambda: self.client.put("/livro", query_string={"livro_id": self.ids[0],
+                                                                      "usuario_nome": "Bruno"}), (), 409)
+
+    def test_parametros(self):
+        # o ETag depende dos parâmetros da listagem
+        completa = self.client.get("/livros").headers["ETag"]
+        pagina = self.client.get("/livros?limit=2").headers["ETag"]
+        self.assertNotEqual(completa, pagina)
+        resposta = self.client.get("/livros?limit=2", headers={"If-None-Match": completa})
+        self.assertEqual(resposta.status_code, 200)
+        # as listagens com since não usam ETag
+        resposta = self.client.get("/livros?since=2000-01-01T00:00:00")
+        self.assertEqual(resposta.status_code, 200)
+        self.assertNotIn("ETag", resposta.headers)
+
+
+if __name__ == "__main__":
+    unittest.main()
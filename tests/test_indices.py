@@ -0,0 +1,86 @@
+import unittest
+import tempfile
+
+from sqlalchemy import create_engine, select
+
+from tests import pasta_testes
+from model import engine, init_db, Livro
+from model.migracoes import aplica_migracoes, MIGRACOES
+
+
+# esquema das tabelas antes dos índices e das migrações
+ESQUEMA_ORIGINAL = (
+    """CREATE TABLE usuario (
+        id INTEGER NOT NULL,
+        nome VARCHAR(140),
+        idade INTEGER,
+        data_insercao DATETIME,
+        PRIMARY KEY (id),
+        UNIQUE (nome)
+    )""",
+    """CREATE TABLE livro (
+        id INTEGER NOT NULL,
+        nome VARCHAR(140),
+        autor VARCHAR(140),
+        editora VARCHAR(140),
+        emprestado_para_id INTEGER,
+        data_insercao DATETIME,
+        PRIMARY KEY (id),
+        FOREIGN KEY(emprestado_para_id) REFERENCES usuario (id)
+    )""",
+)
+
+# consultas principais da tabela livro e o índice que cada uma deve usar
+CONSULTAS = (
+    # get_livro: busca por nome, com o usuário do empréstimo carregado via JOIN
+    (select(Livro).where(Livro.nome == "Livro"), "ix_livro_nome"),
+    (select(Livro).where(Livro.autor == "Autor"), "ix_livro_autor"),
+    # livros emprestados para um usuário
+    (select(Livro).where(Livro.emprestado_para_id == 1), "ix_livro_emprestado_para_id"),
+)
+
+
+def plano(conn, consulta):
+    """ Retorna as linhas do EXPLAIN QUERY PLAN da consulta
+    """
+    sql = consulta.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True})
+    return [linha[-1] for linha in conn.exec_driver_sql("EXPLAIN QUERY PLAN %s" % sql)]
+
+
+class TestIndicesLivro(unittest.TestCase):
+    """ As buscas por nome, autor e empréstimo devem usar os índices da
+        tabela livro, tanto em um banco novo quanto em um banco migrado
+    """
+
+    def verifica_planos(self, engine_teste):
+        with engine_teste.connect() as conn:
+            for consulta, indice in CONSULTAS:
+                with self.subTest(indice=indice):
+                    linhas = plano(conn, consulta)
+                    self.assertTrue(any(linha.startswith("SEARCH livro USING INDEX %s " % indice)
+                                        for linha in linhas), linhas)
+
+    def test_banco_novo(self):
+        init_db()
+        self.verifica_planos(engine)
+
+    def test_banco_migrado(self):
+        arquivo = tempfile.NamedTemporaryFile(dir=pasta_testes, suffix=".sqlite3", delete=False).name
+        engine_antigo = create_engine("sqlite:///%s" % arquivo)
+        try:
+            with engine_antigo.begin() as conn:
+                for tabela in ESQUEMA_ORIGINAL:
+                    conn.exec_driver_sql(tabela)
+                self.assertEqual(conn.exec_driver_sql("PRAGMA user_version").scalar(), 0)
+
+            aplica_migracoes(engine_antigo)
+
+            with engine_antigo.connect() as conn:
+                self.assertEqual(conn.exec_driver_sql("PRAGMA user_version").scalar(), len(MIGRACOES))
+            self.verifica_planos(engine_antigo)
+        finally:
+            engine_antigo.dispose()
+
+
+if __name__ == "__main__":
+    unittest.main()
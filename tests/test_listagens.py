@@ -0,0 +1,107 @@
+import unittest
+
+from sqlalchemy import event
+
+from tests import limpa_banco
+from app import create_app
+from model import engine
+from cache import cache_livros
+from schemas.listagem import LIMITE_PAGINA
+
+
+class TestConsultasListagens(unittest.TestCase):
+    """ A quantidade de consultas das listagens de livros não deve crescer com
+        a quantidade de livros emprestados
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.client = create_app().test_client()
+
+    def setUp(self):
+        limpa_banco()
+        resposta = self.client.post("/usuario", data={"nome": "Leitor", "idade": 30})
+        self.assertEqual(resposta.status_code, 200)
+
+    def empresta(self, quantidade: int):
+        """ Adiciona e empresta mais quantidade livros de mesmo nome
+        """
+        for _ in range(quantidade):
+            resposta = self.client.post("/livro", data={"nome": "Livro", "autor": "Autor", "editora": "Editora"})
+            self.assertEqual(resposta.status_code, 200)
+            resposta = self.client.put("/livro?livro_id=%d&usuario_nome=Leitor" % resposta.json["id"])
+            self.assertEqual(resposta.status_code, 200)
+
+    def consultas(self, url: str):
+        """ Faz a requisição e retorna a resposta e a quantidade de consultas
+            SQL executadas por ela
+        """
+        executadas = []
+
+        def conta(conn, cursor, statement, parameters, context, executemany):
+            executadas.append(statement)
+
+        cache_livros.limpa()
+        event.listen(engine, "before_cursor_execute", conta)
+        try:
+            resposta = self.client.get(url)
+        finally:
+            event.remove(engine, "before_cursor_execute", conta)
+        self.assertEqual(resposta.status_code, 200)
+        return resposta, len(executadas)
+
+    def test_consultas_nao_crescem_com_emprestimos(self):
+        urls = ("/livros", "/livro?nome=Livro")
+        self.empresta(10)
+        poucos = {}
+        for url in urls:
+            resposta, poucos[url] = self.consultas(url)
+            self.assertEqual(len(resposta.json["livros"]), 10)
+
+        self.empresta(190)
+        for url in urls:
+            with self.subTest(url=url):
+                resposta, muitos = self.consultas(url)
+                self.assertEqual(len(resposta.json["livros"]), 200)
+                self.assertTrue(all(livro["emprestado_para"] == "Leitor" for livro in resposta.json["livros"]))
+                self.assertEqual(poucos[url], muitos)
+
+
+class TestPaginacao(unittest.TestCase):
+    """ As páginas devem ter de 1 a LIMITE_PAGINA itens e percorrer toda a listagem
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.client = create_app().test_client()
+
+    def setUp(self):
+        limpa_banco()
+
+    def test_limit_invalido(self):
+        for url in ("/livros", "/usuarios", "/livros/disponibilidade"):
+            for limit in (0, -1, LIMITE_PAGINA + 1):
+                with self.subTest(url=url, limit=limit):
+                    resposta = self.client.get(url, query_string={"limit": limit})
+                    self.assertEqual(resposta.status_code, 422)
+
+    def test_percorre_paginas(self):
+        ids = [self.client.post("/livro", data={"nome": "Livro %d" % i, "autor": "Autor",
+                                                "editora": "Editora"}).json["id"] for i in range(5)]
+        recebidos, after_id = [], None
+        while True:
+            parametros = {"limit": 2}
+            if after_id is not None:
+                parametros["after_id"] = after_id
+            resposta = self.client.get("/livros", query_string=parametros)
+            self.assertEqual(resposta.status_code, 200)
+            self.assertLessEqual(len(resposta.json["livros"]), 2)
+            recebidos += [livro["id"] for livro in resposta.json["livros"]]
+            after_id = resposta.json["proximo"]
+            if after_id is None:
+                break
+        self.assertEqual(recebidos, ids)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+from threading import Thread, current_thread
+
+from sqlalchemy import event
+
+from tests import limpa_banco
+from app import create_app
+from model import engine
+
+
+class TestOperacoesEmLote(unittest.TestCase):
+    """ Os empréstimos e as devoluções em lote devem informar o resultado de
+        cada livro, sem desfazer as alterações feitas por outras requisições
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = create_app()
+        cls.client = cls.app.test_client()
+
+    def setUp(self):
+        limpa_banco()
+        for nome in ("Ana", "Bruno"):
+            self.assertEqual(self.client.post("/usuario", data={"nome": nome, "idade": 30}).status_code, 200)
+        self.ids = [self.client.post("/livro", data={"nome": "Livro %d" % i, "autor": "Autor",
+                                                     "editora": "Editora"}).json["id"] for i in range(3)]
+
+    def emprestados(self):
+        return {livro["id"]: livro["emprestado_para"] for livro in self.client.get("/livros").json["livros"]}
+
+    def test_empresta(self):
+        a, b, c = self.ids
+        emprestimos = [{"livro_id": a, "usuario_nome": "Ana"}, {"livro_id": a, "usuario_nome": "Bruno"},
+                       {"livro_id": b, "usuario_nome": "Carla"}, {"livro_id": 999999, "usuario_nome": "Ana"},
+                       {"livro_id": c, "usuario_nome": "Bruno"}]
+        resposta = self.client.put("/livros/empresta", json={"emprestimos": emprestimos})
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual([r["status"] for r in resposta.json["resultados"]], [200, 409, 404, 404, 200])
+        self.assertEqual(self.emprestados(), {a: "Ana", b: None, c: "Bruno"})
+
+    def test_devolve(self):
+        a, b, c = self.ids
+        resposta = self.client.put("/livros/empresta", json={"emprestimos": [
+            {"livro_id": a, "usuario_nome": "Ana"}, {"livro_id": b, "usuario_nome": "Ana"}]})
+        self.assertEqual([r["status"] for r in resposta.json["resultados"]], [200, 200])
+
+        def devolve_e_empresta():
+            # a é devolvido e emprestado para outro usuário por outras requisições
+            client = self.app.test_client()
+            self.assertEqual(client.put("/livroDevolve", query_string={"id": a}).status_code, 200)
+            resposta = client.put("/livro", query_string={"livro_id": a, "usuario_nome": "Bruno"})
+            self.assertEqual(resposta.status_code, 200)
+
+        disparado = []
+
+        def antes_da_devolucao(conn, cursor, statement, parameters, context, executemany):
+            # entre a leitura dos livros do lote e o UPDATE condicional
+            if statement.startswith("UPDATE livro") and current_thread() is principal and not disparado:
+                disparado.append(True)
+                thread = Thread(target=devolve_e_empresta)
+                thread.start()
+                thread.join()
+
+        principal = current_thread()
+        event.listen(engine, "before_cursor_execute", antes_da_devolucao)
+        try:
+            resposta = self.client.put("/livros/devolve", json={"ids": [a, b, b, c, 999999]})
+        finally:
+            event.remove(engine, "before_cursor_execute", antes_da_devolucao)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertTrue(disparado)
+        # a foi emprestado para outro usuário depois da leitura, a repetição de b
+        # já foi devolvida no lote e c não estava emprestado
+        self.assertEqual([r["status"] for r in resposta.json["resultados"]], [409, 200, 404, 404, 404])
+        self.assertEqual(self.emprestados(), {a: "Bruno", b: None, c: None})
+
+
+if __name__ == "__main__":
+    unittest.main()
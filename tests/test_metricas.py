@@ -0,0 +1,28 @@
+import unittest
+
+from tests import limpa_banco
+from app import create_app
+
+
+class TestContagemConsultas(unittest.TestCase):
+    """ As consultas que falham também devem ser contabilizadas
+    """
+
+    def test_consulta_com_erro(self):
+        client = create_app().test_client()
+        limpa_banco()
+        resposta = client.post("/usuario", data={"nome": "Leitor", "idade": 30})
+        self.assertEqual(resposta.status_code, 200)
+        for _ in range(3):
+            # o INSERT do usuário duplicado falha com IntegrityError
+            resposta = client.post("/usuario", data={"nome": "Leitor", "idade": 30})
+            self.assertEqual(resposta.status_code, 409)
+            self.assertGreaterEqual(int(resposta.headers["X-Query-Count"]), 1)
+
+        resposta = client.get("/usuario", query_string={"nome": "Outro"})
+        self.assertEqual(resposta.status_code, 404)
+        self.assertEqual(resposta.headers["X-Query-Count"], "1")
+
+
+if __name__ == "__main__":
+    unittest.main()